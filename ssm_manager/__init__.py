@@ -1,18 +1,110 @@
 """
 Initialization module for SSM Manager.
+
+Importing the package only defines the paths. The shared objects, like the
+preferences, cache and managers, are created on first access through the
+module __getattr__, so the entry point can check the lock without importing
+Flask, boto3 and the other heavy dependencies.
 """
 
 # pylint: disable=invalid-name
 
 import os
 import sys
-import platform
+import time
+import types
 import logging
-from ssm_manager.logger import CustomLogger
-from ssm_manager.cache import Cache
-from ssm_manager.deps import DependencyManager
-from ssm_manager.manager import AWSManager
-from ssm_manager.preferences import PreferencesHandler
+import platform
+import importlib
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ssm_manager.cache import Cache
+    from ssm_manager.config import AwsConfigManager
+    from ssm_manager.credentials import CredentialMonitor
+    from ssm_manager.deps import DependencyManager
+    from ssm_manager.events import EventBus
+    from ssm_manager.jobs import JobManager
+    from ssm_manager.journal import ConnectionJournal
+    from ssm_manager.logger import CustomLogger
+    from ssm_manager.manager import AWSManager
+    from ssm_manager.output import OutputManager
+    from ssm_manager.ports import PortAllocator
+    from ssm_manager.preferences import PreferencesHandler
+    from ssm_manager.proxy import ProxyManager
+    from ssm_manager.registry import ConnectionRegistry
+    from ssm_manager.sso import SSOManager
+    from ssm_manager.supervisor import Supervisor
+    from ssm_manager.utils import ConnectionScanner
+    from ssm_manager.watcher import FileWatcher
+
+# Shared objects, created on first access by __getattr__
+logger: "CustomLogger"
+preferences: "PreferencesHandler"
+cache: "Cache"
+journal: "ConnectionJournal"
+registry: "ConnectionRegistry"
+deps: "DependencyManager"
+aws_manager: "AWSManager"
+sso_manager: "SSOManager"
+aws_config: "AwsConfigManager"
+session_output: "OutputManager"
+port_allocator: "PortAllocator"
+events: "EventBus"
+jobs: "JobManager"
+credential_monitor: "CredentialMonitor"
+proxies: "ProxyManager"
+supervisor: "Supervisor"
+scanner: "ConnectionScanner"
+watcher: "FileWatcher"
+port: int
+
+# Define startup profile
+started = time.perf_counter()
+startup_phases = []
+_open_phases = []
+
+
+@contextmanager
+def startup_phase(name: str):
+    """
+    Record the start and duration of a startup phase, nested phases are
+    recorded with their depth
+    Args:
+        name (str): The phase name
+    """
+    phase = {
+        "name": name,
+        "depth": len(_open_phases),
+        "start": time.perf_counter() - started,
+        "duration": None,
+    }
+    startup_phases.append(phase)
+    _open_phases.append(phase)
+    try:
+        yield phase
+    finally:
+        _open_phases.pop()
+        phase["duration"] = time.perf_counter() - started - phase["start"]
+
+
+def startup_profile() -> str:
+    """
+    Format the recorded startup phases, relative to the package import
+    Returns: A table of the phases in the order they started
+    """
+    lines = [f"{'start':>10} {'duration':>10}  phase"]
+    for phase in startup_phases:
+        duration = phase["duration"] or 0
+        indent = "  " * phase["depth"]
+        lines.append(
+            f"{phase['start'] * 1000:8.1f}ms {duration * 1000:8.1f}ms  "
+            f"{indent}{phase['name']}"
+        )
+    return "\n".join(lines)
+
 
 # Define application name
 app_name = "SSM Manager"
@@ -37,6 +129,9 @@ lock_file = os.path.join(home_dir, f".{data_dir}", "ssm_manager.lock")
 pid_file = os.path.join(home_dir, f".{data_dir}", "ssm_manager.pid")
 temp_dir = os.path.join(home_dir, f".{data_dir}", "temp")
 log_file = os.path.join(home_dir, f".{data_dir}", "ssm_manager.log")
+session_log_dir = os.path.join(home_dir, f".{data_dir}", "sessions")
+ports_file = os.path.join(home_dir, f".{data_dir}", "ports.json")
+journal_file = os.path.join(home_dir, f".{data_dir}", "connections.jsonl")
 hosts_file = os.path.join("/", "etc", "hosts")
 
 if system == "Windows":
@@ -48,40 +143,294 @@ if system == "Windows":
     pid_file = os.path.join(home_dir, "AppData", "Local", data_dir, "ssm_manager.pid")
     temp_dir = os.path.join(home_dir, "AppData", "Local", data_dir, "temp")
     log_file = os.path.join(home_dir, "AppData", "Local", data_dir, "ssm_manager.log")
+    session_log_dir = os.path.join(home_dir, "AppData", "Local", data_dir, "sessions")
+    ports_file = os.path.join(home_dir, "AppData", "Local", data_dir, "ports.json")
+    journal_file = os.path.join(
+        home_dir, "AppData", "Local", data_dir, "connections.jsonl"
+    )
     hosts_file = os.path.join("C:\\", "Windows", "System32", "drivers", "etc", "hosts")
 
-# Make sure directories exist
-os.makedirs(os.path.dirname(preferences_file), exist_ok=True)
-os.makedirs(cache_dir, exist_ok=True)
-os.makedirs(temp_dir, exist_ok=True)
-os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-# Configure detailed logging
-logging.setLoggerClass(CustomLogger)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s:%(name)s - %(message)s",
-    handlers=[logging.FileHandler(log_file, mode="w"), logging.StreamHandler()],
-)
-
-# Configure logger
-logger = logging.getLogger("ssm_manager")
-
 # Define version
 with open(version_file, "r", encoding="utf-8") as vfile:
     version = vfile.read().strip()
 
-# Define cache
-cache = Cache(cache_dir=cache_dir)
 
-# Define dependencies
-deps = DependencyManager(system=system, arch=arch)
+def _import(module: str, name: str):
+    """
+    Get a class from a submodule, recording the time to import it
+    """
+    if module not in sys.modules:
+        with startup_phase(f"import {module}"):
+            importlib.import_module(module)
+    return getattr(sys.modules[module], name)
+
+
+def _create_logger():
+    """
+    Configure detailed logging
+    """
+    CustomLogger = _import("ssm_manager.logger", "CustomLogger")
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    logging.setLoggerClass(CustomLogger)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s:%(name)s - %(message)s",
+        handlers=[logging.FileHandler(log_file, mode="w"), logging.StreamHandler()],
+    )
+    return logging.getLogger("ssm_manager")
+
 
-# Define AWS Manager
-aws_manager = AWSManager()
+def _create_preferences():
+    """
+    Setup preferences
+    """
+    PreferencesHandler = _import("ssm_manager.preferences", "PreferencesHandler")
+    os.makedirs(os.path.dirname(preferences_file), exist_ok=True)
+    return PreferencesHandler(config_file=preferences_file)
 
-# Setup preferences
-preferences = PreferencesHandler(config_file=preferences_file)
 
-# Define server port
-port = preferences.preferences.get("server", {}).get("port", 5000)
+def _create_cache():
+    """
+    Define cache
+    """
+    Cache = _import("ssm_manager.cache", "Cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_preferences = __getattr__("preferences").preferences.get("cache", {})
+    return Cache(
+        cache_dir=cache_dir,
+        backend=cache_preferences.get("backend", "filesystem"),
+        namespaces=cache_preferences.get("namespaces"),
+    )
+
+
+def _create_journal():
+    """
+    Define connection journal
+    """
+    ConnectionJournal = _import("ssm_manager.journal", "ConnectionJournal")
+    return ConnectionJournal(journal_file=journal_file)
+
+
+def _create_registry():
+    """
+    Define active connection registry
+    """
+    ConnectionRegistry = _import("ssm_manager.registry", "ConnectionRegistry")
+    return ConnectionRegistry(
+        cache=__getattr__("cache").namespace("connections"),
+        journal=__getattr__("journal"),
+    )
+
+
+def _create_deps():
+    """
+    Define dependencies
+    """
+    DependencyManager = _import("ssm_manager.deps", "DependencyManager")
+    return DependencyManager(
+        system=system, arch=arch, cache=__getattr__("cache").namespace("dependencies")
+    )
+
+
+def _create_aws_manager():
+    """
+    Define AWS Manager
+    """
+    return _import("ssm_manager.manager", "AWSManager")()
+
+
+def _create_sso_manager():
+    """
+    Define SSO Manager
+    """
+    return _import("ssm_manager.sso", "SSOManager")(system=system)
+
+
+def _create_aws_config():
+    """
+    Define AWS config file manager
+    """
+    return _import("ssm_manager.config", "AwsConfigManager")()
+
+
+def _create_session_output():
+    """
+    Define session output
+    """
+    OutputManager = _import("ssm_manager.output", "OutputManager")
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(session_log_dir, exist_ok=True)
+    return OutputManager(
+        log_dir=session_log_dir, preferences=__getattr__("preferences")
+    )
+
+
+def _create_port_allocator():
+    """
+    Define local port allocator
+    """
+    PortAllocator = _import("ssm_manager.ports", "PortAllocator")
+    StickyPorts = _import("ssm_manager.ports", "StickyPorts")
+    return PortAllocator(
+        preferences=__getattr__("preferences"),
+        sticky=StickyPorts(leases_file=ports_file),
+    )
+
+
+def _create_events():
+    """
+    Define event bus
+    """
+    return _import("ssm_manager.events", "EventBus")()
+
+
+def _create_jobs():
+    """
+    Define background jobs
+    """
+    JobManager = _import("ssm_manager.jobs", "JobManager")
+    return JobManager(events=__getattr__("events"))
+
+
+def _create_credential_monitor():
+    """
+    Define credential monitor
+    """
+    CredentialMonitor = _import("ssm_manager.credentials", "CredentialMonitor")
+    return CredentialMonitor(
+        aws_manager=__getattr__("aws_manager"),
+        sso=__getattr__("sso_manager"),
+        events=__getattr__("events"),
+    )
+
+
+def _create_proxies():
+    """
+    Define tunnel proxies
+    """
+    ProxyManager = _import("ssm_manager.proxy", "ProxyManager")
+    return ProxyManager(preferences=__getattr__("preferences"))
+
+
+def _create_supervisor():
+    """
+    Define session supervisor
+    """
+    Supervisor = _import("ssm_manager.supervisor", "Supervisor")
+    return Supervisor(
+        registry=__getattr__("registry"),
+        events=__getattr__("events"),
+        output=__getattr__("session_output"),
+        ports=__getattr__("port_allocator"),
+        proxies=__getattr__("proxies"),
+        preferences=__getattr__("preferences"),
+        journal=__getattr__("journal"),
+        jobs=__getattr__("jobs"),
+    )
+
+
+def _create_scanner():
+    """
+    Define connection scanner
+    """
+    ConnectionScanner = _import("ssm_manager.utils", "ConnectionScanner")
+    return ConnectionScanner(
+        __getattr__("registry"),
+        ports=__getattr__("port_allocator"),
+        supervisor=__getattr__("supervisor"),
+        proxies=__getattr__("proxies"),
+    )
+
+
+def _create_watcher():
+    """
+    Define file watcher, external edits invalidate the in-memory copies
+    """
+    FileWatcher = _import("ssm_manager.watcher", "FileWatcher")
+    config = __getattr__("aws_config")
+    file_watcher = FileWatcher()
+    file_watcher.watch(preferences_file, __getattr__("preferences").reload_preferences)
+    file_watcher.watch(config.config_path, config.invalidate)
+    file_watcher.watch(config.config_path, __getattr__("sso_manager").invalidate)
+    file_watcher.watch(
+        config.config_path, __getattr__("cache").namespace("profiles").flush
+    )
+    return file_watcher
+
+
+def _create_port():
+    """
+    Define server port
+    """
+    return __getattr__("preferences").preferences.get("server", {}).get("port", 5000)
+
+
+_FACTORIES = {
+    "logger": _create_logger,
+    "preferences": _create_preferences,
+    "cache": _create_cache,
+    "journal": _create_journal,
+    "registry": _create_registry,
+    "deps": _create_deps,
+    "aws_manager": _create_aws_manager,
+    "sso_manager": _create_sso_manager,
+    "aws_config": _create_aws_config,
+    "session_output": _create_session_output,
+    "port_allocator": _create_port_allocator,
+    "events": _create_events,
+    "jobs": _create_jobs,
+    "credential_monitor": _create_credential_monitor,
+    "proxies": _create_proxies,
+    "supervisor": _create_supervisor,
+    "scanner": _create_scanner,
+    "watcher": _create_watcher,
+    "port": _create_port,
+}
+_lock = threading.RLock()
+
+
+def __getattr__(name: str):
+    """
+    Create a shared object on first access, logging is configured first
+    """
+    factory = _FACTORIES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        if name not in globals():
+            if name != "logger":
+                __getattr__("logger")
+            with startup_phase(f"init {name}"):
+                globals()[name] = factory()
+        return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_FACTORIES))
+
+
+class _Package(types.ModuleType):
+    """
+    Importing a submodule sets it as an attribute of the package, keep the
+    submodules named like a shared object, like ssm_manager.cache, from
+    hiding it
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __setattr__(self, name, value):
+        if name in _FACTORIES and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+startup_phases.insert(
+    0,
+    {
+        "name": "import ssm_manager",
+        "depth": 0,
+        "start": 0.0,
+        "duration": time.perf_counter() - started,
+    },
+)
@@ -5,47 +5,66 @@ Main entry point for the application
 import os
 import sys
 import signal
-import tkinter as tk
-from tkinter import messagebox
-from filelock import FileLock, Timeout
-from ssm_manager import logger, app_name, port, lock_file, pid_file
-from ssm_manager.client import ServerThread, TrayIcon
-from ssm_manager.utils import open_browser
+import ssm_manager
+from ssm_manager import app_name, lock_file, pid_file, startup_phase, startup_profile
 
-# pylint: disable=logging-fstring-interpolation
+# pylint: disable=logging-fstring-interpolation, import-outside-toplevel, invalid-name
 
-server = ServerThread()
-tray = TrayIcon("static/favicon.ico", server_port=port)
+# The server and tray icon are created once the lock is held
+server = None
+tray = None
 
 
 def start(debug: bool, use_reloader: bool) -> None:
     """
     Start the server
     """
-    server.port = port
+    server.port = ssm_manager.port
     server.debug = debug
     server.use_reloader = use_reloader
     server.run()
 
 
+def terminate_sessions() -> None:
+    """
+    Terminate all sessions on exit when enabled in preferences
+    """
+    preferences = ssm_manager.preferences.preferences
+    if preferences.get("sessions", {}).get("terminate_on_exit"):
+        from ssm_manager.app import terminate_connections
+
+        terminated = terminate_connections()
+        ssm_manager.logger.info(f"Terminated {len(terminated)} connections on exit")
+
+
 def cleanup(*args) -> None:
     """
     Cleanup function to remove PID and lock files
     """
     # pylint: disable=unused-argument
+    if server is not None:
+        terminate_sessions()
+        ssm_manager.registry.flush()
+        ssm_manager.preferences.flush()
     if os.path.exists(pid_file):
         os.remove(pid_file)
     if os.path.exists(lock_file):
         os.remove(lock_file)
-    server.stop()
-    tray.stop()
-    logger.info("Exiting...")
+    if tray is not None:
+        tray.stop()
+    if server is not None:
+        server.stop()
+        ssm_manager.logger.info("Exiting...")
 
 
 def show_window(pid: int) -> None:
     """
     Displays a dialog box to manage the running application instance.
     """
+    # pylint: disable=too-many-locals
+    import tkinter as tk
+    from tkinter import messagebox
+
     window_width = 600
     window_height = 100
 
@@ -60,6 +79,8 @@ def show_window(pid: int) -> None:
     label.pack(pady=10)
 
     def open_app():
+        from ssm_manager.utils import open_browser
+
         open_browser(url="http://127.0.0.1:5000")
         exit_window(root)
 
@@ -98,9 +119,11 @@ def show_window(pid: int) -> None:
     exit_window(root)
 
 
-def exit_window(window: tk.Toplevel) -> None:
+def exit_window(window) -> None:
     """
     Exit the dialog and application
+    Args:
+        window (tk.Toplevel): The dialog window
     """
     window.destroy()
     sys.exit(0)
@@ -110,31 +133,59 @@ def main() -> None:
     """
     Main function to start the application
     """
+    global server, tray  # pylint: disable=global-statement
+
     signal.signal(signal.SIGTERM, cleanup)
     signal.signal(signal.SIGINT, cleanup)
 
     # Check if the app is being run by the reloader
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        logger.info("Reloader process detected. Starting server.")
+        ssm_manager.logger.info("Reloader process detected. Starting server.")
         with open(pid_file, "w", encoding="utf-8") as f:
             f.write(str(os.getpid()))
+        from ssm_manager.client import ServerThread
+
+        server = ServerThread()
+        ssm_manager.watcher.start()
         start(debug=True, use_reloader=True)
         return
 
-    api_only = False
-    if len(sys.argv) > 1 and sys.argv[1] == "--api":
-        api_only = True
+    api_only = "--api" in sys.argv[1:]
+    profile = "--startup-profile" in sys.argv[1:]
 
-    lock = FileLock(lock_file, timeout=0)
-    try:
-        with lock:
-            with open(pid_file, "w", encoding="utf-8") as f:
-                f.write(str(os.getpid()))
-            if not api_only:
-                tray.run()
-            else:
-                start(debug=api_only, use_reloader=api_only)
-    except Timeout:
+    with startup_phase("lock check"):
+        from filelock import FileLock, Timeout
+
+        os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+        lock = FileLock(lock_file, timeout=0)
+        try:
+            lock.acquire()
+        except Timeout:
+            lock = None
+
+    if lock is None:
         with open(pid_file, "r", encoding="utf-8") as f:
             pid = f.read().strip()
+        if profile:
+            print(startup_profile())
         show_window(int(pid))
+        return
+
+    try:
+        with open(pid_file, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        with startup_phase("start"):
+            from ssm_manager.client import ServerThread, TrayIcon
+
+            server = ServerThread()
+            tray = TrayIcon("static/favicon.ico", server_port=ssm_manager.port)
+            ssm_manager.watcher.start()
+        if profile:
+            print(startup_profile())
+        if not api_only:
+            tray.run()
+        else:
+            start(debug=api_only, use_reloader=api_only)
+        terminate_sessions()
+    finally:
+        lock.release()
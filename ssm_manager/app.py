@@ -5,36 +5,56 @@ SSM Manager
 import os
 import re
 import time
+import threading
 import subprocess
-import psutil
 import keyring
-from flask import Flask, jsonify, request, render_template, send_file
+from pydantic import ValidationError
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    request,
+    render_template,
+    send_file,
+    stream_with_context,
+)
 from ssm_manager import (
     app_name,
     system,
     hosts_file,
     logger,
     cache,
+    aws_config,
     deps,
     aws_manager,
+    sso_manager,
+    credential_monitor,
     preferences,
+    session_output,
+    port_allocator,
+    registry,
+    scanner,
+    events,
+    jobs,
+    journal,
+    supervisor,
+    proxies,
 )
-from ssm_manager.config import AwsConfigManager
 from ssm_manager.utils import (
     Instance,
     Connection,
     ConnectionState,
-    ConnectionScanner,
     AWSProfile,
     SSMCommand,
-    SSOCommand,
     RDPCommand,
     CmdKeyAddCommand,
     CmdKeyDeleteCommand,
     HostsFileCommand,
-    FreePort,
+    Tunnel,
     run_cmd,
+    kill_process_tree,
     resolve_hostname,
+    wait_for_port,
 )
 
 # pylint: disable=logging-fstring-interpolation, consider-using-with
@@ -78,7 +98,10 @@ def get_profiles():
     Endpoint to get available AWS profiles
     Returns: JSON list of profile names
     """
-    profiles = aws_manager.get_profiles()
+    profiles = cache.namespace("profiles").get("all")
+    if profiles is None:
+        profiles = aws_manager.get_profiles()
+        cache.namespace("profiles").set("all", profiles)
     logger.info(f"AWS profiles: {len(profiles)} found.")
     return jsonify(profiles)
 
@@ -89,7 +112,6 @@ def get_regions():
     Endpoint to get available AWS regions
     Returns: JSON list of region names
     """
-    preferences.reload_preferences()
     regions = preferences.get_regions()
     if not regions:
         regions = aws_manager.get_regions()
@@ -108,13 +130,22 @@ def get_all_regions():
     return jsonify(regions)
 
 
+def config_changed() -> None:
+    """
+    Invalidate what was read from the AWS config file after changing it,
+    without waiting for the file watcher
+    """
+    sso_manager.invalidate()
+    cache.namespace("profiles").flush()
+
+
 @app.route("/api/config/sessions")
 def get_config_sessions():
     """
     Endpoint to get AWS configuration sessions
     Returns: JSON list of AWS profiles from the configuration
     """
-    config = AwsConfigManager()
+    config = aws_config
     sessions = config.get_sessions()
     logger.info(f"Sessions: {len(sessions)} found.")
     return jsonify(sessions)
@@ -134,7 +165,7 @@ def add_config_session():
         if not data.get(field, None):
             return logger.failed(f"Missing required field: {field}", 400)
 
-    config = AwsConfigManager()
+    config = aws_config
     config.add_session(
         name=data.get("name"),
         start_url=data.get("sso_start_url"),
@@ -147,6 +178,7 @@ def add_config_session():
     )
     if not session_exists:
         return logger.failed(f"Failed to add session: {data.get('name')}")
+    config_changed()
 
     return logger.success(f"Session added successfully: {data.get('name')}")
 
@@ -159,13 +191,14 @@ def delete_config_session(session_name):
         session_name (str): Name of the session to delete
     Returns: JSON response with status
     """
-    config = AwsConfigManager()
+    config = aws_config
 
     session_exists = any(data["name"] == session_name for data in config.get_sessions())
     if not session_exists:
         return logger.failed(f"Session '{session_name}' does not exist.", 404)
 
     config.delete_session(name=session_name)
+    config_changed()
 
     session_exists = any(data["name"] == session_name for data in config.get_sessions())
     if session_exists:
@@ -196,7 +229,7 @@ def add_config_profile():
         if not data.get(field, None):
             logger.failed(f"Missing required field: {field}", 400)
 
-    config = AwsConfigManager()
+    config = aws_config
     config.add_profile(
         name=profile_name,
         region=data.get("region", None),
@@ -211,6 +244,7 @@ def add_config_profile():
     )
     if not profile_exists:
         return logger.failed(f"Failed to add profile: {profile_name}")
+    config_changed()
 
     return logger.success(f"Profile added successfully: {profile_name}")
 
@@ -223,7 +257,7 @@ def delete_config_profile(profile_name):
         profile_name (str): Name of the profile to delete
     Returns: JSON response with status
     """
-    config = AwsConfigManager()
+    config = aws_config
     profile_name = str(profile_name)
 
     profile_exists = any(
@@ -233,6 +267,7 @@ def delete_config_profile(profile_name):
         return logger.failed(f"Profile '{profile_name}' does not exist.", 404)
 
     config.delete_profile(profile_name)
+    config_changed()
 
     profile_exists = any(
         data["name"] == profile_name for data in aws_manager.get_profiles()
@@ -243,6 +278,167 @@ def delete_config_profile(profile_name):
     return logger.success(f"Profile deleted successfully: {profile_name}")
 
 
+@app.route("/api/config/profiles", methods=["POST"])
+def add_config_profiles():
+    """
+    Endpoint to add or update several AWS configuration profiles in one write
+    Body: {"profiles": [{"name": ..., "region": ..., "sso_session": ...}]}
+    Returns: JSON response with the added profile names and the skipped ones
+        without recognised properties
+    """
+    try:
+        profiles = (request.get_json(silent=True) or {}).get("profiles")
+        if not isinstance(profiles, list) or not profiles:
+            return logger.failed("Missing required field: profiles", 400)
+        invalid = [p for p in profiles if not isinstance(p, dict) or not p.get("name")]
+        if invalid:
+            return logger.failed(f"Profiles without a name: {len(invalid)}", 400)
+
+        skipped = [
+            p["name"] for p in profiles if not aws_config.recognised_properties(p)
+        ]
+        if len(skipped) == len(profiles):
+            return logger.failed("Profiles without recognised properties", 400)
+
+        added = aws_config.add_profiles(profiles)
+        config_changed()
+        if not added:
+            return logger.failed("Failed to add profiles")
+        logger.info(f"Added {len(added)} profiles, skipped {len(skipped)}")
+        return jsonify({"status": "success", "added": added, "skipped": skipped})
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error adding profiles", 500)
+
+
+@app.route("/api/config/profiles", methods=["DELETE"])
+def delete_config_profiles():
+    """
+    Endpoint to delete several AWS configuration profiles in one write
+    Body: {"names": ["profile-a", "profile-b"]}
+    Returns: JSON response with the deleted and missing profile names
+    """
+    try:
+        names = (request.get_json(silent=True) or {}).get("names")
+        if not isinstance(names, list) or not names:
+            return logger.failed("Missing required field: names", 400)
+
+        names = [str(name) for name in names]
+        deleted = aws_config.delete_profiles(names)
+        config_changed()
+        missing = [name for name in names if name not in deleted]
+        logger.info(f"Deleted {len(deleted)} profiles")
+        return jsonify({"status": "success", "deleted": deleted, "missing": missing})
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error deleting profiles", 500)
+
+
+def generate_profiles(
+    sso_session: dict,
+    template: str,
+    region: str,
+    output: str = "json",
+    overwrite: bool = False,
+    job=None,
+) -> dict:
+    """
+    Generate a profile for every account and role of an SSO session
+    Args:
+        sso_session (dict): The SSO session from the config file
+        template (str): The profile name template
+        region (str): The region of the generated profiles
+        output (str): The output format of the generated profiles
+        overwrite (bool): Replace existing profiles with the same name
+        job (Job): The job reporting progress
+    Returns: The added profile names and the skipped profiles
+    """
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    access = sso_manager.list_access(
+        sso_session["name"], sso_session.get("sso_region"), job=job
+    )
+    existing = set(aws_config.get_profile_names())
+    profiles, skipped = {}, []
+    for item in access:
+        name = sso_manager.profile_name(
+            template, sso_session=sso_session["name"], **item
+        )
+        if name in profiles:
+            skipped.append({"name": name, "reason": "duplicate", **item})
+        elif name in existing and not overwrite:
+            skipped.append({"name": name, "reason": "exists", **item})
+        else:
+            profiles[name] = {
+                "name": name,
+                "region": region,
+                "output": output,
+                "sso_session": sso_session["name"],
+                "sso_account_id": item["account_id"],
+                "sso_role_name": item["role_name"],
+            }
+    if job:
+        job.step("write", count=len(profiles), skipped=len(skipped))
+    added = aws_config.add_profiles(list(profiles.values())) if profiles else []
+    config_changed()
+    logger.info(f"Generated {len(added)} profiles, skipped {len(skipped)}")
+    return {"added": added, "skipped": skipped}
+
+
+@app.route("/api/config/profiles/generate", methods=["POST"])
+def generate_config_profiles():
+    """
+    Endpoint to generate profiles for every account and role an SSO session
+    can access, in the background
+    Body: {"sso_session": ..., "template": "{account_name}-{role_name}",
+        "region": ..., "output": "json", "overwrite": false}
+    Returns: JSON response with the job id
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        name = data.get("sso_session")
+        if not name:
+            return logger.failed("Missing required field: sso_session", 400)
+        sso_session = next(
+            (s for s in aws_config.get_sessions() if s["name"] == name), None
+        )
+        if sso_session is None:
+            return logger.failed(f"Session '{name}' does not exist.", 404)
+        template = data.get("template") or "{account_name}-{role_name}"
+        try:
+            sso_manager.profile_name(
+                template,
+                sso_session=name,
+                account_id="",
+                account_name="",
+                email="",
+                role_name="",
+            )
+        except (KeyError, IndexError, ValueError):
+            return logger.failed(f"Invalid profile name template: {template}", 400)
+
+        region = data.get("region") or sso_session.get("sso_region")
+        if not region:
+            return logger.failed(
+                f"Missing required field: region, session '{name}' has no sso_region",
+                400,
+            )
+
+        job = jobs.submit(
+            "sso_profiles",
+            generate_profiles,
+            sso_session=sso_session,
+            template=template,
+            region=region,
+            output=data.get("output") or "json",
+            overwrite=bool(data.get("overwrite", False)),
+            meta={"sso_session": name, "template": template},
+        )
+        return (
+            jsonify({"status": "accepted", "job_id": job.id, "job": job.to_dict()}),
+            202,
+        )
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error generating profiles", 500)
+
+
 @app.route("/api/config/hosts")
 def get_config_hosts():
     """
@@ -447,11 +643,38 @@ def delete_windows_credentials():
         return logger.failed(f"Failed to delete credentials: {str(e)}", 500)
 
 
+def connect_profile(profile: AWSProfile, job=None) -> dict:
+    """
+    Log in to SSO when needed and connect to AWS
+    Args:
+        profile (AWSProfile): The AWS profile and region
+        job (Job): The job reporting progress
+    Returns: The connected profile, region and account ID
+    Raises: RuntimeError when the connection fails
+    """
+    if not sso_manager.login(profile.name, profile.region, job=job):
+        raise RuntimeError(f"SSO login failed for profile: {profile.name}")
+    if job:
+        job.step("logged_in")
+    if not aws_manager.set_profile_and_region(profile.name, profile.region):
+        raise RuntimeError(f"Failed to connect with profile: {profile.name}")
+
+    credential_monitor.touch(profile.name, profile.region)
+    logger.info(f"Connected to AWS - Profile: {profile.name}, Region: {profile.region}")
+    return {
+        "profile": profile.name,
+        "region": profile.region,
+        "account_id": aws_manager.account_id,
+    }
+
+
 @app.route("/api/connect", methods=["POST"])
 def connect():
     """
-    Endpoint to connect to AWS using the specified profile and region
-    Returns: JSON response with status and account ID
+    Endpoint to connect to AWS using the specified profile and region.
+    Connects right away when the cached SSO token is valid, otherwise the
+    SSO login runs as a background job.
+    Returns: JSON response with status and account ID, or the login job
     """
     data = request.json
 
@@ -460,112 +683,314 @@ def connect():
         if field not in data or not data.get(field, None):
             logger.failed(f"Missing required field: {field}", 400)
 
-    profile = AWSProfile(name=data.get("profile"), region=data.get("region"))
+    try:
+        profile = AWSProfile(name=data.get("profile"), region=data.get("region"))
 
-    result = aws_manager.set_profile_and_region(profile.name, profile.region)
-    max_retries = 2
-    retries = 0
-    delay = 1
-    while not result and retries < max_retries:
-        retries += 1
-        logger.info(f"Starting SSO login with profile: {profile.name}")
-        command = SSOCommand(
-            region=profile.region,
-            profile=profile.name,
-            system=system,
-            action="login",
-            timeout=60,
+        sso_session = sso_manager.session_key(profile.name)
+        if not sso_session or sso_manager.is_valid(profile.name):
+            if aws_manager.set_profile_and_region(profile.name, profile.region):
+                credential_monitor.touch(profile.name, profile.region)
+                logger.info(
+                    f"Connected to AWS - Profile: {profile.name}, "
+                    f"Region: {profile.region}"
+                )
+                return jsonify(
+                    {"status": "success", "account_id": aws_manager.account_id}
+                )
+            if not sso_session:
+                return logger.failed(f"Failed to connect with profile: {profile.name}")
+
+        job = jobs.submit(
+            "sso_login",
+            connect_profile,
+            profile=profile,
+            meta={
+                "profile": profile.name,
+                "region": profile.region,
+                "sso_session": sso_session,
+            },
         )
-        run_cmd(command)
-        result = aws_manager.set_profile_and_region(profile.name, profile.region)
-        if not result:
-            time.sleep(delay)
-
-    logger.info(f"Connected to AWS - Profile: {profile.name}, Region: {profile.region}")
-    return jsonify({"status": "success", "account_id": aws_manager.account_id})
+        return (
+            jsonify({"status": "accepted", "job_id": job.id, "job": job.to_dict()}),
+            202,
+        )
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error connecting to AWS", 500)
 
 
 @app.route("/api/instances")
 def get_instances():
     """
     Endpoint to get a list of EC2 instances with SSM agent installed
+    Query: refresh=true skips the cached inventory
     Returns: JSON list of instances
     """
-    instances = aws_manager.list_ssm_instances()
+    refresh = request.args.get("refresh", "").lower() == "true"
+    instances = None if refresh else cache.namespace("inventory").get(inventory_key())
+    if instances is None:
+        instances = list_instances()
     logger.info(f"Instances: {len(instances)} found.")
     return jsonify(instances)
 
 
+def inventory_key(instance_id: str = None) -> str:
+    """
+    Get the cache key of the inventory of the connected account and region
+    Args:
+        instance_id (str): The instance, for instance details
+    Returns: The cache key
+    """
+    key = f"{aws_manager.account_id}/{aws_manager.region}"
+    return f"{key}/{instance_id}" if instance_id else key
+
+
+def list_instances():
+    """
+    List the instances of the connected account and region, caching the
+    inventory when the listing succeeded
+    Returns: The list of instances, or an error dict
+    """
+    instances = aws_manager.list_ssm_instances()
+    if isinstance(instances, list) and aws_manager.is_connected:
+        cache.namespace("inventory").set(inventory_key(), instances)
+    return instances
+
+
+# Launches in flight by instance id, remote host and remote port, to their job
+launches = {}
+launches_lock = threading.Lock()
+
+
+def pending_launch(key: tuple):
+    """
+    Get the unfinished job launching a tunnel, the launches lock must be held
+    Args:
+        key (tuple): The instance id, remote host and remote port
+    Returns: The Job or None if no launch is in flight
+    """
+    job = jobs.get(launches.get(key))
+    if job is None or job.done:
+        launches.pop(key, None)
+        return None
+    return job
+
+
+def launch_shell(profile: AWSProfile, instance: Instance, job=None) -> ConnectionState:
+    """
+    Start a Shell session
+    Args:
+        profile (AWSProfile): The AWS profile and region
+        instance (Instance): The EC2 instance
+        job (Job): The job reporting progress
+    Returns: The ConnectionState of the started session
+    Raises: RuntimeError when the session could not be started
+    """
+    connection = Connection(method="Shell", instance=instance, timestamp=time.time())
+    command = SSMCommand(
+        instance=instance,
+        region=profile.region,
+        profile=profile.name,
+        reason=connection,
+        system=system,
+        hide=False,
+    )
+
+    logger.info(f"Starting Shell - Instance: {instance.id}")
+    pid = run_cmd(
+        command,
+        progress=job.progress if job else None,
+        cancelled=job.cancel_event if job else None,
+    )
+    if not pid:
+        raise RuntimeError(f"Failed to start Shell to {instance.id}")
+
+    conn_state = ConnectionState(
+        connection_id=str(connection),
+        instance=instance,
+        name=instance.name,
+        type=connection.method,
+        profile=command.profile,
+        region=command.region,
+        pid=pid,
+        timestamp=connection.timestamp,
+        status="active",
+    )
+    if job:
+        job.step("ready")
+    journal.record("launched", conn_state)
+    journal.record("ready", conn_state)
+    return conn_state
+
+
 @app.route("/api/shell/<instance_id>", methods=["POST"])
 def start_shell(instance_id):
     """
     Endpoint to start an Shell session with an EC2 instance
     Args:
         instance_id (str): ID of the EC2 instance
-    Returns: JSON response with status and connection details
+    Returns: JSON response with the job starting the session
     """
     try:
         data = request.json
 
         profile = AWSProfile(name=data.get("profile"), region=data.get("region"))
         instance = Instance(name=data.get("name"), id=instance_id)
-        connection = Connection(
-            method="Shell", instance=instance, timestamp=time.time()
-        )
-        command = SSMCommand(
-            instance=instance,
-            region=profile.region,
-            profile=profile.name,
-            reason=connection,
-            system=system,
-            hide=False,
-        )
+        credential_monitor.touch(profile.name, profile.region)
 
-        logger.info(f"Starting Shell - Instance: {instance.id}")
-        pid = run_cmd(command)
-
-        conn_state = ConnectionState(
-            connection_id=str(connection),
+        job = jobs.submit(
+            "shell",
+            launch_shell,
+            profile=profile,
             instance=instance,
-            name=instance.name,
-            type=connection.method,
-            profile=command.profile,
-            region=command.region,
-            pid=pid,
-            timestamp=connection.timestamp,
-            status="active",
+            meta={"instance_id": instance.id, "name": instance.name},
+        )
+        return (
+            jsonify({"status": "accepted", "job_id": job.id, "job": job.to_dict()}),
+            202,
         )
-
-        return jsonify(conn_state.dict())
     except Exception:  # pylint: disable=broad-except
         return logger.failed("Error starting Shell connection", 500)
 
 
+def launch_rdp(
+    profile: AWSProfile,
+    instance: Instance,
+    local_port: int,
+    persistent: bool = False,
+    job=None,
+) -> ConnectionState:
+    """
+    Start an RDP session on a leased local port and open the RDP client
+    Args:
+        profile (AWSProfile): The AWS profile and region
+        instance (Instance): The EC2 instance
+        local_port (int): The leased local port
+        persistent (bool): Restart the session when it drops
+        job (Job): The job reporting progress
+    Returns: The ConnectionState of the started session
+    Raises: RuntimeError when the session could not be started
+    """
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    conn_state = launch_port_forward(
+        profile=profile,
+        instance=instance,
+        local_port=local_port,
+        remote_port=3389,
+        persistent=persistent,
+        method="RDP",
+        job=job,
+    )
+    logger.info("Opening RDP client...")
+    subprocess.Popen(RDPCommand(local_port=local_port, system=system).cmd)
+    return conn_state
+
+
 @app.route("/api/rdp/<instance_id>", methods=["POST"])
 def start_rdp(instance_id):
     """
     Start an RDP session with an EC2 instance
     Args:
         instance_id (str): ID of the EC2 instance
-    Returns: JSON response with status and connection details
+    Returns: JSON response with the job starting the session, or the
+        connection details when an existing session is reused
     """
-    # pylint: disable=line-too-long, too-many-locals
+    local_port = None
     try:
         data = request.json
-        method = "RDP"
 
         profile = AWSProfile(name=data.get("profile"), region=data.get("region"))
         instance = Instance(name=data.get("name"), id=instance_id)
-        connection = Connection(method=method, instance=instance, timestamp=time.time())
+        credential_monitor.touch(profile.name, profile.region)
 
         remote_port = 3389
-        local_port = FreePort(
-            name=instance.name, remote_port=remote_port, preferences=preferences
-        ).local_port
+        key = (instance.id, None, remote_port)
+        with launches_lock:
+            if not data.get("force_new", False):
+                job = pending_launch(key)
+                if job:
+                    logger.info(f"RDP session already starting: {job.id}")
+                    return (
+                        jsonify(
+                            {
+                                "status": "accepted",
+                                "job_id": job.id,
+                                "job": job.to_dict(),
+                            }
+                        ),
+                        202,
+                    )
+                existing = scanner.find_active(instance.id, remote_port)
+                if existing:
+                    logger.info(f"Reusing RDP session: {existing.connection_id}")
+                    open_rdp_client(existing.local_port)
+                    return jsonify(existing.dict())
+
+            local_port = port_allocator.allocate(
+                name=instance.name, remote_port=remote_port
+            )
 
-        if local_port is None:
-            return logger.failed("No available ports for RDP connection", 503)
+            if local_port is None:
+                return logger.failed("No available ports for RDP connection", 503)
+
+            job = jobs.submit(
+                "rdp",
+                launch_rdp,
+                profile=profile,
+                instance=instance,
+                local_port=local_port,
+                persistent=bool(data.get("persistent", False)),
+                meta={"instance_id": instance.id, "name": instance.name},
+            )
+            launches[key] = job.id
+        return (
+            jsonify({"status": "accepted", "job_id": job.id, "job": job.to_dict()}),
+            202,
+        )
+    except Exception:  # pylint: disable=broad-except
+        port_allocator.release(local_port)
+        return logger.failed("Error starting RDP connection", 500)
 
+
+def launch_port_forward(
+    profile: AWSProfile,
+    instance: Instance,
+    local_port: int,
+    remote_port: int,
+    remote_host: str | None = None,
+    mode: str = "local",
+    persistent: bool = False,
+    method: str = "PORT",
+    job=None,
+) -> ConnectionState:
+    """
+    Start port forwarding on a leased local port
+    Args:
+        profile (AWSProfile): The AWS profile and region
+        instance (Instance): The EC2 instance
+        local_port (int): The leased local port
+        remote_port (int): The remote port
+        remote_host (str): The remote host, used when mode is not local
+        mode (str): local or remote
+        persistent (bool): Restart the session when it drops
+        method (str): PORT or RDP
+        job (Job): The job reporting progress, waits for the port to be ready
+    Returns: The ConnectionState of the started session
+    Raises: RuntimeError when the session could not be started
+    """
+    # pylint: disable=line-too-long, too-many-arguments, too-many-positional-arguments
+    # pylint: disable=too-many-locals
+    connection = Connection(method=method, instance=instance, timestamp=time.time())
+    # The scanner may see the process before its port is bound
+    scanner.launching(str(connection))
+    try:
+        # Behind a proxy the session listens on an internal port
+        tunnel_port = proxies.internal_port() if proxies.enabled else local_port
+
+        document_name = (
+            "AWS-StartPortForwardingSessionToRemoteHost"
+            if mode != "local"
+            else "AWS-StartPortForwardingSession"
+        )
         command = SSMCommand(
             instance=instance,
             region=profile.region,
@@ -573,35 +998,65 @@ def start_rdp(instance_id):
             reason=connection,
             system=system,
             hide=True,
-            document_name="AWS-StartPortForwardingSession",
+            document_name=document_name,
+            remote_host=remote_host,
             remote_port=remote_port,
-            local_port=local_port,
+            local_port=tunnel_port,
         )
 
         logger.info(
-            f"Starting RDP session - Instance: {instance.id}, Port: {command.local_port}"
+            f"Starting {mode} port forwarding - Instance: {instance.id}, Local Port: {local_port}"
         )
-        pid = run_cmd(command)
-
-        logger.info("Opening RDP client...")
-        open_rdp_client(command.local_port)
+        if tunnel_port != local_port:
+            proxies.start(str(connection), local_port, tunnel_port)
+        pid = run_cmd(
+            command,
+            output=session_output,
+            progress=job.progress if job else None,
+            cancelled=job.cancel_event if job else None,
+        )
+        if not pid:
+            raise RuntimeError(f"Failed to start port forwarding to {instance.id}")
+        port_allocator.confirm(local_port)
 
+        if method == "RDP":
+            conn_type = "RDP"
+        else:
+            conn_type = "Custom Port" if mode == "local" else "Remote Host Port"
         conn_state = ConnectionState(
             connection_id=str(connection),
             instance=instance,
             name=instance.name,
-            type=connection.method,
+            type=conn_type,
             profile=command.profile,
             region=command.region,
             pid=pid,
             timestamp=connection.timestamp,
             status="active",
-            local_port=command.local_port,
+            local_port=local_port,
+            tunnel_port=tunnel_port if tunnel_port != local_port else None,
+            remote_port=command.remote_port,
+            remote_host=command.remote_host if mode != "local" else None,
+            persistent=persistent,
         )
-
-        return jsonify(conn_state.dict())
-    except Exception:  # pylint: disable=broad-except
-        return logger.failed("Error starting RDP connection", 500)
+        journal.record("launched", conn_state)
+        if job:
+            ready = wait_for_port(tunnel_port)
+            job.step("ready" if ready else "started", local_port=local_port)
+            if ready:
+                journal.record("ready", conn_state)
+        # Found by a repeated request before the next scan
+        registry.add(conn_state)
+        supervisor.register(conn_state, command)
+        return conn_state
+    except Exception:
+        port_allocator.release(local_port)
+        proxies.stop(str(connection))
+        if journal.is_live(str(connection)):
+            journal.record("terminated", connection_id=str(connection))
+        raise
+    finally:
+        scanner.launched(str(connection))
 
 
 @app.route("/api/custom-port/<instance_id>", methods=["POST"])
@@ -610,71 +1065,235 @@ def start_custom_port(instance_id):
     Start custom port forwarding to an EC2 instance
     Args:
         instance_id (str): ID of the EC2 instance
-    Returns: JSON response with status and connection details
+    Returns: JSON response with the job starting the session, or the
+        connection details when an existing session is reused
     """
-    # pylint: disable=line-too-long, too-many-locals
+    local_port = None
     try:
         data = request.json
         mode = data.get("mode", "local")  # Default to local mode
-        method = "PORT"
 
         profile = AWSProfile(name=data.get("profile"), region=data.get("region"))
         instance = Instance(name=data.get("name"), id=instance_id)
-        connection = Connection(method=method, instance=instance, timestamp=time.time())
+        credential_monitor.touch(profile.name, profile.region)
 
         remote_host = data.get("remote_host", None)
         remote_port = int(data.get("remote_port"))
-        local_port = FreePort(
-            name=instance.name,
-            remote_port=remote_port,
-            remote_host=remote_host,
-            preferences=preferences,
-        ).local_port
-
-        if local_port is None:
-            return logger.failed("No available ports for port forwarding")
+        key = (instance.id, remote_host if mode != "local" else None, remote_port)
+        with launches_lock:
+            if not data.get("force_new", False):
+                job = pending_launch(key)
+                if job:
+                    logger.info(f"Port forwarding already starting: {job.id}")
+                    return (
+                        jsonify(
+                            {
+                                "status": "accepted",
+                                "job_id": job.id,
+                                "job": job.to_dict(),
+                            }
+                        ),
+                        202,
+                    )
+                existing = scanner.find_active(instance.id, remote_port, key[1])
+                if existing:
+                    logger.info(f"Reusing port forwarding: {existing.connection_id}")
+                    return jsonify(existing.dict())
+
+            local_port = port_allocator.allocate(
+                name=instance.name, remote_port=remote_port, remote_host=remote_host
+            )
 
-        document_name = (
-            "AWS-StartPortForwardingSessionToRemoteHost"
-            if mode != "local"
-            else "AWS-StartPortForwardingSession"
-        )
-        command = SSMCommand(
-            instance=instance,
-            region=profile.region,
-            profile=profile.name,
-            reason=connection,
-            system=system,
-            hide=True,
-            document_name=document_name,
-            remote_host=remote_host,
-            remote_port=remote_port,
-            local_port=local_port,
+            if local_port is None:
+                return logger.failed("No available ports for port forwarding")
+
+            job = jobs.submit(
+                "port_forward",
+                launch_port_forward,
+                profile=profile,
+                instance=instance,
+                local_port=local_port,
+                remote_port=remote_port,
+                remote_host=remote_host,
+                mode=mode,
+                persistent=bool(data.get("persistent", False)),
+                meta={"instance_id": instance.id, "name": instance.name},
+            )
+            launches[key] = job.id
+        return (
+            jsonify({"status": "accepted", "job_id": job.id, "job": job.to_dict()}),
+            202,
         )
+    except Exception:  # pylint: disable=broad-except
+        port_allocator.release(local_port)
+        return logger.failed("Error starting port forwarding", 500)
 
-        logger.info(
-            f"Starting {mode} port forwarding - Instance: {instance.id}, Local Port: {command.local_port}"
-        )
-        pid = run_cmd(command)
 
-        conn_state = ConnectionState(
-            connection_id=str(connection),
-            instance=instance,
-            name=instance.name,
-            type="Custom Port" if mode == "local" else "Remote Host Port",
-            profile=command.profile,
-            region=command.region,
-            pid=pid,
-            timestamp=connection.timestamp,
-            status="active",
-            local_port=command.local_port,
-            remote_port=command.remote_port,
-            remote_host=command.remote_host if mode != "local" else None,
-        )
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    """
+    Get the progress of a background job
+    Args:
+        job_id (str): Job ID
+    Returns: JSON response with the job status, progress steps and result
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return logger.failed("Job not found", 404)
+    return jsonify(job.to_dict())
+
 
-        return jsonify(conn_state.dict())
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """
+    Cancel a background job and kill the processes it started
+    Args:
+        job_id (str): Job ID
+    Returns: JSON response with status
+    """
+    try:
+        job = jobs.cancel(job_id)
+        if job is None:
+            return logger.failed("Job not found", 404)
+        return logger.success(f"Job {job.status}: {job.id}")
     except Exception:  # pylint: disable=broad-except
-        return logger.failed("Error starting port forwarding", 500)
+        return logger.failed("Error cancelling job", 500)
+
+
+@app.route("/api/tunnel-groups")
+def get_tunnel_groups():
+    """
+    Get the saved tunnel groups
+    Returns: JSON list of tunnel groups
+    """
+    return jsonify(preferences.get_tunnel_groups())
+
+
+@app.route("/api/tunnel-groups", methods=["POST"])
+def save_tunnel_group():
+    """
+    Save a tunnel group, from the given tunnels or the active port forwards
+    Returns: JSON response with status
+    """
+    try:
+        data = request.json
+        name = data.get("name", None)
+        if not name:
+            return logger.failed("Missing required field: name", 400)
+
+        tunnels = data.get("tunnels", None)
+        if tunnels is None:
+            tunnels = []
+            for conn in registry.all():
+                if not conn.remote_port:
+                    continue
+                try:
+                    tunnels.append(Tunnel.from_connection(conn).model_dump())
+                except ValidationError as e:
+                    logger.warning(
+                        f"Skipping connection {conn.connection_id}: {str(e)}"
+                    )
+        tunnels = [Tunnel(**tunnel).model_dump() for tunnel in tunnels]
+        if not tunnels:
+            return logger.failed("No tunnels to save", 400)
+
+        assert preferences.update_tunnel_group(name, tunnels)
+        return logger.success(f"Tunnel group saved: {name} ({len(tunnels)} tunnels)")
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error saving tunnel group", 500)
+
+
+@app.route("/api/tunnel-groups/<group_name>/start", methods=["POST"])
+def start_tunnel_group(group_name):
+    """
+    Start all tunnels of a group concurrently
+    Args:
+        group_name (str): Name of the tunnel group
+    Returns: JSON response with the readiness of each tunnel
+    """
+    # pylint: disable=too-many-locals
+    try:
+        data = request.get_json(silent=True) or {}
+        group = next(
+            (g for g in preferences.get_tunnel_groups() if g.get("name") == group_name),
+            None,
+        )
+        if group is None:
+            return logger.failed(f"Tunnel group not found: {group_name}", 404)
+
+        tunnels = [Tunnel(**tunnel) for tunnel in group.get("tunnels", [])]
+        results = [tunnel.model_dump() for tunnel in tunnels]
+
+        launched = []
+        with launches_lock:
+            to_start = []
+            for tunnel, result in zip(tunnels, results):
+                key = (tunnel.instance_id, tunnel.target_host, tunnel.remote_port)
+                if not data.get("force_new", False):
+                    job = pending_launch(key)
+                    if job:
+                        result.update(status="pending", job_id=job.id)
+                        continue
+                    existing = scanner.find_active(
+                        tunnel.instance_id, tunnel.remote_port, tunnel.target_host
+                    )
+                    if existing:
+                        result.update(status="existing", connection=existing.dict())
+                        continue
+                to_start.append((tunnel, result, key))
+
+            # Allocate every local port in one pass, the launches run as jobs
+            ports = port_allocator.allocate_many(
+                [(t.name, t.remote_port, t.remote_host) for t, _, _ in to_start]
+            )
+            for (tunnel, result, key), local_port in zip(to_start, ports):
+                if local_port is None:
+                    result.update(status="failed", error="No available ports")
+                    continue
+                try:
+                    job = jobs.submit(
+                        "port_forward",
+                        launch_port_forward,
+                        profile=AWSProfile(name=tunnel.profile, region=tunnel.region),
+                        instance=Instance(name=tunnel.name, id=tunnel.instance_id),
+                        local_port=local_port,
+                        remote_port=tunnel.remote_port,
+                        remote_host=tunnel.remote_host,
+                        mode=tunnel.mode,
+                        persistent=tunnel.persistent,
+                        meta={"instance_id": tunnel.instance_id, "name": tunnel.name},
+                    )
+                except RuntimeError as e:
+                    port_allocator.release(local_port)
+                    result.update(status="failed", error=str(e))
+                    continue
+                launches[key] = job.id
+                result["job_id"] = job.id
+                launched.append((job, result))
+
+        for job, result in launched:
+            job.wait()
+            if job.status == "succeeded":
+                ready = any(step["step"] == "ready" for step in job.steps)
+                result.update(
+                    status="ready" if ready else "started", connection=job.result
+                )
+            else:
+                result.update(status="failed", error=job.error or job.status)
+
+        up = ("ready", "started", "existing", "pending")
+        started = sum(r["status"] in up for r in results)
+        logger.info(f"Tunnel group {group_name}: {started}/{len(results)} up")
+        return jsonify(
+            {
+                "status": "success" if started == len(results) else "partial",
+                "message": f"{started} of {len(results)} tunnels started",
+                "name": group_name,
+                "tunnels": results,
+            }
+        )
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error starting tunnel group", 500)
 
 
 @app.route("/api/instance-details/<instance_id>")
@@ -690,9 +1309,12 @@ def get_instance_details(instance_id):
             return logger.failed("Instance ID is required", 400)
         instance = Instance(id=instance_id)
 
-        details = aws_manager.get_instance_details(instance.id)
+        details = cache.namespace("instances").get(inventory_key(instance.id))
         if details is None:
-            return logger.failed(f"Instance details not found: {instance.id}")
+            details = aws_manager.get_instance_details(instance.id)
+            if details is None:
+                return logger.failed(f"Instance details not found: {instance.id}")
+            cache.namespace("instances").set(inventory_key(instance.id), details)
 
         return jsonify(details)
     except Exception:  # pylint: disable=broad-except
@@ -737,6 +1359,65 @@ def update_instance_preferences(instance_name):
         return logger.failed("Error updating preferences for instance", 500)
 
 
+@app.route("/api/credentials")
+def get_credentials():
+    """
+    Get the credential expiry of the active and recently used profiles
+    Returns: JSON list of profiles with SSO token and role credential expiry
+    """
+    return jsonify(credential_monitor.status())
+
+
+@app.route("/api/ports")
+def get_ports():
+    """
+    Get local port allocation statistics
+    Returns: JSON response with port usage and sticky lease hit and miss stats
+    """
+    return jsonify(port_allocator.stats)
+
+
+@app.route("/api/cache/stats")
+def get_cache_stats():
+    """
+    Get application cache statistics
+    Returns: JSON response with memory hits, misses and latency
+    """
+    return jsonify(cache.stats)
+
+
+@app.route("/api/cache/namespaces")
+def get_cache_namespaces():
+    """
+    Get the usage of every cache namespace
+    Returns: JSON list of namespaces with entries, bytes, budget and policy
+    """
+    return jsonify(cache.usage())
+
+
+@app.route("/api/cache/namespaces/<name>", methods=["DELETE"])
+def flush_cache_namespace(name):
+    """
+    Flush a cache namespace
+    Args:
+        name (str): The namespace name
+    Returns: JSON response with status
+    """
+    if name not in cache.namespaces:
+        return logger.failed(f"Cache namespace not found: {name}", 404)
+    flushed = cache.namespace(name).flush()
+    return logger.success(f"Flushed {flushed} entries from cache namespace {name}")
+
+
+@app.route("/api/proxies")
+def get_proxies():
+    """
+    Get tunnel proxy statistics
+    Returns: JSON list of proxies with bytes and connections counted
+    """
+    return jsonify(proxies.stats)
+
+
 @app.route("/api/refresh")
 def refresh_data():
     """
@@ -744,7 +1425,7 @@ def refresh_data():
     Returns: JSON response with status and updated instance data
     """
     try:
-        instances = aws_manager.list_ssm_instances()
+        instances = list_instances()
         return jsonify({"status": "success", "instances": instances})
     except Exception:  # pylint: disable=broad-except
         return logger.failed("Error refreshing data", 500)
@@ -754,24 +1435,58 @@ def refresh_data():
 def get_active_connections():
     """
     Get active connections with port information
-    Returns: JSON list of active connections
+    Query Args:
+        since (int): Version returned by a previous call, only the changes
+            after it are returned
+    Returns: JSON list of active connections, or the changes since a version
     """
-    # pylint: disable=too-many-nested-blocks, too-many-branches
-    try:
-        active = []
-
-        scanner = ConnectionScanner(cache)
-        scanner.scan()
-
-        active_connections = cache.get("active_connections")
-        assert active_connections is not None, "No active connections"
+    since = request.args.get("since", None, type=int)
+    scanner.scan()
+
+    if since is None:
+        response = jsonify([conn.dict() for conn in registry.all()])
+        response.headers["X-Connections-Version"] = str(registry.version)
+        return response
+
+    changes = registry.changes(since=since)
+    return jsonify(
+        {
+            "version": changes["version"],
+            "reset": changes["reset"],
+            "added": [conn.dict() for conn in changes["added"]],
+            "updated": [conn.dict() for conn in changes["updated"]],
+            "removed": changes["removed"],
+        }
+    )
 
-        for conn in active_connections:
-            active.append(conn.dict())
 
-        return jsonify(active)
-    except AssertionError:
-        return jsonify([])
+def terminate_connections(connection_ids: list | None = None) -> list:
+    """
+    Terminate connections at once, their process trees are terminated
+    together and killed when they do not exit in time
+    Args:
+        connection_ids (list): IDs of the connections, all when None
+    Returns: The terminated connections
+    """
+    if connection_ids is None:
+        selected = registry.all()
+    else:
+        selected = [registry.get(connection_id) for connection_id in connection_ids]
+        selected = [conn for conn in selected if conn is not None]
+    if not selected:
+        return []
+
+    for conn in selected:
+        supervisor.unregister(conn.connection_id)
+    kill_process_tree([conn.pid for conn in selected if conn.pid])
+
+    registry.remove_many([conn.connection_id for conn in selected])
+    for conn in selected:
+        session_output.remove(conn.connection_id)
+        port_allocator.release(conn.local_port)
+        proxies.stop(conn.connection_id)
+        logger.info(f"Connection terminated: {conn}")
+    return selected
 
 
 @app.route("/api/terminate-connection/<connection_id>", methods=["POST"])
@@ -783,33 +1498,118 @@ def terminate_connection(connection_id):
     Returns: JSON response with status
     """
     try:
-        connection = None
-        for conn in cache.get("active_connections"):
-            if conn.connection_id == str(connection_id):
-                connection = conn
-                break
-
-        if not connection:
+        if not terminate_connections([connection_id]):
             return logger.failed("Connection not found", 404)
 
-        try:
-            process = psutil.Process(connection.pid)
-            for child in process.children(recursive=True):
-                child.terminate()
-            process.terminate()
+        return logger.success("Connection terminated")
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error terminating connection", 500)
 
-            _, alive = psutil.wait_procs([process], timeout=3)
-            for p in alive:
-                p.kill()
 
-            cache.remove("active_connections", connection)
-            logger.info(f"Connection terminated: {connection}")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
+@app.route("/api/terminate-connections", methods=["POST"])
+def terminate_many_connections():
+    """
+    Terminate several active connections at once
+    Body:
+        connection_ids (list | str): Connection IDs, or "all"
+    Returns: JSON response with status and the terminated connection IDs
+    """
+    try:
+        data = request.json
+        connection_ids = data.get("connection_ids", [])
+        if connection_ids == "all":
+            connection_ids = None
+        elif not isinstance(connection_ids, list):
+            return logger.failed("connection_ids must be a list or 'all'", 400)
+
+        terminated = terminate_connections(connection_ids)
+        logger.info(f"Terminated {len(terminated)} connections")
+        return jsonify(
+            {
+                "status": "success",
+                "message": f"{len(terminated)} connections terminated",
+                "connection_ids": [conn.connection_id for conn in terminated],
+            }
+        )
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error terminating connections", 500)
 
-        return logger.success("Connection terminated")
+
+@app.route("/api/connections/history")
+def get_connection_history():
+    """
+    Get the history of connections from the journal
+    Query Args:
+        limit (int): Maximum number of connections, defaults to 100
+    Returns: JSON list of connections with duration and restart count
+    """
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(journal.history(limit=limit))
+
+
+@app.route("/api/connections/<connection_id>/persistent", methods=["POST"])
+def set_connection_persistent(connection_id):
+    """
+    Mark a connection as persistent so it is restarted when it drops
+    Args:
+        connection_id (str): Connection ID
+    Returns: JSON response with status
+    """
+    try:
+        data = request.json
+        persistent = bool(data.get("persistent", True))
+        if not supervisor.set_persistent(connection_id, persistent):
+            return logger.failed("Connection was not started by this application", 404)
+        state = "persistent" if persistent else "not persistent"
+        return logger.success(f"Connection is {state}")
     except Exception:  # pylint: disable=broad-except
-        return logger.failed("Error terminating connection", 500)
+        return logger.failed("Error updating connection", 500)
+
+
+@app.route("/api/events")
+def get_events():
+    """
+    Stream application events
+    Returns: Server-sent event stream
+    """
+    since = request.headers.get("Last-Event-ID", 0, type=int)
+    return Response(
+        stream_with_context(events.stream(since=since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.route("/api/connections/<connection_id>/log")
+def get_connection_log(connection_id):
+    """
+    Tail the output of a session
+    Args:
+        connection_id (str): Connection ID
+    Query Args:
+        since (int): Offset returned by a previous call, only newer output is returned
+        lines (int): Only return the last number of lines
+    Returns: JSON response with the output and the offset for the next call
+    """
+    try:
+        pump = session_output.get(connection_id)
+        if pump is None:
+            return logger.failed("No output found for connection", 404)
+
+        since = request.args.get("since", None, type=int)
+        lines = request.args.get("lines", None, type=int)
+        data, offset = pump.read(since=since, lines=lines)
+
+        return jsonify(
+            {
+                "connection_id": connection_id,
+                "output": data.decode("utf-8", errors="replace"),
+                "offset": offset,
+                "running": pump.running,
+            }
+        )
+    except Exception:  # pylint: disable=broad-except
+        return logger.failed("Error reading connection output", 500)
 
 
 @app.route("/api/rdp/<local_port>")
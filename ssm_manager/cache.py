@@ -2,18 +2,318 @@
 Application cache module
 """
 
+# pylint: disable=logging-fstring-interpolation
+import os
+import copy
+import json
+import pickle
+import logging
+import time
+import sqlite3
+import importlib
+import threading
+from collections import OrderedDict
 from cachelib.file import FileSystemCache
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCache:
+    """
+    Cache backend on a SQLite database in WAL mode.
+
+    Values are stored as JSON, with Pydantic models tagged by class so they
+    survive upgrades. Lists are kept one row per member, so appends and
+    removes are single indexed statements and are atomic across threads and
+    processes. Every write bumps the version of its key.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS kv ("
+        " key TEXT PRIMARY KEY, value TEXT, expires REAL, version INTEGER)",
+        "CREATE TABLE IF NOT EXISTS members ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, member TEXT)",
+        "CREATE INDEX IF NOT EXISTS members_key ON members (key, member)",
+    )
+    LIST = '{"__list__": true}'
+
+    def __init__(self, path, default_timeout=3600):
+        self.path = path
+        self.default_timeout = default_timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._transaction() as db:
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    def get(self, key):
+        """
+        Get the value of a key, or None if missing or expired
+        """
+        db = self._connection()
+        row = db.execute(
+            "SELECT value, expires FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] and row[1] <= time.time()):
+            return None
+        if row[0] == self.LIST:
+            rows = db.execute(
+                "SELECT member FROM members WHERE key = ? ORDER BY id", (key,)
+            )
+            return [self.loads(member) for member, in rows]
+        return self.loads(row[0])
+
+    def set(self, key, value, timeout=None):
+        """
+        Set the value of a key, lists are stored as members
+        """
+        with self._transaction() as db:
+            db.execute("DELETE FROM members WHERE key = ?", (key,))
+            if isinstance(value, list):
+                db.executemany(
+                    "INSERT INTO members (key, member) VALUES (?, ?)",
+                    [(key, self.dumps(member)) for member in value],
+                )
+                self._put(db, key, self.LIST, timeout)
+            else:
+                self._put(db, key, self.dumps(value), timeout)
+        return True
+
+    def delete(self, key):
+        """
+        Delete a key
+        """
+        with self._transaction() as db:
+            db.execute("DELETE FROM members WHERE key = ?", (key,))
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+        return True
+
+    def append(self, key, value):
+        """
+        Append a member to the list of a key
+        """
+        with self._transaction() as db:
+            self._expire(db, key)
+            self._put(db, key, self.LIST, None, keep_expiry=True)
+            db.execute(
+                "INSERT INTO members (key, member) VALUES (?, ?)",
+                (key, self.dumps(value)),
+            )
+
+    def remove(self, key, value):
+        """
+        Remove the first equal member from the list of a key
+        """
+        with self._transaction() as db:
+            self._expire(db, key)
+            self._put(db, key, self.LIST, None, keep_expiry=True)
+            db.execute(
+                "DELETE FROM members WHERE id = (SELECT id FROM members"
+                " WHERE key = ? AND member = ? ORDER BY id LIMIT 1)",
+                (key, self.dumps(value)),
+            )
+
+    def version(self, key):
+        """
+        Get the version of a key, changed by every write from any process
+        """
+        row = (
+            self._connection()
+            .execute("SELECT version FROM kv WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    @staticmethod
+    def _expire(db, key):
+        """
+        Delete a key if it has expired
+        """
+        row = db.execute("SELECT expires FROM kv WHERE key = ?", (key,)).fetchone()
+        if row and row[0] and row[0] <= time.time():
+            db.execute("DELETE FROM members WHERE key = ?", (key,))
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _put(self, db, key, value, timeout, keep_expiry=False):
+        """
+        Insert or replace a kv row and bump its version
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.time() + timeout if timeout else 0
+        db.execute(
+            "INSERT INTO kv (key, value, expires, version) VALUES (?, ?, ?, 1)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+            " version = kv.version + 1"
+            + ("" if keep_expiry else ", expires = excluded.expires"),
+            (key, value, expires),
+        )
+
+    def _connection(self):
+        """
+        Get the connection of the current thread
+        """
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        """
+        Start a write transaction, committed or rolled back on exit
+        """
+        return _Transaction(self._connection())
+
+    @staticmethod
+    def dumps(value) -> str:
+        """
+        Serialize a value to JSON, tagging Pydantic models with their class
+        """
+
+        def default(obj):
+            if isinstance(obj, BaseModel):
+                cls = type(obj)
+                return {
+                    "__model__": f"{cls.__module__}.{cls.__qualname__}",
+                    "data": obj.model_dump(mode="json"),
+                }
+            if isinstance(obj, (set, tuple)):
+                return list(obj)
+            raise TypeError(f"Can not cache {type(obj).__name__}")
+
+        return json.dumps(value, default=default, sort_keys=True)
+
+    @staticmethod
+    def loads(value: str):
+        """
+        Deserialize a value from JSON, rebuilding tagged Pydantic models
+        """
+
+        def hook(obj):
+            name = obj.get("__model__")
+            if name is None or not name.startswith("ssm_manager."):
+                return obj
+            module, _, cls = name.rpartition(".")
+            model = getattr(importlib.import_module(module), cls)
+            return model.model_validate(obj["data"])
+
+        return json.loads(value, object_hook=hook)
+
+
+class _Transaction:
+    """
+    Immediate SQLite transaction context
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
 
 
 class Cache:
     """
-    Cache class to manage application cache using FileSystemCache.
+    Cache class to manage application cache using FileSystemCache, or
+    SQLiteCache with the sqlite backend.
+
+    A bounded in-memory LRU sits in front of the file system cache. Writes go
+    through to disk and reads only fall back to disk on a miss. A memory
+    entry is dropped when its TTL expires or when the cache file was changed
+    by another process, such as the tray and --api instances.
+
+    Data is kept in namespaces, each with its own TTL, size budget and
+    eviction policy, so one kind of data can not evict another.
     """
 
-    def __init__(self, cache_dir="cache"):
-        self._cache = FileSystemCache(cache_dir, threshold=500, default_timeout=3600)
-        if self._cache.get("active_connections") is None:
-            self._cache.set("active_connections", [])
+    # pylint: disable=too-many-instance-attributes
+
+    BACKENDS = ("filesystem", "sqlite")
+
+    NAMESPACES = {
+        "connections": {"ttl": 0, "max_bytes": 1048576, "policy": "none"},
+        "inventory": {"ttl": 120, "max_bytes": 8388608, "policy": "lru"},
+        "instances": {"ttl": 600, "max_bytes": 2097152, "policy": "lru"},
+        "profiles": {"ttl": 600, "max_bytes": 1048576, "policy": "fifo"},
+        "dependencies": {"ttl": 86400, "max_bytes": 65536, "policy": "fifo"},
+    }
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(
+        self,
+        cache_dir="cache",
+        max_entries=256,
+        default_ttl=300,
+        backend="filesystem",
+        namespaces=None,
+    ):
+        if backend == "sqlite":
+            self._cache = SQLiteCache(
+                os.path.join(cache_dir, "cache.sqlite3"), default_timeout=3600
+            )
+        else:
+            # Pruning is left to the namespace budgets
+            self._cache = FileSystemCache(cache_dir, threshold=0, default_timeout=3600)
+        self.backend = backend
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._hit_time = 0.0
+        self._miss_time = 0.0
+        self.namespaces = {}
+        for name, config in {**self.NAMESPACES, **(namespaces or {})}.items():
+            config = {**self.NAMESPACES.get(name, {}), **config}
+            self.namespaces[name] = CacheNamespace(self, name, **config)
+
+    def namespace(self, name):
+        """
+        Get a cache namespace
+        :param name: The namespace name.
+        :return: The CacheNamespace.
+        """
+        return self.namespaces[name]
+
+    def usage(self) -> list:
+        """
+        Return the usage of every namespace
+        """
+        return [namespace.usage() for namespace in self.namespaces.values()]
+
+    @property
+    def stats(self) -> dict:
+        """
+        Return hit, miss and latency statistics
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "hit_latency_ms": (
+                    round(self._hit_time / self.hits * 1000, 3) if self.hits else 0.0
+                ),
+                "miss_latency_ms": (
+                    round(self._miss_time / self.misses * 1000, 3)
+                    if self.misses
+                    else 0.0
+                ),
+            }
 
     def get(self, key):
         """
@@ -21,22 +321,49 @@ class Cache:
         :param key: The key to retrieve the value for.
         :return: The value associated with the key, or None if not found.
         """
-        return self._cache.get(key)
+        start = time.perf_counter()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires, mtime = entry
+                if expires > time.monotonic() and mtime == self._mtime(key):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self._hit_time += time.perf_counter() - start
+                    return self._copy(value)
+                del self._memory[key]
 
-    def set(self, key, value):
+            mtime = self._mtime(key)
+            value = self._cache.get(key)
+            if value is not None:
+                self._remember(key, value, self.default_ttl, mtime)
+            self.misses += 1
+            self._miss_time += time.perf_counter() - start
+            return self._copy(value)
+
+    def set(self, key, value, ttl=None, timeout=None):
         """
         Set the value for the key in the cache.
         :param key: The key to set the value for.
         :param value: The value to set for the key.
+        :param ttl: Seconds to keep the value in memory, defaults to default_ttl.
+        :param timeout: Seconds to keep the value on disk, 0 never expires.
         """
-        self._cache.set(key, value)
+        ttl = ttl or self.default_ttl
+        if timeout:
+            ttl = min(ttl, timeout)
+        with self._lock:
+            self._cache.set(key, value, timeout=timeout)
+            self._remember(key, self._copy(value), ttl)
 
     def delete(self, key):
         """
         Delete the key from the cache.
         :param key: The key to delete from the cache.
         """
-        self._cache.delete(key)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._cache.delete(key)
 
     def remove(self, key, value):
         """
@@ -44,12 +371,17 @@ class Cache:
         :param key: The key to remove the value from.
         :param value: The value to remove from the list.
         """
-        items = self._cache.get(key)
-        if items is not None:
-            items.remove(value)
-        else:
-            items = []
-        self._cache.set(key, items)
+        if isinstance(self._cache, SQLiteCache):
+            self._cache.remove(key, value)
+            self._forget(key)
+            return
+        with self._lock:
+            items = self.get(key)
+            if items is not None:
+                items.remove(value)
+            else:
+                items = []
+            self.set(key, items)
 
     def append(self, key, value):
         """
@@ -57,8 +389,250 @@ class Cache:
         :param key: The key to append the value to.
         :param value: The value to append to the list.
         """
-        items = self._cache.get(key)
-        if items is None:
-            items = []
-        items.append(value)
-        self._cache.set(key, items)
+        if isinstance(self._cache, SQLiteCache):
+            self._cache.append(key, value)
+            self._forget(key)
+            return
+        with self._lock:
+            items = self.get(key)
+            if items is None:
+                items = []
+            items.append(value)
+            self.set(key, items)
+
+    def _remember(self, key, value, ttl, mtime=None):
+        """
+        Keep a value in memory, evicting the least recently used entries
+        """
+        if mtime is None:
+            mtime = self._mtime(key)
+        self._memory[key] = (value, time.monotonic() + ttl, mtime)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _forget(self, key):
+        """
+        Drop a key from memory
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def _mtime(self, key):
+        """
+        Get the modification time of the cache file of a key, or the
+        version of the key with the sqlite backend
+        """
+        # pylint: disable=protected-access
+        if isinstance(self._cache, SQLiteCache):
+            return self._cache.version(key)
+        try:
+            return os.stat(self._cache._get_filename(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def size(self, value) -> int:
+        """
+        Get the size in bytes of a value as stored by the backend
+        """
+        if isinstance(self._cache, SQLiteCache):
+            return len(self._cache.dumps(value))
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _copy(value):
+        """
+        Copy containers so callers can not change the cached value
+        """
+        if isinstance(value, (list, dict, set)):
+            return copy.copy(value)
+        return value
+
+
+class CacheNamespace:
+    """
+    A namespace of the cache with its own TTL, size budget in bytes and
+    eviction policy.
+
+    Policies are lru, evicting the least recently used entry, fifo,
+    evicting the oldest entry, and none, which never evicts and only warns
+    when the budget is exceeded. The keys and sizes of a namespace are kept
+    in an index entry so usage and flushes cover every process.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    POLICIES = ("lru", "fifo", "none")
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(self, cache, name, ttl=0, max_bytes=0, policy="lru"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.evictions = 0
+        self._used = {}
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """
+        Get the value of a key in the namespace, or None if not found
+        """
+        value = self.cache.get(self._key(key))
+        if value is not None:
+            self._used[key] = time.time()
+        return value
+
+    def set(self, key, value) -> bool:
+        """
+        Set the value of a key in the namespace, evicting other entries when
+        the budget is exceeded
+        Returns: False when the value alone is larger than the budget
+        """
+        size = self.cache.size(value)
+        if self.max_bytes and size > self.max_bytes and self.policy != "none":
+            logger.warning(f"Not caching {self.name}:{key}, {size} bytes")
+            return False
+        with self._lock:
+            self.cache.set(self._key(key), value, timeout=self.ttl)
+            index = self._index()
+            index[key] = [size, time.time()]
+            self._used[key] = time.time()
+            self._evict(index, keep=key)
+            self._save(index)
+        return True
+
+    def delete(self, key) -> None:
+        """
+        Delete a key from the namespace
+        """
+        with self._lock:
+            self.cache.delete(self._key(key))
+            index = self._index()
+            if index.pop(key, None) is not None:
+                self._save(index)
+            self._used.pop(key, None)
+
+    def append(self, key, value) -> None:
+        """
+        Append a value to a list in the namespace
+        """
+        with self._lock:
+            self.cache.append(self._key(key), value)
+            self._resize(key, self.cache.size(value))
+
+    def remove(self, key, value) -> None:
+        """
+        Remove a value from a list in the namespace
+        """
+        with self._lock:
+            self.cache.remove(self._key(key), value)
+            self._resize(key, -self.cache.size(value))
+
+    def flush(self) -> int:
+        """
+        Delete every key of the namespace
+        Returns: The number of deleted keys
+        """
+        with self._lock:
+            index = self._index()
+            for key in index:
+                self.cache.delete(self._key(key))
+            self.cache.delete(self._key("__index__"))
+            self._used.clear()
+        logger.info(f"Flushed {len(index)} entries from cache namespace {self.name}")
+        return len(index)
+
+    def usage(self) -> dict:
+        """
+        Get the entries, bytes and budget of the namespace
+        """
+        with self._lock:
+            index = self._index()
+        used = sum(size for size, _ in index.values())
+        return {
+            "namespace": self.name,
+            "entries": len(index),
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "usage": round(used / self.max_bytes, 3) if self.max_bytes else 0.0,
+            "ttl": self.ttl,
+            "policy": self.policy,
+            "evictions": self.evictions,
+        }
+
+    def _key(self, key) -> str:
+        """
+        Get the cache key of a namespace key
+        """
+        return f"{self.name}:{key}"
+
+    def _index(self) -> dict:
+        """
+        Get the index of unexpired keys to size and store time, the lock
+        must be held. The file cache does not prune expired entries, so the
+        entries of expired keys are deleted here.
+        """
+        index = self.cache.get(self._key("__index__")) or {}
+        if self.ttl:
+            cutoff = time.time() - self.ttl
+            expired = [k for k, (_, stored) in index.items() if stored <= cutoff]
+            for key in expired:
+                del index[key]
+                self.cache.delete(self._key(key))
+                self._used.pop(key, None)
+            if expired:
+                self._save(index)
+                logger.debug(f"Deleted {len(expired)} expired {self.name} entries")
+        return index
+
+    def _save(self, index: dict) -> None:
+        """
+        Write the index
+        """
+        self.cache.set(self._key("__index__"), index, timeout=0)
+
+    def _resize(self, key, delta: int) -> None:
+        """
+        Change the recorded size of a key, the lock must be held
+        """
+        index = self._index()
+        size, stored = index.get(key, [0, time.time()])
+        index[key] = [max(size + delta, 0), stored]
+        self._used[key] = time.time()
+        self._evict(index, keep=key)
+        self._save(index)
+
+    def _evict(self, index: dict, keep=None) -> None:
+        """
+        Evict entries until the namespace fits its budget, the lock must be held
+        """
+        if not self.max_bytes:
+            return
+        used = sum(size for size, _ in index.values())
+        if used <= self.max_bytes:
+            return
+        if self.policy == "none":
+            logger.warning(
+                f"Cache namespace {self.name} is over budget: "
+                f"{used}/{self.max_bytes} bytes"
+            )
+            return
+        if self.policy == "lru":
+            order = sorted(index, key=lambda k: self._used.get(k, index[k][1]))
+        else:
+            order = sorted(index, key=lambda k: index[k][1])
+        for key in order:
+            if used <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            used -= index.pop(key)[0]
+            self.cache.delete(self._key(key))
+            self._used.pop(key, None)
+            self.evictions += 1
+            logger.debug(f"Evicted {self.name}:{key} from the cache")
@@ -3,9 +3,16 @@ AWS Config Manager
 """
 
 # pylint: disable=logging-fstring-interpolation
+import io
+import os
+import shutil
 import logging
+import tempfile
+import threading
 import configparser
+from contextlib import contextmanager
 from pathlib import Path
+from filelock import FileLock
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +20,19 @@ logger = logging.getLogger(__name__)
 class AwsConfigManager:
     """
     A class to read and write to the AWS config file in a cross-platform manner.
+    The parsed file is kept in memory for reads until it is invalidated.
+    Changes are made in transactions that parse the file once and write it
+    once, atomically and under a file lock.
     """
 
+    PROFILE_PROPERTIES = (
+        "region",
+        "output",
+        "sso_session",
+        "sso_account_id",
+        "sso_role_name",
+    )
+
     def __init__(self):
         """
         Initializes the manager by finding the AWS config file path.
@@ -22,6 +40,84 @@ class AwsConfigManager:
         self._config_path = self._get_aws_config_path()
         self.session_prefix = "sso-session "
         self.profile_prefix = "profile "
+        self._config = None
+        self._lock = threading.Lock()
+
+    @property
+    def config_path(self):
+        """
+        The path to the AWS config file
+        """
+        return self._config_path
+
+    def invalidate(self):
+        """
+        Forget the parsed config file, it is read again on the next use.
+        """
+        with self._lock:
+            self._config = None
+
+    def _read(self) -> configparser.ConfigParser:
+        """
+        Get the parsed config file, parsing it only once until invalidated.
+        The returned parser is shared and must not be changed.
+        """
+        with self._lock:
+            if self._config is None:
+                config = configparser.ConfigParser()
+                config.read(self._config_path)
+                self._config = config
+            return self._config
+
+    @contextmanager
+    def transaction(self, timeout: float = 10):
+        """
+        Parses the config file for a batch of changes and writes it once when
+        the block exits without an exception. The file is locked for the whole
+        transaction and replaced atomically, and only when it changed.
+
+        Args:
+            timeout (float): Seconds to wait for the file lock.
+
+        Yields:
+            configparser.ConfigParser: The parsed config to change.
+        """
+        self._config_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self._config_path.with_name(f".{self._config_path.name}.lock")
+        with FileLock(lock_path, timeout=timeout):
+            config = configparser.ConfigParser()
+            original = ""
+            if self._config_path.is_file():
+                original = self._config_path.read_text(encoding="utf-8")
+                config.read_string(original, source=str(self._config_path))
+            yield config
+            content = io.StringIO()
+            config.write(content)
+            if content.getvalue() != original:
+                self._replace(content.getvalue())
+            self.invalidate()
+
+    def _replace(self, content: str):
+        """
+        Replaces the config file atomically through a temporary file.
+
+        Args:
+            content (str): The new content of the config file.
+        """
+        fd, temp_path = tempfile.mkstemp(
+            dir=self._config_path.parent, prefix=f".{self._config_path.name}."
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._config_path.exists():
+                shutil.copymode(self._config_path, temp_path)
+            os.replace(temp_path, self._config_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
 
     def _get_aws_config_path(self):
         """
@@ -47,15 +143,13 @@ class AwsConfigManager:
         Returns:
             str or None: The value if found, otherwise None.
         """
-        config = configparser.ConfigParser()
-
         # Check if the file exists before trying to read it
         if not self._config_path.is_file():
             logger.error(f"Error: AWS config file not found at {self._config_path}")
             return None
 
         try:
-            config.read(self._config_path)
+            config = self._read()
             if not config.has_section(section):
                 raise ValueError(f"Section '{section}' not found in config file")
             if not config.has_option(section, key):
@@ -79,24 +173,12 @@ class AwsConfigManager:
             key (str): The key name.
             value (str): The value to write.
         """
-        config = configparser.ConfigParser()
-
-        # Create the directory if it doesn't exist
-        self._config_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # Read existing config to not overwrite other settings
-        if self._config_path.is_file():
-            config.read(self._config_path)
-
-        # Add or update the section and key
-        if not config.has_section(section):
-            config.add_section(section)
-
-        config.set(section, key, value)
-
         try:
-            with open(self._config_path, "w", encoding="utf-8") as configfile:
-                config.write(configfile)
+            with self.transaction() as config:
+                # Add or update the section and key
+                if not config.has_section(section):
+                    config.add_section(section)
+                config.set(section, key, value)
             logger.info(
                 f"Successfully wrote '{value}' to section '{section}', key '{key}'"
             )
@@ -115,13 +197,12 @@ class AwsConfigManager:
         sessions = []
         try:
             session_names = []
-            config = configparser.ConfigParser()
             if not self._config_path.is_file():
                 raise ValueError(
                     f"Error: AWS config file not found at {self._config_path}"
                 )
 
-            config.read(self._config_path)
+            config = self._read()
             for section in config.sections():
                 if section.startswith(self.session_prefix):
                     session_names.append(section[len(self.session_prefix) :])
@@ -144,6 +225,21 @@ class AwsConfigManager:
 
         return sessions
 
+    def get_profile_names(self) -> list[str]:
+        """
+        Lists the names of the profiles in the config file.
+
+        Returns:
+            list[str]: The profile names.
+        """
+        names = []
+        for section in self._read().sections():
+            if section == "default":
+                names.append(section)
+            elif section.startswith(self.profile_prefix):
+                names.append(section[len(self.profile_prefix) :])
+        return names
+
     def add_session(
         self, name: str, start_url: str, region: str, registration_scopes: str
     ):
@@ -157,9 +253,16 @@ class AwsConfigManager:
             registration_scopes (str): The registration scopes for the session.
         """
         section_name = self.session_prefix + name
-        self.write_value(section_name, "sso_start_url", start_url)
-        self.write_value(section_name, "sso_region", region)
-        self.write_value(section_name, "sso_registration_scopes", registration_scopes)
+        try:
+            with self.transaction() as config:
+                if not config.has_section(section_name):
+                    config.add_section(section_name)
+                config.set(section_name, "sso_start_url", start_url)
+                config.set(section_name, "sso_region", region)
+                config.set(section_name, "sso_registration_scopes", registration_scopes)
+            logger.info(f"Successfully added session '{name}'")
+        except IOError as e:
+            logger.error(f"An I/O error occurred while writing to the file: {e}")
 
     def delete_session(self, name: str):
         """
@@ -169,19 +272,17 @@ class AwsConfigManager:
             name (str): The name of the session to delete.
         """
         try:
-            config = configparser.ConfigParser()
             if not self._config_path.is_file():
                 raise FileNotFoundError(
                     f"Error: AWS config file not found at {self._config_path}"
                 )
 
-            config.read(self._config_path)
             section_name = self.session_prefix + name
-            assert config.has_section(section_name), f"Session '{name}' does not exist"
-
-            config.remove_section(section_name)
-            with open(self._config_path, "w", encoding="utf-8") as configfile:
-                config.write(configfile)
+            with self.transaction() as config:
+                assert config.has_section(
+                    section_name
+                ), f"Session '{name}' does not exist"
+                config.remove_section(section_name)
             logger.info(f"Successfully deleted session '{name}'")
         except configparser.Error as e:
             logger.error(f"Error deleting session: {e}")
@@ -200,22 +301,110 @@ class AwsConfigManager:
             account_id (str): The SSO account ID for the profile.
             role_name (str): The SSO role name for the profile.
         """
-        section_name = "profile " + name if name != "default" else "default"
         if not kwargs:
             logger.error("No properties provided to add to the profile.")
             return
-        for prop in [
-            "region",
-            "output",
-            "sso_session",
-            "sso_account_id",
-            "sso_role_name",
-        ]:
-            if prop not in kwargs:
+        try:
+            with self.transaction() as config:
+                if not self._set_profile(config, name, **kwargs):
+                    return
+            logger.info(
+                f"Successfully added profile '{name}' with properties: {kwargs}"
+            )
+        except IOError as e:
+            logger.error(f"An I/O error occurred while writing to the file: {e}")
+
+    def add_profiles(self, profiles: list[dict]) -> list[str]:
+        """
+        Adds or updates several profiles in a single write of the config file.
+
+        Args:
+            profiles (list[dict]): Profiles with a 'name' and the properties
+                accepted by add_profile.
+
+        Returns:
+            list[str]: The names of the profiles written, profiles without a
+                name or recognised properties are skipped.
+        """
+        added = []
+        try:
+            with self.transaction() as config:
+                for profile in profiles:
+                    properties = dict(profile)
+                    name = properties.pop("name", None)
+                    if not name or not self._set_profile(config, name, **properties):
+                        logger.warning(f"Skipping invalid profile: {profile}")
+                        continue
+                    added.append(name)
+            logger.info(f"Successfully added {len(added)} profiles")
+        except IOError as e:
+            logger.error(f"An I/O error occurred while writing to the file: {e}")
+            return []
+        return added
+
+    def delete_profiles(self, names: list[str]) -> list[str]:
+        """
+        Deletes several profiles in a single write of the config file.
+
+        Args:
+            names (list[str]): The names of the profiles to delete.
+
+        Returns:
+            list[str]: The names of the profiles deleted.
+        """
+        deleted = []
+        try:
+            with self.transaction() as config:
+                for name in names:
+                    if config.remove_section(self._profile_section(name)):
+                        deleted.append(name)
+                    else:
+                        logger.warning(f"Profile '{name}' does not exist")
+            logger.info(f"Successfully deleted {len(deleted)} profiles")
+        except IOError as e:
+            logger.error(f"An I/O error occurred while writing to the file: {e}")
+            return []
+        return deleted
+
+    def _profile_section(self, name: str) -> str:
+        """
+        Gets the section name of a profile.
+        """
+        return self.profile_prefix + name if name != "default" else "default"
+
+    def recognised_properties(self, properties: dict) -> dict:
+        """
+        Gets the profile properties that are set and written to the config.
+        """
+        return {
+            prop: properties[prop]
+            for prop in self.PROFILE_PROPERTIES
+            if properties.get(prop) is not None
+        }
+
+    def _set_profile(
+        self, config: configparser.ConfigParser, name: str, **kwargs
+    ) -> bool:
+        """
+        Sets the properties of a profile in a parsed config.
+
+        Returns:
+            bool: False when none of the properties are recognised, the
+                profile is then left untouched.
+        """
+        properties = self.recognised_properties(kwargs)
+        if not properties:
+            logger.warning(f"No recognised properties for profile '{name}'")
+            return False
+        section_name = self._profile_section(name)
+        if not config.has_section(section_name):
+            config.add_section(section_name)
+        for prop in self.PROFILE_PROPERTIES:
+            if prop not in properties:
                 logger.warning(f"Warning: '{prop}' not provided for profile '{name}'")
                 continue
-            self.write_value(section_name, prop, str(kwargs[prop]))
-        logger.info(f"Successfully added profile '{name}' with properties: {kwargs}")
+            config.set(section_name, prop, str(properties[prop]))
+        return True
 
     def delete_profile(self, name: str):
         """
@@ -224,21 +413,17 @@ class AwsConfigManager:
             name (str): The name of the profile to delete.
         """
         try:
-            config = configparser.ConfigParser()
             if not self._config_path.is_file():
                 raise FileNotFoundError(
                     f"Error: AWS config file not found at {self._config_path}"
                 )
 
-            config.read(self._config_path)
-            section_name = (
-                self.profile_prefix + name if name != "default" else "default"
-            )
-            assert config.has_section(section_name), f"Profile '{name}' does not exist"
-
-            config.remove_section(section_name)
-            with open(self._config_path, "w", encoding="utf-8") as configfile:
-                config.write(configfile)
+            section_name = self._profile_section(name)
+            with self.transaction() as config:
+                assert config.has_section(
+                    section_name
+                ), f"Profile '{name}' does not exist"
+                config.remove_section(section_name)
             logger.info(f"Successfully deleted profile '{name}'")
         except configparser.Error as e:
             logger.error(f"Error deleting profile: {e}")
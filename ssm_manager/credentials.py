@@ -0,0 +1,201 @@
+"""
+Credential monitor
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialMonitor:
+    """
+    Watches the SSO tokens of the active and recently used profiles and the
+    role credentials of the active AWS session.
+
+    Role credentials are refreshed once botocore considers them due, before
+    the next API call has to. An event is published when an SSO token, and
+    with it every profile of its session, is about to need a browser login.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(
+        self,
+        aws_manager,
+        sso=None,
+        events=None,
+        interval=60,
+        login_warning=900,
+        max_profiles=10,
+    ):
+        self.aws_manager = aws_manager
+        self.sso = sso
+        self.events = events
+        self.interval = interval
+        self.login_warning = login_warning
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._warned = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def touch(self, profile: str, region: str = None) -> None:
+        """
+        Record a profile as recently used and start monitoring
+        Args:
+            profile (str): The AWS profile name
+            region (str): The AWS region name
+        """
+        with self._lock:
+            self._profiles[profile] = {"region": region, "used": time.time()}
+            self._profiles.move_to_end(profile)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        self.start()
+
+    def status(self) -> list:
+        """
+        Get the credential expiry of the monitored profiles
+        Returns: A list of profile statuses
+        """
+        with self._lock:
+            profiles = list(self._profiles.items())
+        statuses = []
+        now = datetime.now(timezone.utc)
+        for profile, usage in reversed(profiles):
+            token_expires = self.sso.expires_at(profile) if self.sso else None
+            credentials_expires = None
+            if profile == self.aws_manager.profile:
+                credentials_expires = self._credentials_expiry()
+            statuses.append(
+                {
+                    "profile": profile,
+                    "region": usage["region"],
+                    "used": usage["used"],
+                    "active": profile == self.aws_manager.profile,
+                    "sso_session": self.sso.session_key(profile) if self.sso else None,
+                    "token_expires_at": self._isoformat(token_expires),
+                    "credentials_expires_at": self._isoformat(credentials_expires),
+                    "login_required": bool(token_expires and token_expires <= now),
+                }
+            )
+        return statuses
+
+    def start(self) -> None:
+        """
+        Start the monitor thread
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = threading.Thread(
+                    target=self.run, name="credentials", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the monitor thread
+        """
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """
+        Check the credentials until stopped
+        """
+        logger.info("Credential monitor started")
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error checking credentials: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def check(self) -> None:
+        """
+        Refresh the active role credentials and warn about expiring SSO tokens
+        """
+        self._refresh_credentials()
+        if not self.sso:
+            return
+
+        with self._lock:
+            profiles = list(self._profiles)
+        now = datetime.now(timezone.utc)
+        checked = set()
+        for profile in profiles:
+            sso_session = self.sso.session_key(profile)
+            if not sso_session or sso_session in checked:
+                continue
+            checked.add(sso_session)
+            expires_at = self.sso.expires_at(profile)
+            if expires_at is None:
+                continue
+            remaining = (expires_at - now).total_seconds()
+            if remaining > self.login_warning:
+                continue
+            if self._warned.get(sso_session) == expires_at:
+                continue
+            self._warned[sso_session] = expires_at
+            if remaining <= 0:
+                message = f"SSO login expired for {sso_session}, please reconnect"
+                level = "danger"
+            else:
+                message = (
+                    f"SSO login for {sso_session} expires in "
+                    f"{max(int(remaining // 60), 1)} minutes, please reconnect"
+                )
+                level = "warning"
+            logger.warning(message)
+            if self.events:
+                self.events.publish(
+                    "sso_expiring",
+                    profile=profile,
+                    sso_session=sso_session,
+                    expires_at=self._isoformat(expires_at),
+                    level=level,
+                    message=message,
+                )
+
+    def _refresh_credentials(self) -> None:
+        """
+        Refresh the role credentials of the active session when they are due
+        """
+        session = getattr(self.aws_manager, "session", None)
+        if session is None or not self.aws_manager.is_connected:
+            return
+        credentials = session.get_credentials()
+        if credentials is None or not hasattr(credentials, "refresh_needed"):
+            return
+        if credentials.refresh_needed():
+            # Frozen credentials are refreshed by botocore when due
+            credentials.get_frozen_credentials()
+            logger.info(
+                f"Refreshed credentials for profile: {self.aws_manager.profile}"
+            )
+
+    def _credentials_expiry(self) -> datetime | None:
+        """
+        Get the expiry of the role credentials of the active session
+        """
+        # pylint: disable=protected-access
+        session = getattr(self.aws_manager, "session", None)
+        if session is None:
+            return None
+        credentials = session.get_credentials()
+        return getattr(credentials, "_expiry_time", None)
+
+    @staticmethod
+    def _isoformat(value: datetime | None) -> str | None:
+        """
+        Format a datetime for JSON
+        """
+        return value.isoformat() if value else None
@@ -3,20 +3,86 @@ Dependency management.
 """
 
 # pylint: disable=logging-fstring-interpolation
+import os
 import re
+import time
+import shutil
 import logging
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from urllib import request, error
-from typing import Literal
-from pydantic import BaseModel, ConfigDict
+from typing import Any, Literal
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 from ssm_manager.utils import CLIVersionCommand, SSMVersionCommand
 
 logger = logging.getLogger(__name__)
 
 
+class CircuitBreaker:
+    """
+    Stops calling a failing remote after `threshold` consecutive failures.
+    After `cooldown` seconds a single call is let through again, and the
+    breaker closes when it succeeds.
+    """
+
+    def __init__(self, threshold=2, cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        closed, open or half-open
+        """
+        if self.opened is None:
+            return "closed"
+        if time.monotonic() - self.opened >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Check if a call may be made, a half-open breaker allows one call
+        """
+        with self._lock:
+            state = self.state
+            if state == "half-open":
+                # Other calls wait for the trial call
+                self.opened = time.monotonic()
+            return state != "open"
+
+    def success(self) -> None:
+        """
+        Record a successful call
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self) -> None:
+        """
+        Record a failed call
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+
 class DependencyManager(BaseModel):
     """
     Manages dependencies for the project.
+
+    The installed and latest versions are checked concurrently, with
+    timeouts on every subprocess and request. Installed versions are cached
+    by binary path and mtime, so they are only checked again after an
+    upgrade. Latest versions are cached for `latest_ttl` seconds, and a
+    circuit breaker per remote stops requests while offline, serving the
+    last known version instead.
     """
 
     model_config = ConfigDict(strict=True)
@@ -24,21 +90,43 @@ class DependencyManager(BaseModel):
     arch: Literal["x86_64", "AMD64"]
     message_not_installed: str = "Not Installed"
     message_unknown: str = "Unknown"
+    cache: Any = None
+    timeout: float = 5.0
+    latest_ttl: int = 21600
+    _breakers: dict = PrivateAttr(default_factory=dict)
 
     @property
     def dependencies(self) -> dict:
         """
         Returns a dict of dependencies and their versions
         """
+        checks = {
+            "awscli": lambda: self.awscli,
+            "awscli_latest": lambda: self.awscli_latest_version,
+            "ssmplugin": lambda: self.ssmplugin,
+            "ssmplugin_latest": lambda: self.ssmplugin_latest_version,
+        }
+        pool = ThreadPoolExecutor(max_workers=len(checks))
+        futures = {name: pool.submit(check) for name, check in checks.items()}
+        deadline = time.monotonic() + self.timeout + 1
+        versions = {}
+        for name, future in futures.items():
+            try:
+                versions[name] = future.result(max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                logger.warning(f"Timed out checking dependency version: {name}")
+                versions[name] = self.message_unknown
+        # Checks that timed out finish in the background and fill the cache
+        pool.shutdown(wait=False)
         return {
             "awscli": {
-                "installed": self.awscli,
-                "latest": self.awscli_latest_version,
+                "installed": versions["awscli"],
+                "latest": versions["awscli_latest"],
                 "urls": self.awscli_url,
             },
             "session_manager_plugin": {
-                "installed": self.ssmplugin,
-                "latest": self.ssmplugin_latest_version,
+                "installed": versions["ssmplugin"],
+                "latest": versions["ssmplugin_latest"],
                 "urls": self.ssmplugin_url,
             },
         }
@@ -50,7 +138,7 @@ class DependencyManager(BaseModel):
         """
         return all(
             version != self.message_not_installed
-            for version in self.dependencies.values()
+            for version in (self.awscli, self.ssmplugin)
         )
 
     @property
@@ -58,23 +146,12 @@ class DependencyManager(BaseModel):
         """
         Returns the version of AWS CLI if installed
         """
-        try:
-            command = CLIVersionCommand(system=self.system)
-            logger.info(f"Checking AWS CLI version with command: {command.cmd}")
-            version = subprocess.run(
-                command.cmd,
-                startupinfo=command.startupinfo,
-                capture_output=True,
-                check=True,
-            )
-            if version.returncode == 0:
-                match = re.search(
-                    r"aws-cli\/([0-9\.]+)", version.stdout.decode("utf-8")
-                )
-                return match.group(1) if match else self.message_unknown
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            logger.warning("AWS CLI not found or error getting version.")
-        return self.message_not_installed
+
+        def parse(output: str) -> str:
+            match = re.search(r"aws-cli\/([0-9\.]+)", output)
+            return match.group(1) if match else self.message_unknown
+
+        return self._installed_version(CLIVersionCommand(system=self.system), parse)
 
     @property
     def awscli_url(self) -> list[str]:
@@ -94,40 +171,25 @@ class DependencyManager(BaseModel):
         """
         Returns the latest version of AWS CLI from GitHub Changelog
         """
-        try:
-            change_log_url = (
-                "https://raw.githubusercontent.com/aws/aws-cli/v2/CHANGELOG.rst"
-            )
-            with request.urlopen(change_log_url) as response:
-                if response.status != 200:
-                    raise error.URLError(f"Error fetching changelog: {response.status}")
-                changelog = response.read().decode("utf-8")
-            pattern = re.compile(r"(\d{1,5}\.\d{1,5}\.\d{1,5})\n")
-            match = pattern.search(changelog)
-            if match:
-                return match.group(1)
-        except Exception as e:  # pylint: disable=broad-except
-            logger.warning(f"Error fetching latest AWS CLI version: {e}")
-        return self.message_unknown
+        change_log_url = (
+            "https://raw.githubusercontent.com/aws/aws-cli/v2/CHANGELOG.rst"
+        )
+
+        def parse(changelog: str) -> str | None:
+            # The latest release is at the top of the changelog
+            match = re.search(r"(\d{1,5}\.\d{1,5}\.\d{1,5})\n", changelog)
+            return match.group(1) if match else None
+
+        return self._latest_version("awscli", change_log_url, parse)
 
     @property
     def ssmplugin(self) -> str:
         """
         Returns the version of Session Manager Plugin if installed
         """
-        try:
-            command = SSMVersionCommand(system=self.system)
-            ssm = subprocess.run(
-                command.cmd,
-                startupinfo=command.startupinfo,
-                capture_output=True,
-                check=True,
-            )
-            if ssm.returncode == 0:
-                return ssm.stdout.decode("utf-8").strip()
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            logger.warning("Session Manager Plugin not found or error getting version.")
-        return self.message_not_installed
+        return self._installed_version(
+            SSMVersionCommand(system=self.system), lambda output: output.strip()
+        )
 
     @property
     def ssmplugin_url(self) -> list[str]:
@@ -162,14 +224,78 @@ class DependencyManager(BaseModel):
         releases_url = (
             "https://api.github.com/repos/aws/session-manager-plugin/releases/latest"
         )
-        try:
-            with request.urlopen(releases_url) as response:
-                if response.status != 200:
-                    raise error.URLError(f"Error fetching releases: {response.status}")
-                release_info = response.read().decode("utf-8")
+
+        def parse(release_info: str) -> str | None:
             match = re.search(r'"tag_name":\s*"v?([0-9\.]+)"', release_info)
-            if match:
-                return match.group(1)
+            return match.group(1) if match else None
+
+        return self._latest_version("ssmplugin", releases_url, parse)
+
+    def _installed_version(self, command, parse) -> str:
+        """
+        Returns the installed version of a binary, cached by path and mtime
+        """
+        binary = shutil.which(str(command).split()[0])
+        if binary is None:
+            logger.warning(f"{command} not found.")
+            return self.message_not_installed
+        try:
+            key = f"installed/{binary}/{os.stat(binary).st_mtime_ns}"
+        except OSError:
+            key = None
+        if key and self.cache is not None:
+            version = self.cache.get(key)
+            if version is not None:
+                return version
+
+        try:
+            logger.info(f"Checking version with command: {command.cmd}")
+            result = subprocess.run(
+                command.cmd,
+                startupinfo=command.startupinfo,
+                capture_output=True,
+                check=True,
+                timeout=self.timeout,
+            )
+            version = parse(result.stdout.decode("utf-8"))
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Timed out getting version of {binary}.")
+            return self.message_unknown
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            logger.warning(f"{binary} not found or error getting version.")
+            return self.message_not_installed
+        if key and self.cache is not None:
+            self.cache.set(key, version)
+        return version
+
+    def _latest_version(self, name: str, url: str, parse) -> str:
+        """
+        Returns the latest version from a remote, cached for `latest_ttl`
+        seconds and behind a circuit breaker
+        """
+        key = f"latest/{name}"
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached and time.time() - cached["checked"] < self.latest_ttl:
+            return cached["version"]
+
+        breaker = self._breakers.setdefault(name, CircuitBreaker())
+        if not breaker.allow():
+            logger.debug(f"Skipping latest {name} version check, circuit open")
+            return cached["version"] if cached else self.message_unknown
+        try:
+            # Only the start of the document is needed
+            req = request.Request(url, headers={"Range": "bytes=0-65535"})
+            with request.urlopen(req, timeout=self.timeout) as response:
+                if response.status not in (200, 206):
+                    raise error.URLError(f"Error fetching {url}: {response.status}")
+                version = parse(response.read(65536).decode("utf-8", "ignore"))
+            if version is None:
+                raise ValueError(f"No version found in {url}")
         except Exception as e:  # pylint: disable=broad-except
-            logger.warning(f"Error fetching latest SSM Plugin version: {e}")
-        return self.message_unknown
+            breaker.failure()
+            logger.warning(f"Error fetching latest {name} version: {e}")
+            return cached["version"] if cached else self.message_unknown
+        breaker.success()
+        if self.cache is not None:
+            self.cache.set(key, {"version": version, "checked": time.time()})
+        return version
@@ -0,0 +1,101 @@
+"""
+Application event bus
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    Publishes application events to subscribers, such as the event stream.
+    """
+
+    def __init__(self, history=100, queue_size=100):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, **data) -> dict:
+        """
+        Publish an event to all subscribers
+        Args:
+            event_type (str): The type of the event
+            data: The event properties
+        Returns: The published event
+        """
+        with self._lock:
+            self._counter += 1
+            event = {
+                "id": self._counter,
+                "type": event_type,
+                "timestamp": time.time(),
+                **data,
+            }
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        logger.debug(f"Event: {event}")
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                logger.warning("Event subscriber is not keeping up, dropping event")
+        return event
+
+    def history(self, since: int = 0) -> list:
+        """
+        Get the recent events
+        Args:
+            since (int): Only return events with a greater id
+        Returns: A list of events
+        """
+        with self._lock:
+            return [event for event in self._history if event["id"] > since]
+
+    def subscribe(self) -> queue.Queue:
+        """
+        Subscribe to events
+        Returns: A queue receiving the published events
+        """
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        """
+        Unsubscribe from events
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, since: int = 0, keepalive=15):
+        """
+        Generate a server-sent event stream
+        Args:
+            since (int): Replay recent events with a greater id first
+            keepalive (int): Seconds between keepalive comments
+        Returns: A generator of server-sent event messages
+        """
+        subscriber = self.subscribe()
+        try:
+            for event in self.history(since) if since else []:
+                yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,228 @@
+"""
+Background jobs
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ssm_manager.utils import kill_process_tree
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when it has been cancelled.
+    """
+
+
+class Job:
+    """
+    A unit of work running on the job executor.
+    Progress is recorded as a list of steps, for session launches these are
+    spawned, pid, ready and failed.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, kind: str, on_change=None, **meta):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.meta = meta
+        self.status = "pending"
+        self.steps = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.process = None
+        self.pid = None
+        self.cancel_event = threading.Event()
+        self._finished = threading.Event()
+        self._on_change = on_change
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Return True if the job has been cancelled
+        """
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        """
+        Return True if the job has finished
+        """
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def step(self, name: str, **data) -> None:
+        """
+        Record a progress step
+        Raises: JobCancelled if the job has been cancelled
+        """
+        if self.cancelled:
+            raise JobCancelled(self.id)
+        self.steps.append({"step": name, "timestamp": time.time(), **data})
+        self._changed()
+
+    def progress(self, name: str, process=None, pid=None, **data) -> None:
+        """
+        Progress callback for run_cmd, keeps the process to cancel it later
+        Raises: JobCancelled if the job has been cancelled, after killing a
+            process that was started before the cancel could see it
+        """
+        if process is not None:
+            self.process = process
+        if pid is not None:
+            self.pid = pid
+            data["pid"] = pid
+        # cancel sets the event before reading the process, so one of the
+        # two always sees the other's write
+        if self.cancelled and (process is not None or pid is not None):
+            kill_process_tree([p for p in (pid, getattr(process, "pid", None)) if p])
+        self.step(name, **data)
+
+    def set_status(self, status: str, result=None, error=None) -> None:
+        """
+        Set the status of the job
+        """
+        self.status = status
+        self.result = result
+        self.error = error
+        if self.done:
+            self._finished.set()
+        self._changed()
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Wait for the job to finish
+        Returns: True if the job finished within the timeout
+        """
+        return self._finished.wait(timeout)
+
+    def to_dict(self) -> dict:
+        """
+        Return the job as a dict
+        """
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "steps": list(self.steps),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+            **self.meta,
+        }
+
+    def _changed(self) -> None:
+        """
+        Notify about a change
+        """
+        self.updated = time.time()
+        if self._on_change:
+            self._on_change(self)
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded worker pool and keeps their status for polling.
+    """
+
+    def __init__(self, max_workers=8, max_pending=32, history=100, events=None):
+        self.max_pending = max_pending
+        self.history = history
+        self.events = events
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func, *args, meta=None, **kwargs) -> Job:
+        """
+        Submit a job, `func` is called with the job as `job` keyword argument
+        Args:
+            kind (str): The kind of job, e.g. shell or rdp
+            func (callable): The function to run
+            meta (dict): Extra properties reported with the job
+        Returns: The submitted job
+        Raises: RuntimeError when too many jobs are pending
+        """
+        with self._lock:
+            pending = sum(not job.done for job in self._jobs.values())
+            if pending >= self.max_pending:
+                raise RuntimeError("Too many jobs pending")
+            job = Job(kind, on_change=self._publish, **(meta or {}))
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        Get a job by id
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancel a job and kill the process tree it started
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_event.set()
+        pids = [job.pid, job.process.pid if job.process else None]
+        kill_process_tree([pid for pid in pids if pid])
+        if job.status == "pending":
+            job.set_status("cancelled")
+        logger.info(f"Job cancelled: {job.id}")
+        return job
+
+    def _run(self, job: Job, func, args, kwargs) -> None:
+        """
+        Run a job and record its outcome
+        """
+        if job.cancelled:
+            return
+        job.set_status("running")
+        try:
+            result = func(*args, job=job, **kwargs)
+            if job.cancelled:
+                raise JobCancelled(job.id)
+            if hasattr(result, "model_dump"):
+                result = result.model_dump()
+            job.set_status("succeeded", result=result)
+        except JobCancelled:
+            job.set_status("cancelled")
+        except Exception as e:  # pylint: disable=broad-except
+            if job.cancelled:
+                job.set_status("cancelled")
+                return
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.steps.append({"step": "failed", "timestamp": time.time()})
+            job.set_status("failed", error=str(e))
+
+    def _prune(self) -> None:
+        """
+        Drop the oldest finished jobs past `history`
+        """
+        overflow = len(self._jobs) - self.history
+        if overflow <= 0:
+            return
+        for job_id in [i for i, j in self._jobs.items() if j.done][:overflow]:
+            del self._jobs[job_id]
+
+    def _publish(self, job: Job) -> None:
+        """
+        Publish the job status on the event bus
+        """
+        if self.events:
+            self.events.publish("job", job=job.to_dict())
@@ -0,0 +1,221 @@
+"""
+Connection lifecycle journal
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionJournal:
+    """
+    Append-only JSON lines journal of connection lifecycle events:
+    launched, ready, restarted and terminated.
+
+    The journal is replayed on startup to rebuild the active connections
+    and keeps a summary per connection for the session history. It is
+    compacted to one summary line per connection every `compact_every`
+    appended events.
+    """
+
+    EVENTS = ("launched", "ready", "restarted", "terminated")
+
+    def __init__(self, journal_file=None, compact_every=1000, max_history=500):
+        self.journal_file = Path(journal_file) if journal_file else None
+        self.compact_every = compact_every
+        self.max_history = max_history
+        self._summaries = OrderedDict()
+        self._states = {}
+        self._appended = 0
+        self._lock = threading.Lock()
+        self.replay()
+
+    def is_live(self, connection_id: str) -> bool:
+        """
+        Check if a connection is launched and not terminated
+        """
+        with self._lock:
+            return connection_id in self._states
+
+    def states(self) -> list:
+        """
+        Get the last recorded state of the live connections
+        Returns: A list of ConnectionState dicts
+        """
+        with self._lock:
+            return list(self._states.values())
+
+    def record(self, event: str, conn_state=None, connection_id=None) -> None:
+        """
+        Append a lifecycle event
+        Args:
+            event (str): launched, ready, restarted or terminated
+            conn_state (ConnectionState): The state of the connection
+            connection_id (str): The connection id when there is no state
+        """
+        if event not in self.EVENTS:
+            raise ValueError(f"Unknown journal event: {event}")
+        entry = {
+            "event": event,
+            "timestamp": time.time(),
+            "connection_id": connection_id or conn_state.connection_id,
+        }
+        if conn_state is not None and event != "terminated":
+            entry["state"] = conn_state.model_dump()
+
+        with self._lock:
+            self._apply(entry)
+            self._append(entry)
+            self._appended += 1
+            if self._appended >= self.compact_every:
+                self._compact()
+
+    def history(self, limit: int = 100) -> list:
+        """
+        Get the session history, most recent first
+        Args:
+            limit (int): Maximum number of sessions
+        Returns: A list of sessions with duration and restart count
+        """
+        now = time.time()
+        with self._lock:
+            summaries = list(self._summaries.values())[-limit:]
+        history = []
+        for summary in reversed(summaries):
+            ended = summary.get("ended")
+            history.append(
+                {
+                    **summary,
+                    "active": ended is None,
+                    "duration": round((ended or now) - summary["started"], 3),
+                }
+            )
+        return history
+
+    def replay(self) -> None:
+        """
+        Rebuild the summaries and live states from the journal file
+        """
+        if not self.journal_file or not self.journal_file.exists():
+            return
+        entries = 0
+        with self._lock:
+            try:
+                with open(self.journal_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            self._apply(json.loads(line))
+                            entries += 1
+                        except (ValueError, KeyError, TypeError):
+                            # A torn last line after a crash
+                            logger.warning("Skipping invalid journal line")
+            except OSError as e:
+                logger.error(f"Error reading connection journal: {str(e)}")
+                return
+            if entries > len(self._summaries):
+                self._compact()
+        logger.info(f"Replayed {entries} journal entries")
+
+    def compact(self) -> None:
+        """
+        Rewrite the journal with one summary line per connection
+        """
+        with self._lock:
+            self._compact()
+
+    def _apply(self, entry: dict) -> None:
+        """
+        Apply an entry to the summaries and live states, the lock must be held
+        """
+        connection_id = entry["connection_id"]
+        event = entry["event"]
+        if event == "summary":
+            self._summaries[connection_id] = entry["summary"]
+            if entry.get("state"):
+                self._states[connection_id] = entry["state"]
+            return
+
+        summary = self._summaries.get(connection_id)
+        if summary is None:
+            if event == "terminated":
+                return
+            summary = {
+                "connection_id": connection_id,
+                "started": entry["timestamp"],
+                "ended": None,
+                "ready": None,
+                "restarts": 0,
+            }
+            self._summaries[connection_id] = summary
+
+        state = entry.get("state")
+        if state:
+            self._states[connection_id] = state
+            summary.update(
+                name=state.get("name"),
+                type=state.get("type"),
+                profile=state.get("profile"),
+                local_port=state.get("local_port"),
+            )
+        if event == "ready" and summary["ready"] is None:
+            summary["ready"] = entry["timestamp"]
+        elif event == "restarted":
+            summary["restarts"] += 1
+        elif event == "terminated":
+            summary["ended"] = entry["timestamp"]
+            self._states.pop(connection_id, None)
+        self._trim()
+
+    def _trim(self) -> None:
+        """
+        Forget the oldest ended sessions past `max_history`
+        """
+        overflow = len(self._summaries) - self.max_history
+        if overflow <= 0:
+            return
+        ended = [i for i, s in self._summaries.items() if s.get("ended")]
+        for connection_id in ended[:overflow]:
+            del self._summaries[connection_id]
+
+    def _append(self, entry: dict) -> None:
+        """
+        Append an entry to the journal file, the lock must be held
+        """
+        if not self.journal_file:
+            return
+        try:
+            with open(self.journal_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.error(f"Error writing connection journal: {str(e)}")
+
+    def _compact(self) -> None:
+        """
+        Rewrite the journal atomically, the lock must be held
+        """
+        self._appended = 0
+        if not self.journal_file:
+            return
+        temp_file = self.journal_file.with_suffix(".tmp")
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                for connection_id, summary in self._summaries.items():
+                    entry = {
+                        "event": "summary",
+                        "connection_id": connection_id,
+                        "summary": summary,
+                    }
+                    if connection_id in self._states:
+                        entry["state"] = self._states[connection_id]
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(temp_file, self.journal_file)
+            logger.debug(f"Compacted journal to {len(self._summaries)} entries")
+        except OSError as e:
+            logger.error(f"Error compacting connection journal: {str(e)}")
@@ -3,7 +3,6 @@ Custom Logger
 """
 
 import logging
-from flask import jsonify
 
 
 class CustomLogger(logging.Logger):
@@ -24,15 +23,22 @@ class CustomLogger(logging.Logger):
         # You can customize the log level and format here
         self.log(logging.INFO, f"success: {msg}", *args, **kwargs)
 
-        # Return a Flask response
+        # Return a Flask response, Flask is only imported by the server
+        from flask import jsonify  # pylint: disable=import-outside-toplevel
+
         return jsonify({"status": "success", "message": msg}), 200
 
-    def failed(self, msg, *args, **kwargs):
+    def failed(self, msg, code=500, **kwargs):
         """
         Logs a 'failed' message with a custom format and returns a Flask response.
+        Args:
+            msg (str): The error message
+            code (int): The HTTP status code of the response
         """
         # Log the error
-        self.log(logging.ERROR, f"error: {msg}", *args, **kwargs)
+        self.log(logging.ERROR, f"error: {msg}", **kwargs)
 
         # Return a Flask response
-        return jsonify({"status": "error", "message": msg}), 500
+        from flask import jsonify  # pylint: disable=import-outside-toplevel
+
+        return jsonify({"status": "error", "message": msg}), code
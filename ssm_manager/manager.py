@@ -4,7 +4,6 @@ AWS Manager class to handle AWS connections and operations
 
 # pylint: disable=logging-fstring-interpolation
 import logging
-import boto3
 from botocore.exceptions import (
     ProfileNotFound,
     BotoCoreError,
@@ -21,7 +20,10 @@ class AWSManager:
     AWS Manager class to handle AWS connections and operations
     """
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(self):
+        self.session = None
         self.ssm_client = None
         self.ec2_client = None
         self.sts_client = None
@@ -37,7 +39,9 @@ class AWSManager:
         Returns:
             List of profile names or empty list if no profiles found
         """
-        # pylint: disable=protected-access
+        # pylint: disable=protected-access, import-outside-toplevel
+        import boto3
+
         profiles = []
         try:
             _profiles = boto3.Session().available_profiles
@@ -59,6 +63,8 @@ class AWSManager:
         Returns:
             List of region names or empty list if no regions found
         """
+        import boto3  # pylint: disable=import-outside-toplevel
+
         regions = []
         try:
             regions = boto3.Session().get_available_regions("ec2")
@@ -75,6 +81,8 @@ class AWSManager:
             profile (str): The AWS profile name
             region (str): The AWS region name
         """
+        import boto3  # pylint: disable=import-outside-toplevel
+
         self.is_connected = False
         try:
             aws_session = boto3.Session(profile_name=profile, region_name=region)
@@ -85,6 +93,7 @@ class AWSManager:
             account_info = self.sts_client.get_caller_identity()
             self.account_id = account_info["Account"]
 
+            self.session = aws_session
             self.profile = profile
             self.region = region
             self.is_connected = True
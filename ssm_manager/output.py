@@ -0,0 +1,258 @@
+"""
+Session output handling
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    Bounded byte buffer that keeps the most recent output.
+    Offsets are absolute, counted from the first byte ever written, so
+    readers can poll for new data with the offset returned by `read`.
+    """
+
+    def __init__(self, size=65536):
+        self.size = max(int(size), 1)
+        self._buffer = bytearray()
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> None:
+        """
+        Append data, dropping the oldest bytes when over size.
+        """
+        with self._lock:
+            self._written += len(data)
+            if len(data) >= self.size:
+                self._buffer = bytearray(data[-self.size :])
+                return
+            self._buffer += data
+            overflow = len(self._buffer) - self.size
+            if overflow > 0:
+                del self._buffer[:overflow]
+
+    def read(self, since: int | None = None, lines: int | None = None) -> tuple:
+        """
+        Read from the buffer.
+        Args:
+            since (int): Absolute offset to read from.
+            lines (int): Only return the last number of lines.
+        Returns:
+            tuple: The data and the offset to use for the next read.
+        """
+        with self._lock:
+            start = self._written - len(self._buffer)
+            offset = start if since is None else min(max(since, start), self._written)
+            data = bytes(self._buffer[offset - start :])
+            written = self._written
+        if lines is not None:
+            position = len(data) - 1 if data.endswith(b"\n") else len(data)
+            for _ in range(lines):
+                position = data.rfind(b"\n", 0, position)
+                if position < 0:
+                    break
+            data = data[position + 1 :] if lines > 0 else b""
+        return data, written
+
+
+class OutputPump:
+    """
+    Drains the stdout and stderr pipes of a process in the background so
+    that a chatty process never stalls on a full pipe buffer.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(
+        self,
+        process,
+        name="",
+        buffer_size=65536,
+        log_file=None,
+        log_max_bytes=0,
+        log_backups=0,
+    ):
+        self.process = process
+        self.name = str(name)
+        self.buffer = RingBuffer(buffer_size)
+        self.log_file = log_file
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self._log = None
+        self._lock = threading.Lock()
+        self._threads = []
+        self._open_pipes = 0
+
+    @property
+    def running(self) -> bool:
+        """
+        Return True while any of the pipes are still being read.
+        """
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """
+        Start a reader thread for each pipe of the process.
+        """
+        if self.log_file:
+            try:
+                self._log = open(self.log_file, "ab")  # pylint: disable=R1732
+            except OSError as e:
+                logger.warning(f"Unable to open session log {self.log_file}: {e}")
+        for pipe in (self.process.stdout, self.process.stderr):
+            if pipe is None:
+                continue
+            self._open_pipes += 1
+            thread = threading.Thread(
+                target=self._pump, args=(pipe,), name=f"output-{self.name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def read(self, since=None, lines=None) -> tuple:
+        """
+        Read buffered output, see `RingBuffer.read`.
+        """
+        return self.buffer.read(since=since, lines=lines)
+
+    def _pump(self, pipe):
+        """
+        Read a pipe until it is closed.
+        """
+        read = getattr(pipe, "read1", pipe.read)
+        try:
+            while True:
+                data = read(4096)
+                if not data:
+                    break
+                self._write(data)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Output pipe closed for {self.name}: {e}")
+        finally:
+            pipe.close()
+            with self._lock:
+                self._open_pipes -= 1
+                if self._log and self._open_pipes == 0:
+                    self._log.close()
+                    self._log = None
+
+    def _write(self, data: bytes):
+        """
+        Write data to the buffer and the session log.
+        """
+        with self._lock:
+            self.buffer.write(data)
+            if not self._log:
+                return
+            try:
+                self._log.write(data)
+                self._log.flush()
+                if self.log_max_bytes and self._log.tell() >= self.log_max_bytes:
+                    self._rotate()
+            except OSError as e:
+                logger.warning(f"Unable to write session log {self.log_file}: {e}")
+                self._log = None
+
+    def _rotate(self):
+        """
+        Rotate the session log, keeping `log_backups` old files.
+        """
+        self._log.close()
+        for index in range(self.log_backups - 1, 0, -1):
+            source = f"{self.log_file}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_file}.{index + 1}")
+        if self.log_backups > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        self._log = open(self.log_file, "wb")  # pylint: disable=R1732
+
+
+class OutputManager:
+    """
+    Keeps track of the output pumps of running sessions.
+    """
+
+    def __init__(self, log_dir=None, preferences=None, max_sessions=64):
+        self.log_dir = log_dir
+        self.preferences = preferences
+        self.max_sessions = max_sessions
+        self._pumps = {}
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self) -> dict:
+        """
+        Return the session output settings from preferences.
+        """
+        defaults = {
+            "buffer_kb": 64,
+            "log_files": False,
+            "log_max_kb": 1024,
+            "log_backups": 3,
+        }
+        if self.preferences and self.preferences.preferences:
+            return {**defaults, **self.preferences.preferences.get("sessions", {})}
+        return defaults
+
+    def attach(self, name, process) -> OutputPump:
+        """
+        Start draining the output of a process.
+        Args:
+            name (str): The name of the session, usually the connection id.
+            process (subprocess.Popen): The process to drain.
+        Returns:
+            OutputPump: The started output pump.
+        """
+        settings = self.settings
+        name = str(name)
+        log_file = None
+        if self.log_dir and settings["log_files"]:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+            log_file = os.path.join(self.log_dir, f"{safe_name}.log")
+        pump = OutputPump(
+            process,
+            name=name,
+            buffer_size=int(settings["buffer_kb"]) * 1024,
+            log_file=log_file,
+            log_max_bytes=int(settings["log_max_kb"]) * 1024,
+            log_backups=int(settings["log_backups"]),
+        ).start()
+        with self._lock:
+            self._pumps.pop(name, None)
+            self._pumps[name] = pump
+            self._prune()
+        return pump
+
+    def get(self, name) -> OutputPump | None:
+        """
+        Get the output pump for a session.
+        """
+        with self._lock:
+            return self._pumps.get(str(name))
+
+    def remove(self, name) -> None:
+        """
+        Forget the output pump for a session.
+        """
+        with self._lock:
+            self._pumps.pop(str(name), None)
+
+    def _prune(self):
+        """
+        Drop the oldest finished pumps when over `max_sessions`.
+        """
+        overflow = len(self._pumps) - self.max_sessions
+        if overflow <= 0:
+            return
+        for name in [n for n, p in self._pumps.items() if not p.running][:overflow]:
+            del self._pumps[name]
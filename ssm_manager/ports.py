@@ -0,0 +1,381 @@
+"""
+Local port allocation
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from ssm_manager.utils import ListeningSockets
+
+logger = logging.getLogger(__name__)
+
+
+class StickyPorts:
+    """
+    Persistent table of the last local port assigned to an
+    (instance name, remote host, remote port) so a reconnect gets the same
+    port back. Least recently used entries are evicted past `max_entries`
+    and entries expire after `max_age` seconds.
+    """
+
+    def __init__(self, leases_file=None, max_entries=256, max_age=30 * 86400):
+        self.leases_file = Path(leases_file) if leases_file else None
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._leases = OrderedDict()
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(name, remote_port: int, remote_host=None) -> str:
+        """
+        Build the lease key
+        """
+        return f"{name}|{remote_host or ''}|{int(remote_port)}"
+
+    @property
+    def stats(self) -> dict:
+        """
+        Return hit and miss statistics
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._leases),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    def get(self, name, remote_port: int, remote_host=None) -> int | None:
+        """
+        Get the last port assigned to a tunnel, the caller records whether
+        it could be reused with `record`
+        Returns: The port number or None if not known or expired
+        """
+        key = self.key(name, remote_port, remote_host)
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and time.time() - lease["timestamp"] <= self.max_age:
+                self._leases.move_to_end(key)
+                return lease["port"]
+            if lease:
+                del self._leases[key]
+            return None
+
+    def record(self, hit: bool) -> None:
+        """
+        Count a hit when the remembered port was allocated, otherwise a miss
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, name, remote_port: int, remote_host, port: int) -> None:
+        """
+        Remember the port assigned to a tunnel
+        """
+        key = self.key(name, remote_port, remote_host)
+        with self._lock:
+            self._leases[key] = {"port": int(port), "timestamp": time.time()}
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.max_entries:
+                self._leases.popitem(last=False)
+        self.save()
+
+    def discard_port(self, port: int, keep=None) -> None:
+        """
+        Forget every lease on a port except `keep`, the port now belongs to it
+        """
+        with self._lock:
+            for key in [k for k, v in self._leases.items() if v["port"] == port]:
+                if key != keep:
+                    del self._leases[key]
+
+    def load(self) -> None:
+        """
+        Load leases from file
+        """
+        if not self.leases_file or not self.leases_file.exists():
+            return
+        try:
+            with open(self.leases_file, "r", encoding="utf-8") as f:
+                leases = json.load(f)
+            now = time.time()
+            with self._lock:
+                self._leases = OrderedDict(
+                    (key, lease)
+                    for key, lease in sorted(
+                        leases.items(), key=lambda item: item[1]["timestamp"]
+                    )
+                    if now - lease["timestamp"] <= self.max_age
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Error loading port leases: {str(e)}")
+
+    def save(self) -> None:
+        """
+        Save leases to file
+        """
+        if not self.leases_file:
+            return
+        try:
+            with self._lock:
+                leases = dict(self._leases)
+            with open(self.leases_file, "w", encoding="utf-8") as f:
+                json.dump(leases, f, indent=2)
+        except OSError as e:
+            logger.error(f"Error saving port leases: {str(e)}")
+
+
+class PortAllocator:
+    """
+    Deterministic allocator over the configured local port range.
+
+    Every port in the range has a state in a byte map, leased and in use
+    preferred ports outside the range are kept in a dict. Ports are handed
+    out with a time-limited lease that is confirmed once the tunnel is up,
+    so concurrent requests never get the same port. A next-fit cursor keeps
+    allocation O(1) amortized.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    FREE = 0
+    PREFERRED = 1
+    LEASED = 2
+    IN_USE = 3
+
+    def __init__(self, preferences=None, lease_timeout=60, sticky=None):
+        self.preferences = preferences
+        self.lease_timeout = lease_timeout
+        self.sticky = sticky
+        self.start = None
+        self.end = None
+        self._states = bytearray()
+        self._outside = {}
+        self._preferred = frozenset()
+        self._leases = {}
+        self._expiry = []
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, name, remote_port: int, remote_host=None) -> int | None:
+        """
+        Lease a local port for a tunnel
+        Args:
+            name (str): The instance name
+            remote_port (int): The remote port
+            remote_host (str): The remote host
+        Returns: A leased port number or None if no port is available
+        """
+        return self.allocate_many([(name, remote_port, remote_host)])[0]
+
+    def allocate_many(self, tunnels: list) -> list:
+        """
+        Lease local ports for several tunnels in one pass
+        Args:
+            tunnels (list): Tuples of instance name, remote port and remote host
+        Returns: A list of leased port numbers, None where no port is available
+        """
+        sockets = ListeningSockets()
+        with self._lock:
+            self._sync()
+            self._expire()
+            return [
+                self._allocate(sockets, name, remote_port, remote_host)
+                for name, remote_port, remote_host in tunnels
+            ]
+
+    def _allocate(self, sockets, name, remote_port: int, remote_host=None):
+        """
+        Lease a local port for a tunnel, the lock must be held
+        """
+        preferred = None
+        if self.preferences:
+            preferred = self.preferences.get_instance_properties(
+                name, remote_port, remote_host
+            )
+        if preferred:
+            message = f"{remote_host} proxying via {name}" if remote_host else name
+            if self._state(preferred) in (self.LEASED, self.IN_USE):
+                logger.error(f"Preferred port {preferred} for {message} in use")
+                return None
+            if sockets.is_open(preferred):
+                logger.error(f"Preferred port {preferred} for {message} in use")
+                return None
+            logger.info(f"Using preferred local port {preferred} for {message}")
+            return self._lease(preferred)
+
+        if self.sticky:
+            port = self.sticky.get(name, remote_port, remote_host)
+            reusable = self._state(port) == self.FREE and not sockets.is_open(port)
+            self.sticky.record(hit=reusable)
+            if reusable:
+                logger.info(f"Reusing local port {port} for {name}")
+                self.sticky.set(name, remote_port, remote_host, port)
+                return self._lease(port)
+
+        size = len(self._states)
+        for _ in range(size):
+            index = self._cursor
+            self._cursor = (self._cursor + 1) % size
+            if self._states[index] != self.FREE:
+                continue
+            port = self.start + index
+            if sockets.is_open(port):
+                logger.debug(f"Port {port} is in use")
+                continue
+            logger.info(f"Found free port: {port}")
+            if self.sticky:
+                key = self.sticky.key(name, remote_port, remote_host)
+                self.sticky.discard_port(port, keep=key)
+                self.sticky.set(name, remote_port, remote_host, port)
+            return self._lease(port)
+        logger.error(f"No free port found in range {self.start}-{self.end}")
+        return None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Return allocation statistics
+        """
+        with self._lock:
+            self._expire()
+            stats = {
+                "start": self.start,
+                "end": self.end,
+                "free": self._states.count(self.FREE),
+                "preferred": self._states.count(self.PREFERRED),
+                "leased": self._states.count(self.LEASED),
+                "in_use": self._states.count(self.IN_USE),
+            }
+        if self.sticky:
+            stats["sticky"] = self.sticky.stats
+        return stats
+
+    def confirm(self, port: int) -> None:
+        """
+        Confirm a leased port once its tunnel is up
+        Args:
+            port (int): The leased port
+        """
+        with self._lock:
+            self._leases.pop(port, None)
+            self._set_state(port, self.IN_USE)
+
+    def release(self, port: int) -> None:
+        """
+        Release a leased or in use port
+        Args:
+            port (int): The port to release
+        """
+        if not port:
+            return
+        with self._lock:
+            self._leases.pop(port, None)
+            state = self.PREFERRED if port in self._preferred else self.FREE
+            self._set_state(port, state)
+
+    def _lease(self, port: int) -> int:
+        """
+        Lease a port until it is confirmed or the lease expires
+        """
+        expires = time.monotonic() + self.lease_timeout
+        self._leases[port] = expires
+        heapq.heappush(self._expiry, (expires, port))
+        self._set_state(port, self.LEASED)
+        return port
+
+    def _expire(self) -> None:
+        """
+        Return expired leases to the pool
+        """
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, port = heapq.heappop(self._expiry)
+            if self._leases.get(port) != expires:
+                continue
+            del self._leases[port]
+            logger.debug(f"Lease expired for port {port}")
+            state = self.PREFERRED if port in self._preferred else self.FREE
+            self._set_state(port, state)
+
+    def _in_range(self, port: int) -> bool:
+        """
+        Check if a port is inside the range
+        """
+        return (
+            port is not None
+            and self.start is not None
+            and self.start <= port <= self.end
+        )
+
+    def _state(self, port: int) -> int | None:
+        """
+        Get the state of a port, None when outside the range and not leased
+        or in use
+        """
+        if not self._in_range(port):
+            return self._outside.get(port)
+        return self._states[port - self.start]
+
+    def _set_state(self, port: int, state: int) -> None:
+        """
+        Set the state of a port, outside the range only leased and in use
+        ports are kept
+        """
+        if self._in_range(port):
+            self._states[port - self.start] = state
+        elif port is not None and state in (self.LEASED, self.IN_USE):
+            self._outside[port] = state
+        else:
+            self._outside.pop(port, None)
+
+    def _sync(self) -> None:
+        """
+        Rebuild the port map when the range or preferred ports change
+        """
+        start, end = 60000, 65535
+        preferred = frozenset()
+        if self.preferences:
+            port_range = self.preferences.preferences.get("port_range", {})
+            start = int(port_range.get("start", start))
+            end = int(port_range.get("end", end))
+            preferred = self.preferences.get_reserved_ports()
+
+        if (start, end) != (self.start, self.end):
+            active = {
+                port: self._state(port)
+                for port in range(self.start or 0, (self.end or -1) + 1)
+                if self._state(port) in (self.LEASED, self.IN_USE)
+            }
+            active.update(self._outside)
+            self.start, self.end = start, end
+            self._states = bytearray(max(end - start + 1, 0))
+            self._outside = {}
+            self._cursor = 0
+            for port in preferred:
+                self._set_state(port, self.PREFERRED)
+            for port, state in active.items():
+                self._set_state(port, state)
+            self._preferred = preferred
+            return
+
+        if preferred is not self._preferred and preferred != self._preferred:
+            for port in self._preferred - preferred:
+                if self._state(port) == self.PREFERRED:
+                    self._set_state(port, self.FREE)
+            for port in preferred - self._preferred:
+                if self._state(port) == self.FREE:
+                    self._set_state(port, self.PREFERRED)
+            self._preferred = preferred
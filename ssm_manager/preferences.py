@@ -3,8 +3,11 @@ Application preferences handler
 """
 
 # pylint: disable=logging-fstring-interpolation
+import os
+import copy
 import logging
 import json
+import threading
 from pathlib import Path
 import keyring
 
@@ -12,9 +15,17 @@ logger = logging.getLogger(__name__)
 
 
 class PreferencesHandler:
-    """Handler for application preferences"""
+    """
+    Handler for application preferences.
 
-    # pylint: disable=line-too-long
+    The preferences in memory are authoritative. Changes mark them dirty and
+    are written with a debounced, atomic replace of the file. The file is
+    only read again when its mtime changed, for example after an external
+    edit. Port mapping lookups use indexes rebuilt whenever the preferences
+    change.
+    """
+
+    # pylint: disable=line-too-long, too-many-instance-attributes
 
     DEFAULT_PREFERENCES = {
         "server": {"port": 5000},
@@ -23,93 +34,166 @@ class PreferencesHandler:
         "regions": [],
         "instances": [],
         "credentials": [],
+        "tunnel_groups": [],
         "port_forwarding": {"mode": "local", "remote_port": 1433, "remote_host": ""},
+        "sessions": {
+            "buffer_kb": 64,
+            "log_files": False,
+            "log_max_kb": 1024,
+            "log_backups": 3,
+            "max_restarts": 5,
+            "restart_delay": 1,
+            "restart_max_delay": 60,
+            "proxy": False,
+            "terminate_on_exit": False,
+        },
+        "cache": {"backend": "filesystem", "namespaces": {}},
     }
 
-    def __init__(self, config_file="preferences.json"):
+    def __init__(self, config_file="preferences.json", delay=0.5):
         """Initialize preferences handler"""
         self.config_file = Path(config_file)
+        self.delay = delay
         self.preferences = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._mtime = None
+        self._timer = None
+        self._port_index = {}
+        self._reserved_ports = frozenset()
+        self._instance_index = {}
         self.load_preferences()
         self.apply_preferences()
 
+    @property
+    def dirty(self):
+        """Whether there are changes not written to the file yet"""
+        return self._dirty
+
     def load_preferences(self):
         """Load preferences from file or create default if not exists"""
-        try:
-            if self.config_file.exists():
-                with open(self.config_file, "r", encoding="utf-8") as f:
-                    loaded_prefs = json.load(f)
-                    self.preferences = {**self.DEFAULT_PREFERENCES, **loaded_prefs}
-                if loaded_prefs != self.preferences:
-                    self.save_preferences(self.preferences)
-            else:
-                self.save_preferences(self.DEFAULT_PREFERENCES)
-        except Exception as e:  # pylint: disable=broad-except
-            logger.error(f"Error loading preferences: {str(e)}")
+        with self._lock:
+            try:
+                if self.config_file.exists():
+                    mtime = self.config_file.stat().st_mtime_ns
+                    with open(self.config_file, "r", encoding="utf-8") as f:
+                        loaded_prefs = json.load(f)
+                    self.preferences = {
+                        **copy.deepcopy(self.DEFAULT_PREFERENCES),
+                        **loaded_prefs,
+                    }
+                    self._mtime = mtime
+                    self._build_indexes()
+                    if loaded_prefs != self.preferences:
+                        self._mark_dirty()
+                else:
+                    self.preferences = copy.deepcopy(self.DEFAULT_PREFERENCES)
+                    self._build_indexes()
+                    self._dirty = True
+                    self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error loading preferences: {str(e)}")
+                if self.preferences is None:
+                    self.preferences = copy.deepcopy(self.DEFAULT_PREFERENCES)
+                    self._build_indexes()
 
     def reload_preferences(self):
-        """Reload preferences from file"""
-        self.load_preferences()
+        """
+        Reload preferences from file when it was changed on disk
+        Returns: True when the preferences were reloaded
+        """
+        with self._lock:
+            if self._dirty or self._file_mtime() == self._mtime:
+                return False
+            self.load_preferences()
         self.apply_preferences()
+        logger.info("Preferences reloaded from file")
+        return True
 
     def update_instance_preferences(self, instance_name, new_preferences):
         """Update preferences for a specific instance"""
         try:
-            prefs = self.preferences.copy()
-            updated = False
-            for pref in prefs.get("instances", []):
-                if pref.get("name") == instance_name:
-                    pref.update(new_preferences)
-                    updated = True
-                    break
-            if not updated:
-                new_instance = {"name": instance_name, **new_preferences}
-                prefs["instances"].append(new_instance)
-            prefs["instances"] = new_preferences.get("instances", prefs["instances"])
-            if self.save_preferences(prefs):
-                return True
+            with self._lock:
+                prefs = copy.deepcopy(self.preferences)
+                position = self._instance_index.get(instance_name)
+                if position is not None:
+                    prefs["instances"][position].update(new_preferences)
+                else:
+                    new_instance = {"name": instance_name, **new_preferences}
+                    prefs["instances"].append(new_instance)
+                prefs["instances"] = new_preferences.get(
+                    "instances", prefs["instances"]
+                )
+                if self.save_preferences(prefs):
+                    return True
         except Exception as e:  # pylint: disable=broad-except
             logger.error(f"Error updating instance preferences: {str(e)}")
         return False
 
+    def update_tunnel_group(self, name, tunnels):
+        """Add or replace a tunnel group"""
+        try:
+            with self._lock:
+                prefs = copy.deepcopy(self.preferences)
+                groups = [
+                    g for g in prefs.get("tunnel_groups", []) if g.get("name") != name
+                ]
+                groups.append({"name": name, "tunnels": tunnels})
+                prefs["tunnel_groups"] = groups
+                if self.save_preferences(prefs):
+                    return True
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Error updating tunnel group: {str(e)}")
+        return False
+
     def update_preferences(self, new_preferences):
         """Update preferences with new values"""
         try:
-            prefs = self.preferences.copy()
-            prefs["server"] = new_preferences.get("server", prefs["server"])
-            prefs["port_range"] = new_preferences.get("port_range", prefs["port_range"])
-            prefs["logging"] = new_preferences.get("logging", prefs["logging"])
-            prefs["regions"] = new_preferences.get("regions", prefs["regions"])
-            prefs["instances"] = new_preferences.get("instances", prefs["instances"])
-            prefs["port_forwarding"] = new_preferences.get(
-                "port_forwarding", prefs["port_forwarding"]
-            )
-            prefs["credentials"] = [
-                {"username": cred.get("username")}
-                for cred in new_preferences.get("credentials", prefs["credentials"])
-                if cred.get("username")
-            ]
-            usernames = [cred.get("username") for cred in prefs["credentials"]]
-            credentials_to_delete = [
-                cred.get("username")
-                for cred in new_preferences.get("credentials_to_delete", [])
-            ]
-
-            for cred in self.preferences.get("credentials", []):
-                if cred.get("username") not in usernames:
-                    credentials_to_delete.append(cred.get("username"))
-
-            if not self.delete_credentials(credentials_to_delete):
-                logger.warning("Failed to delete one or more credentials")
-                return False
-            if not self.save_credentials(
-                new_preferences.get("credentials", prefs["credentials"])
-            ):
-                logger.warning("Failed to update credentials")
-                return False
-            if self.save_preferences(prefs):
-                logger.info("Preferences updated successfully")
-                return True
+            with self._lock:
+                prefs = copy.deepcopy(self.preferences)
+                prefs["server"] = new_preferences.get("server", prefs["server"])
+                prefs["port_range"] = new_preferences.get(
+                    "port_range", prefs["port_range"]
+                )
+                prefs["logging"] = new_preferences.get("logging", prefs["logging"])
+                prefs["regions"] = new_preferences.get("regions", prefs["regions"])
+                prefs["instances"] = new_preferences.get(
+                    "instances", prefs["instances"]
+                )
+                prefs["port_forwarding"] = new_preferences.get(
+                    "port_forwarding", prefs["port_forwarding"]
+                )
+                prefs["sessions"] = new_preferences.get("sessions", prefs["sessions"])
+                prefs["cache"] = new_preferences.get("cache", prefs["cache"])
+                prefs["tunnel_groups"] = new_preferences.get(
+                    "tunnel_groups", prefs["tunnel_groups"]
+                )
+                prefs["credentials"] = [
+                    {"username": cred.get("username")}
+                    for cred in new_preferences.get("credentials", prefs["credentials"])
+                    if cred.get("username")
+                ]
+                usernames = [cred.get("username") for cred in prefs["credentials"]]
+                credentials_to_delete = [
+                    cred.get("username")
+                    for cred in new_preferences.get("credentials_to_delete", [])
+                ]
+
+                for cred in self.preferences.get("credentials", []):
+                    if cred.get("username") not in usernames:
+                        credentials_to_delete.append(cred.get("username"))
+
+                if not self.delete_credentials(credentials_to_delete):
+                    logger.warning("Failed to delete one or more credentials")
+                    return False
+                if not self.save_credentials(
+                    new_preferences.get("credentials", prefs["credentials"])
+                ):
+                    logger.warning("Failed to update credentials")
+                    return False
+                if self.save_preferences(prefs):
+                    logger.info("Preferences updated successfully")
+                    return True
         except Exception as e:  # pylint: disable=broad-except
             logger.error(f"Error updating preferences: {str(e)}")
         return False
@@ -153,16 +237,71 @@ class PreferencesHandler:
         return True
 
     def save_preferences(self, preferences):
-        """Save preferences to file"""
+        """
+        Replace the preferences in memory and schedule writing them to file
+        """
         try:
-            with open(self.config_file, "w", encoding="utf-8") as f:
-                json.dump(preferences, f, indent=2)
-            self.reload_preferences()
+            with self._lock:
+                previous = self.preferences or {}
+                prefs = {**copy.deepcopy(self.DEFAULT_PREFERENCES), **preferences}
+                if prefs == previous:
+                    return True
+                self.preferences = prefs
+                self._build_indexes()
+                self._mark_dirty()
+            if prefs.get("logging") != previous.get("logging"):
+                self.apply_preferences()
             return True
         except Exception as e:  # pylint: disable=broad-except
             logger.error(f"Error saving preferences: {str(e)}")
         return False
 
+    def flush(self):
+        """
+        Write pending changes to file now, atomically
+        Returns: True when the file is up to date
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            temp_file = self.config_file.with_suffix(".tmp")
+            try:
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    json.dump(self.preferences, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.config_file)
+                self._mtime = self._file_mtime()
+                self._dirty = False
+                logger.debug(f"Preferences written to {self.config_file}")
+                return True
+            except OSError as e:
+                logger.error(f"Error writing preferences: {str(e)}")
+        return False
+
+    def _mark_dirty(self):
+        """
+        Mark the preferences as changed and schedule a write, coalescing
+        changes within `delay`, the lock must be held
+        """
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _file_mtime(self):
+        """
+        Get the modification time of the preferences file
+        """
+        try:
+            return self.config_file.stat().st_mtime_ns
+        except OSError:
+            return None
+
     def apply_preferences(self):
         """Apply current preferences to application"""
         try:
@@ -177,32 +316,61 @@ class PreferencesHandler:
             logging.getLogger("ssm_manager").setLevel(numeric_level)
             logging.getLogger("ssm_manager.preferences").setLevel(numeric_level)
             logging.getLogger("ssm_manager.manager").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.cache").setLevel(numeric_level)
             logging.getLogger("ssm_manager.config").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.credentials").setLevel(numeric_level)
             logging.getLogger("ssm_manager.deps").setLevel(numeric_level)
             logging.getLogger("ssm_manager.utils").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.watcher").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.output").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.ports").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.events").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.jobs").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.journal").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.supervisor").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.proxy").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.registry").setLevel(numeric_level)
+            logging.getLogger("ssm_manager.sso").setLevel(numeric_level)
         except Exception as e:  # pylint: disable=broad-except
             logger.error(f"Error applying preferences: {str(e)}")
 
+    def _build_indexes(self):
+        """
+        Rebuild the port mapping indexes, the lock must be held
+        """
+        port_index = {}
+        reserved_ports = set()
+        instance_index = {}
+        for position, instance in enumerate(self.preferences.get("instances", [])):
+            name = instance.get("name")
+            instance_index.setdefault(name, position)
+            for port in instance.get("ports", []):
+                try:
+                    remote_port = int(port.get("remote_port"))
+                    local_port = int(port.get("local_port"))
+                except (TypeError, ValueError):
+                    logger.warning(f"Skipping invalid port mapping of {name}")
+                    continue
+                # The first mapping wins, with or without a remote host
+                port_index.setdefault((name, remote_port, None), local_port)
+                remote_host = port.get("remote_host") or None
+                port_index.setdefault((name, remote_port, remote_host), local_port)
+                reserved_ports.add(local_port)
+        self._port_index = port_index
+        self._reserved_ports = frozenset(reserved_ports)
+        self._instance_index = instance_index
+
     def get_used_ports(self):
         """Get list of all used local ports"""
-        used_ports = []
-        for instance in self.preferences.get("instances", []):
-            for port in instance.get("ports", []):
-                used_ports.append(int(port.get("local_port")))
-        return used_ports
+        return list(self._reserved_ports)
+
+    def get_reserved_ports(self):
+        """Get the set of local ports reserved by port mappings"""
+        return self._reserved_ports
 
     def get_instance_properties(self, name, remote_port: int, remote_host=None):
         """Get properties for specific instance"""
-        for instance in self.preferences.get("instances", []):
-            if instance.get("name") != name:
-                continue
-            for port in instance.get("ports", []):
-                if int(port.get("remote_port")) != remote_port:
-                    continue
-                if remote_host and port.get("remote_host") != remote_host:
-                    continue
-                return int(port.get("local_port"))
-        return None
+        return self._port_index.get((name, int(remote_port), remote_host or None))
 
     def get_port_range(self, name, remote_port: int, remote_host=None):
         """Get port range for free port finder"""
@@ -216,6 +384,12 @@ class PreferencesHandler:
         )
         return port_range["start"], port_range["end"]
 
+    def get_tunnel_groups(self):
+        """Get saved tunnel groups"""
+        return self.preferences.get(
+            "tunnel_groups", self.DEFAULT_PREFERENCES["tunnel_groups"]
+        )
+
     def get_regions(self):
         """Get regions for AWS services"""
         regions = self.preferences.get("regions", self.DEFAULT_PREFERENCES["regions"])
@@ -0,0 +1,257 @@
+"""
+Local TCP front proxy for port forwarding sessions
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import os
+import socket
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TunnelProxy:
+    """
+    Holds the user facing local port of a tunnel and forwards every client
+    connection to the internal port the SSM session listens on. While the
+    session is restarted, new connections wait for the internal port to
+    come back instead of being refused.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, listen_port, target_port, connect_timeout=30, buffer_size=65536):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.connect_timeout = connect_timeout
+        self.buffer_size = buffer_size
+        self.active = 0
+        self.connections = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._sock = None
+        self._accept_task = None
+        self._tasks = set()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Return the proxy statistics
+        """
+        return {
+            "listen_port": self.listen_port,
+            "target_port": self.target_port,
+            "active": self.active,
+            "connections": self.connections,
+            "failed": self.failed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+    async def start(self) -> None:
+        """
+        Bind the listen port and start accepting connections
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name != "nt":
+                # On Windows SO_REUSEADDR allows binding a port already in use
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", self.listen_port))
+            sock.listen(128)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._accept_task = asyncio.get_running_loop().create_task(self._accept())
+        logger.info(f"Proxy listening on {self.listen_port} -> {self.target_port}")
+
+    async def stop(self) -> None:
+        """
+        Close the listen port and all client connections
+        """
+        tasks = [self._accept_task, *self._tasks] if self._accept_task else []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        logger.info(f"Proxy stopped on {self.listen_port}")
+
+    async def _accept(self) -> None:
+        """
+        Accept client connections
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            client, _ = await loop.sock_accept(self._sock)
+            client.setblocking(False)
+            task = loop.create_task(self._handle(client))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _connect(self) -> socket.socket:
+        """
+        Connect to the internal port, waiting while the session restarts
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            backend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            backend.setblocking(False)
+            try:
+                await loop.sock_connect(backend, ("127.0.0.1", self.target_port))
+                return backend
+            except OSError:
+                backend.close()
+                if loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(0.25)
+
+    async def _handle(self, client: socket.socket) -> None:
+        """
+        Forward a client connection in both directions
+        """
+        self.active += 1
+        self.connections += 1
+        backend = None
+        try:
+            backend = await self._connect()
+            pipes = {
+                asyncio.ensure_future(self._pipe(client, backend, "bytes_out")),
+                asyncio.ensure_future(self._pipe(backend, client, "bytes_in")),
+            }
+            try:
+                done, pending = await asyncio.wait(
+                    pipes, return_when=asyncio.FIRST_EXCEPTION
+                )
+            finally:
+                for task in pipes:
+                    task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                if not task.cancelled() and task.exception():
+                    logger.debug(f"Proxy connection error: {task.exception()}")
+        except OSError as e:
+            self.failed += 1
+            logger.warning(f"Proxy could not reach port {self.target_port}: {e}")
+        finally:
+            self.active -= 1
+            client.close()
+            if backend:
+                backend.close()
+
+    async def _pipe(self, source, target, counter: str) -> None:
+        """
+        Copy data from source to target through a reused buffer
+        """
+        loop = asyncio.get_running_loop()
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        while True:
+            size = await loop.sock_recv_into(source, buffer)
+            if not size:
+                break
+            await loop.sock_sendall(target, view[:size])
+            setattr(self, counter, getattr(self, counter) + size)
+        try:
+            target.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class ProxyManager:
+    """
+    Runs the tunnel proxies on a single event loop in a background thread.
+    """
+
+    def __init__(self, preferences=None, connect_timeout=30):
+        self.preferences = preferences
+        self.connect_timeout = connect_timeout
+        self._proxies = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Return True if new tunnels should be started behind a proxy
+        """
+        if self.preferences and self.preferences.preferences:
+            return bool(self.preferences.preferences.get("sessions", {}).get("proxy"))
+        return False
+
+    @property
+    def stats(self) -> list:
+        """
+        Return the statistics of all proxies
+        """
+        with self._lock:
+            return [
+                {"connection_id": name, **proxy.stats}
+                for name, proxy in self._proxies.items()
+            ]
+
+    @staticmethod
+    def internal_port() -> int:
+        """
+        Get an ephemeral port for the SSM session behind a proxy
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def start(self, name: str, listen_port: int, target_port: int) -> TunnelProxy:
+        """
+        Start a proxy for a tunnel
+        Args:
+            name (str): The connection id
+            listen_port (int): The user facing local port
+            target_port (int): The port the SSM session listens on
+        Returns: The started proxy
+        """
+        proxy = TunnelProxy(
+            listen_port, target_port, connect_timeout=self.connect_timeout
+        )
+        asyncio.run_coroutine_threadsafe(proxy.start(), self._get_loop()).result()
+        with self._lock:
+            self._proxies[name] = proxy
+        return proxy
+
+    def stop(self, name: str) -> None:
+        """
+        Stop the proxy of a tunnel
+        """
+        with self._lock:
+            proxy = self._proxies.pop(name, None)
+        if proxy and self._loop:
+            asyncio.run_coroutine_threadsafe(proxy.stop(), self._loop).result()
+
+    def apply(self, conn_state) -> None:
+        """
+        Show the user facing port on a scanned connection state
+        """
+        with self._lock:
+            proxies = list(self._proxies.values())
+        for proxy in proxies:
+            if conn_state.local_port == proxy.target_port:
+                conn_state.tunnel_port = proxy.target_port
+                conn_state.local_port = proxy.listen_port
+                return
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Get the proxy event loop, starting it on first use
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="proxy", daemon=True
+                ).start()
+            return self._loop
@@ -0,0 +1,287 @@
+"""
+Active connection registry
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import logging
+import threading
+from collections import deque
+import psutil
+from ssm_manager.utils import ConnectionState
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionRegistry:
+    """
+    In-memory index of the active connections by connection id, with
+    secondary indexes by PID and local port.
+
+    Every mutation bumps a version and is kept in a bounded change log, so
+    clients can ask for the changes since the version they last saw.
+    Mutations are snapshotted to the cache with a debounced write-behind,
+    so the registry survives a crash without a disk write per change. With a
+    journal, new and removed connections are recorded in it and the
+    registry is rebuilt from it on startup.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(
+        self,
+        cache=None,
+        key="active_connections",
+        delay=1.0,
+        history=1000,
+        journal=None,
+    ):
+        self.cache = cache
+        self.journal = journal
+        self.key = key
+        self.delay = delay
+        self.version = 0
+        self._changes = deque(maxlen=history)
+        self._connections = {}
+        self._by_pid = {}
+        self._by_port = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self.load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def __contains__(self, connection_id: str) -> bool:
+        with self._lock:
+            return connection_id in self._connections
+
+    def all(self) -> list:
+        """
+        Get all connections
+        Returns: A list of ConnectionState objects
+        """
+        with self._lock:
+            return list(self._connections.values())
+
+    def get(self, connection_id: str):
+        """
+        Get a connection by id
+        Returns: The ConnectionState or None if not found
+        """
+        with self._lock:
+            return self._connections.get(str(connection_id))
+
+    def by_pid(self, pid: int):
+        """
+        Get a connection by PID
+        Returns: The ConnectionState or None if not found
+        """
+        with self._lock:
+            return self._connections.get(self._by_pid.get(pid))
+
+    def by_port(self, port: int):
+        """
+        Get a connection by local port
+        Returns: The ConnectionState or None if not found
+        """
+        with self._lock:
+            return self._connections.get(self._by_port.get(port))
+
+    def pids(self) -> set:
+        """
+        Get the PIDs of all connections
+        """
+        with self._lock:
+            return set(self._by_pid)
+
+    def add(self, conn) -> None:
+        """
+        Add a connection, replacing one with the same id
+        Args:
+            conn (ConnectionState): The connection
+        """
+        with self._lock:
+            exists = conn.connection_id in self._connections
+            self._add(conn)
+            self._record(conn.connection_id, "updated" if exists else "added")
+        if self.journal and not self.journal.is_live(conn.connection_id):
+            self.journal.record("launched", conn)
+        self._schedule()
+
+    def update(self, connection_id: str, **properties):
+        """
+        Update the properties of a connection
+        Returns: The updated ConnectionState or None if not found
+        """
+        with self._lock:
+            conn = self._connections.get(connection_id)
+            if conn is None:
+                return None
+            conn = conn.model_copy(update=properties)
+            self._add(conn)
+            self._record(connection_id, "updated")
+        self._schedule()
+        return conn
+
+    def remove(self, connection_id: str):
+        """
+        Remove a connection
+        Returns: The removed ConnectionState or None if not found
+        """
+        return (self.remove_many([connection_id]) or [None])[0]
+
+    def remove_many(self, connection_ids: list) -> list:
+        """
+        Remove several connections with a single snapshot write
+        Returns: The removed ConnectionState objects
+        """
+        with self._lock:
+            removed = [self._remove(str(i)) for i in connection_ids]
+            removed = [conn for conn in removed if conn is not None]
+            for conn in removed:
+                self._record(conn.connection_id, "removed")
+        for conn in removed:
+            if self.journal:
+                self.journal.record("terminated", connection_id=conn.connection_id)
+        if removed:
+            self._schedule()
+        return removed
+
+    def changes(self, since: int = 0) -> dict:
+        """
+        Get the changes after a version
+        Args:
+            since (int): The version the client last saw
+        Returns: The current version, the added and updated ConnectionState
+            objects and the removed connection ids. When the changes since
+            the version are no longer known, reset is True and every
+            connection is returned as added.
+        """
+        with self._lock:
+            oldest = self._changes[0][0] if self._changes else self.version + 1
+            if since > self.version or since < oldest - 1:
+                return {
+                    "version": self.version,
+                    "reset": True,
+                    "added": list(self._connections.values()),
+                    "updated": [],
+                    "removed": [],
+                }
+
+            first = {}
+            for version, connection_id, kind in self._changes:
+                if version > since:
+                    first.setdefault(connection_id, kind)
+            changes = {
+                "version": self.version,
+                "reset": False,
+                "added": [],
+                "updated": [],
+                "removed": [],
+            }
+            for connection_id, kind in first.items():
+                conn = self._connections.get(connection_id)
+                if conn is not None:
+                    changes["added" if kind == "added" else "updated"].append(conn)
+                elif kind != "added":
+                    changes["removed"].append(connection_id)
+            return changes
+
+    def _record(self, connection_id: str, kind: str) -> None:
+        """
+        Record a change, the lock must be held
+        """
+        self.version += 1
+        self._changes.append((self.version, connection_id, kind))
+
+    def _add(self, conn) -> None:
+        """
+        Add a connection to the indexes, the lock must be held
+        """
+        self._remove(conn.connection_id)
+        self._connections[conn.connection_id] = conn
+        if conn.pid:
+            self._by_pid[conn.pid] = conn.connection_id
+        if conn.local_port:
+            self._by_port[conn.local_port] = conn.connection_id
+
+    def _remove(self, connection_id: str):
+        """
+        Remove a connection from the indexes, the lock must be held
+        """
+        conn = self._connections.pop(connection_id, None)
+        if conn is None:
+            return None
+        if self._by_pid.get(conn.pid) == connection_id:
+            del self._by_pid[conn.pid]
+        if self._by_port.get(conn.local_port) == connection_id:
+            del self._by_port[conn.local_port]
+        return conn
+
+    def load(self) -> None:
+        """
+        Load the connections from the journal, or the cache snapshot
+        """
+        if self.journal:
+            connections = self._load_journal()
+        elif self.cache is not None:
+            try:
+                connections = self.cache.get(self.key) or []
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error loading active connections: {str(e)}")
+                return
+        else:
+            return
+        with self._lock:
+            for conn in connections:
+                self._add(conn)
+                self._record(conn.connection_id, "added")
+        logger.debug(f"Loaded {len(connections)} active connections")
+
+    def _load_journal(self) -> list:
+        """
+        Rebuild the connections from the journal, only checking the
+        recorded PIDs are still running
+        """
+        connections = []
+        for state in self.journal.states():
+            try:
+                conn = ConnectionState.model_validate(state)
+                process = psutil.Process(conn.pid)
+                if "start-session" in process.cmdline():
+                    connections.append(conn)
+                    continue
+            except (psutil.NoSuchProcess, psutil.AccessDenied, ValueError):
+                pass
+            self.journal.record("terminated", connection_id=state["connection_id"])
+        return connections
+
+    def flush(self) -> None:
+        """
+        Write the snapshot to the cache now
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            connections = list(self._connections.values())
+        if self.cache is None:
+            return
+        try:
+            self.cache.set(self.key, connections)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Error saving active connections: {str(e)}")
+
+    def _schedule(self) -> None:
+        """
+        Schedule a snapshot write, coalescing changes within `delay`
+        """
+        with self._lock:
+            if self._timer:
+                return
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
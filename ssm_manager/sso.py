@@ -0,0 +1,252 @@
+"""
+AWS SSO token cache and login
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import re
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from botocore.exceptions import BotoCoreError
+from ssm_manager.utils import SSOCommand, run_cmd
+
+logger = logging.getLogger(__name__)
+
+
+class SSOManager:
+    """
+    Reads the SSO token cache of the AWS CLI and runs SSO logins.
+    Logins are serialized per SSO session, so profiles sharing a session
+    are satisfied by a single browser flow. The profile configuration is
+    parsed once and kept until invalidated.
+    """
+
+    def __init__(self, system: str, cache_dir=None):
+        self.system = system
+        self.cache_dir = Path(cache_dir or Path.home() / ".aws" / "sso" / "cache")
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._profiles = None
+
+    def invalidate(self) -> None:
+        """
+        Forget the parsed profile configuration
+        """
+        with self._lock:
+            self._profiles = None
+
+    def session_key(self, profile: str) -> str | None:
+        """
+        Get the SSO session a profile logs in with
+        Args:
+            profile (str): The AWS profile name
+        Returns: The sso_session name, the legacy sso_start_url or None
+            if the profile does not use SSO
+        """
+        # pylint: disable=protected-access
+        with self._lock:
+            profiles = self._profiles
+        if profiles is None:
+            import boto3  # pylint: disable=import-outside-toplevel
+
+            try:
+                profiles = boto3.Session()._session.full_config["profiles"]
+            except BotoCoreError as e:
+                logger.error(f"Error reading profile {profile}: {str(e)}")
+                return None
+            with self._lock:
+                self._profiles = profiles
+        config = profiles.get(profile, {})
+        return config.get("sso_session") or config.get("sso_start_url")
+
+    def token(self, profile: str) -> dict | None:
+        """
+        Read the cached SSO token of a profile
+        Args:
+            profile (str): The AWS profile name
+        Returns: The cached token or None if not found
+        """
+        key = self.session_key(profile)
+        if not key:
+            return None
+        return self.session_token(key)
+
+    def session_token(self, key: str) -> dict | None:
+        """
+        Read the cached SSO token of an SSO session
+        Args:
+            key (str): The sso_session name or the legacy sso_start_url
+        Returns: The cached token or None if not found
+        """
+        cache_file = self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading SSO token cache {cache_file}: {str(e)}")
+            return None
+
+    def expires_at(self, profile: str) -> datetime | None:
+        """
+        Get the expiry of the cached SSO token of a profile
+        Args:
+            profile (str): The AWS profile name
+        Returns: The expiry as an aware datetime or None if there is no token
+        """
+        return self._expiry(self.token(profile))
+
+    @staticmethod
+    def _expiry(token: dict | None) -> datetime | None:
+        """
+        Get the expiry of a cached SSO token
+        """
+        if not token or not token.get("expiresAt"):
+            return None
+        expires = token["expiresAt"].replace("UTC", "+00:00").replace("Z", "+00:00")
+        try:
+            expires_at = datetime.fromisoformat(expires)
+        except ValueError:
+            logger.error(f"Invalid SSO token expiry: {token['expiresAt']}")
+            return None
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at
+
+    def is_valid(self, profile: str, margin=60) -> bool:
+        """
+        Check if the cached SSO token of a profile is valid
+        Args:
+            profile (str): The AWS profile name
+            margin (int): Seconds the token must still be valid for
+        Returns: True if the token is valid
+        """
+        expires_at = self.expires_at(profile)
+        if expires_at is None:
+            return False
+        return (expires_at - datetime.now(timezone.utc)).total_seconds() > margin
+
+    def login(self, profile: str, region: str, job=None) -> bool:
+        """
+        Run the SSO login of a profile, unless another profile of the same
+        SSO session logged in meanwhile
+        Args:
+            profile (str): The AWS profile name
+            region (str): The AWS region name
+            job (Job): The job reporting progress
+        Returns: True if the SSO token is valid after the login
+        """
+        key = self.session_key(profile) or profile
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if self.is_valid(profile):
+                logger.info(f"SSO session already logged in: {key}")
+                return True
+            logger.info(f"Starting SSO login with profile: {profile}")
+            command = SSOCommand(
+                region=region,
+                profile=profile,
+                system=self.system,
+                action="login",
+                timeout=60,
+            )
+            run_cmd(
+                command,
+                progress=job.progress if job else None,
+                cancelled=job.cancel_event if job else None,
+            )
+            return self.is_valid(profile)
+
+    @staticmethod
+    def _sso_client(sso_region: str):
+        """
+        Create an unsigned SSO client, the requests carry the access token
+        """
+        # pylint: disable=import-outside-toplevel
+        import boto3
+        from botocore import UNSIGNED
+        from botocore.config import Config
+
+        return boto3.session.Session().client(
+            "sso", region_name=sso_region, config=Config(signature_version=UNSIGNED)
+        )
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def list_access(
+        self, sso_session: str, sso_region: str, max_workers=8, job=None, client=None
+    ) -> list:
+        """
+        List the accounts and roles the cached token of an SSO session can
+        access. The roles of the accounts are listed concurrently.
+        Args:
+            sso_session (str): The sso_session name
+            sso_region (str): The region of the SSO portal
+            max_workers (int): Accounts to list the roles of at once
+            job (Job): The job reporting progress
+            client: The SSO client, created for the region when not given
+        Returns: A list of dicts with account_id, account_name, email and
+            role_name, one per role
+        Raises: RuntimeError when there is no valid cached token
+        """
+        token = self.session_token(sso_session)
+        expires_at = self._expiry(token)
+        if not token or not expires_at or expires_at <= datetime.now(timezone.utc):
+            raise RuntimeError(f"SSO login required for {sso_session}")
+        access_token = token["accessToken"]
+        if client is None:
+            client = self._sso_client(sso_region)
+
+        accounts = []
+        for page in client.get_paginator("list_accounts").paginate(
+            accessToken=access_token
+        ):
+            accounts.extend(page.get("accountList", []))
+        logger.info(f"Found {len(accounts)} accounts for SSO session {sso_session}")
+        if job:
+            job.step("accounts", count=len(accounts))
+
+        def list_roles(account: dict) -> list:
+            roles = []
+            for page in client.get_paginator("list_account_roles").paginate(
+                accessToken=access_token, accountId=account["accountId"]
+            ):
+                roles.extend(page.get("roleList", []))
+            return [
+                {
+                    "account_id": account["accountId"],
+                    "account_name": account.get("accountName", account["accountId"]),
+                    "email": account.get("emailAddress"),
+                    "role_name": role["roleName"],
+                }
+                for role in roles
+            ]
+
+        with ThreadPoolExecutor(max_workers=max(min(max_workers, 32), 1)) as pool:
+            access = [
+                item for items in pool.map(list_roles, accounts) for item in items
+            ]
+        logger.info(f"Found {len(access)} roles for SSO session {sso_session}")
+        if job:
+            job.step("roles", count=len(access))
+        return access
+
+    @staticmethod
+    def profile_name(template: str, **values) -> str:
+        """
+        Build a profile name from a template
+        Args:
+            template (str): A format string, for example
+                "{account_name}-{role_name}"
+            values: The account_id, account_name, role_name and sso_session
+        Returns: The profile name, with characters that are not valid in a
+            profile name replaced by dashes
+        Raises: KeyError when the template uses an unknown field
+        """
+        name = template.format(**values)
+        return re.sub(r"[^A-Za-z0-9_.@+=,-]+", "-", name).strip("-")
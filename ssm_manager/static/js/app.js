@@ -114,6 +114,10 @@ const app = createApp({
     const portForwardingModal = ref(null);
     const portForwardingModalProperties = ref({});
 
+    const tunnelGroups = computed(() => {
+      return preferences.value?.tunnel_groups || [];
+    });
+
     const portMappings = computed(() => {
       const mappings = {};
       if (!preferences.value.instances) {
@@ -161,6 +165,7 @@ const app = createApp({
     const isShellStarting = ref([]);
     const isRdpStarting = ref([]);
     const isPortForwardingStarting = ref(false);
+    const isTunnelGroupStarting = ref(false);
 
     // -----------------------------------------------
     // Navigation
@@ -385,13 +390,17 @@ const app = createApp({
     const connect = async () => {
       isConnecting.value = true;
       try {
-        const data = await apiFetch("/api/connect", {
+        let data = await apiFetch("/api/connect", {
           method: 'POST',
           body: JSON.stringify({
             profile: currentProfile.value,
             region: currentRegion.value
           })
         });
+        if (data.job_id) {
+          toast('Waiting for SSO login, complete it in your browser', 'info');
+          data = await waitForJob(data);
+        }
         currentAccountId.value = data.account_id;
         await getInstances();
         toast('Connected to AWS successfully', 'success');
@@ -408,8 +417,36 @@ const app = createApp({
       toast('Connection terminated successfully', 'warning');
     };
 
+    const disconnectAll = async () => {
+      if (!confirm(`Terminate all ${activeConnectionsCount.value} active connections?`)) {
+        return;
+      }
+      const data = await apiFetch('/api/terminate-connections', {
+        method: 'POST',
+        body: JSON.stringify({ connection_ids: 'all' })
+      });
+      await getActiveConnections();
+      toast(data.message, 'warning');
+    };
+
+    const togglePersistent = async (connection) => {
+      await apiFetch(`/api/connections/${connection.connection_id}/persistent`, {
+        method: 'POST',
+        body: JSON.stringify({ persistent: !connection.persistent })
+      });
+      await getActiveConnections();
+    };
+
+    // Only the changes since the last seen version are fetched
+    let connectionsVersion = 0;
     const getActiveConnections = async () => {
-      activeConnections.value = await apiFetch("/api/active-connections");
+      const data = await apiFetch(`/api/active-connections?since=${connectionsVersion}`);
+      let connections = (data.reset || connectionsVersion === 0) ? [] : [...activeConnections.value];
+      const changed = new Set([...data.removed, ...data.updated.map(c => c.connection_id)]);
+      connections = connections.filter(c => !changed.has(c.connection_id));
+      connections.push(...data.updated, ...data.added);
+      activeConnections.value = connections;
+      connectionsVersion = data.version;
     };
 
     const getInstances = async () => {
@@ -431,7 +468,7 @@ const app = createApp({
     const startShell = async (instanceId, name) => {
       isShellStarting.value.push(instanceId);
       try {
-        await apiFetch(`/api/shell/${instanceId}`, {
+        const data = await apiFetch(`/api/shell/${instanceId}`, {
           method: 'POST',
           body: JSON.stringify({
             profile: currentProfile.value,
@@ -439,6 +476,7 @@ const app = createApp({
             name: name || instanceId
           })
         });
+        await waitForJob(data);
         toast('Successfully started shell', 'success');
       } finally {
         await getActiveConnections();
@@ -449,7 +487,7 @@ const app = createApp({
     const startRdp = async (instanceId, name) => {
       isRdpStarting.value.push(instanceId);
       try {
-        await apiFetch(`/api/rdp/${instanceId}`, {
+        const data = await apiFetch(`/api/rdp/${instanceId}`, {
           method: 'POST',
           body: JSON.stringify({
             profile: currentProfile.value,
@@ -457,6 +495,7 @@ const app = createApp({
             name: name || instanceId
           })
         });
+        await waitForJob(data);
         toast('Successfully started RDP', 'success');
       } finally {
         await getActiveConnections();
@@ -473,7 +512,7 @@ const app = createApp({
         if (mode === 'local') {
           remoteHost = '';
         }
-        const data = await apiFetch(`/api/custom-port/${portForwardingModalProperties.value.instanceId}`, {
+        const accepted = await apiFetch(`/api/custom-port/${portForwardingModalProperties.value.instanceId}`, {
           method: 'POST',
           body: JSON.stringify({
             profile: currentProfile.value,
@@ -485,6 +524,7 @@ const app = createApp({
             username: portForwardingModalProperties.value.username
           })
         });
+        const data = await waitForJob(accepted);
         toast('Successfully started port forwarding', 'success');
 
         if (portForwardingModalProperties.value.username && data.local_port) {
@@ -506,6 +546,33 @@ const app = createApp({
       }
     };
 
+    const startTunnelGroup = async (name) => {
+      isTunnelGroupStarting.value = true;
+      try {
+        const data = await apiFetch(`/api/tunnel-groups/${encodeURIComponent(name)}/start`, {
+          method: 'POST',
+          body: JSON.stringify({})
+        });
+        toast(`Tunnel group ${name}: ${data.message}`, 'success');
+      } finally {
+        await getActiveConnections();
+        isTunnelGroupStarting.value = false;
+      }
+    };
+
+    const saveTunnelGroup = async () => {
+      const name = prompt('Save active port forwards as tunnel group:');
+      if (!name) {
+        return;
+      }
+      const data = await apiFetch('/api/tunnel-groups', {
+        method: 'POST',
+        body: JSON.stringify({ name: name })
+      });
+      await getPreferences();
+      toast(data.message, 'success');
+    };
+
     const addWindowsCredential = async (instanceId, instanceName, username, localPort) => {
       await apiFetch(`/api/config/credential`, {
         method: 'POST',
@@ -925,13 +992,32 @@ const app = createApp({
 
       const response = await fetch(url, options);
       const data = await response.json();
-      if (options.method !== 'GET' && (data.status && data.status !== 'success' && data.status !== 'active')) {
+      if (options.method !== 'GET' && (data.status && data.status !== 'success' && data.status !== 'active' && data.status !== 'accepted')) {
         toast(data.message || 'Unknown error', 'danger');
         throw new Error(data.message || 'Unknown error');
       }
       return data;
     };
 
+    // Wait for an accepted launch job, returns the connection details
+    const waitForJob = async (data, interval = 500) => {
+      if (!data.job_id) {
+        return data;
+      }
+      while (true) {
+        const job = await apiFetch(`/api/jobs/${data.job_id}`);
+        if (job.status === 'succeeded') {
+          return job.result;
+        }
+        if (job.status === 'failed' || job.status === 'cancelled') {
+          const message = job.error || `Job ${job.status}`;
+          toast(message, 'danger');
+          throw new Error(message);
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+      }
+    };
+
     // -----------------------------------------------
     // Lifecycle Hooks
     // -----------------------------------------------
@@ -1000,6 +1086,18 @@ const app = createApp({
       tooltipTriggerList.value = document.querySelectorAll('[data-bs-toggle="tooltip"]');
       tooltipList.value = [...tooltipTriggerList.value].map(tooltipTriggerEl => new bootstrap.Tooltip(tooltipTriggerEl));
 
+      // Subscribe to application events
+      const eventSource = new EventSource('/api/events');
+      eventSource.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.message) {
+          toast(data.message, data.level || 'info');
+        }
+        if (data.connection_id || (data.type === 'job' && data.job.status === 'succeeded')) {
+          getActiveConnections();
+        }
+      };
+
       // Query active connections every 2 seconds
       setInterval(getActiveConnections, 2500);
     });
@@ -1025,14 +1123,15 @@ const app = createApp({
       prefServerPort, prefPortStart, prefPortEnd, prefPortCount, prefLogLevel, prefRegions, prefRegionsCount, prefCredentials, prefCredentialsCount, portMappings, prefPortForwardingMode, prefPortForwardingRemotePort, prefPortForwardingRemoteHost,
       regionsSelected, regionsAll, currentProfile, currentRegion, currentAccountId,
       isWindows, isLinux, isConnecting, isPreferencesSaving, isSessionAdding, isSessionDeleting, isProfileAdding, isProfileDeleting, isHostsAdding, isHostsDeleting,
-      isShellStarting, isRdpStarting, isPortForwardingStarting,
+      isShellStarting, isRdpStarting, isPortForwardingStarting, isTunnelGroupStarting,
+      tunnelGroups, startTunnelGroup, saveTunnelGroup,
       sessions, addSession, deleteSession, sessionsCount, sessionsTableColumns, showAddSessionModal, addSessionModalProperties, addSessionModalValid,
       profiles, addProfile, deleteProfile, profilesCount, profilesTableColumns, showAddProfileModal, addProfileModalProperties, addProfileModalValid,
       hosts, addHost, deleteHost, hostsCount, hostsTableColumns, showAddHostModal, addHostModalProperties,
       addCredential, removeCredential,
       showPortForwardingModal, portForwardingModalProperties,
       showPortMappingsModal, portMappingsModalInstance, portMappingsModalProperties, savePortMappings, addPortMapping, removePortMapping, portMappingsModalDuplicatePort,
-      connect, disconnect, startShell, startRdp, openRdpClient, startPortForwarding,
+      connect, disconnect, disconnectAll, togglePersistent, startShell, startRdp, openRdpClient, startPortForwarding,
       getInstances, getInstanceDetails, instances, instancesCount, instancesDetails, instanceDetailsColumns,
       activeConnections, activeConnectionsCount,
     };
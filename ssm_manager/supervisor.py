@@ -0,0 +1,358 @@
+"""
+Session supervisor
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import logging
+import random
+import threading
+import time
+import psutil
+from ssm_manager.utils import ListeningSockets, kill_process_tree, run_cmd
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """
+    Restarts persistent port forwarding sessions when they drop.
+
+    A session is dropped when its process exits, or when it no longer holds
+    its port `grace` seconds after it started. A dropped session is
+    respawned with the same command, and therefore the same local port,
+    using exponential backoff with jitter. Restarts run as jobs, so a slow
+    restart does not hold up the checks of the other sessions. The
+    supervisor gives up and publishes an alert after `max_restarts` failed
+    attempts.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+
+    def __init__(
+        self,
+        registry,
+        events=None,
+        output=None,
+        ports=None,
+        proxies=None,
+        preferences=None,
+        journal=None,
+        jobs=None,
+        interval=2,
+    ):
+        self.registry = registry
+        self.proxies = proxies
+        self.events = events
+        self.output = output
+        self.ports = ports
+        self.preferences = preferences
+        self.journal = journal
+        self.jobs = jobs
+        self.interval = interval
+        self.grace = 10
+        self.stable_after = 30
+        self._sessions = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def settings(self) -> dict:
+        """
+        Return the restart settings from preferences
+        """
+        defaults = {"max_restarts": 5, "restart_delay": 1, "restart_max_delay": 60}
+        if self.preferences and self.preferences.preferences:
+            return {**defaults, **self.preferences.preferences.get("sessions", {})}
+        return defaults
+
+    def register(self, conn_state, command) -> None:
+        """
+        Register the command of a started session so it can be restarted
+        Args:
+            conn_state (ConnectionState): The state of the started session
+            command (SSMCommand): The command that started the session
+        """
+        with self._lock:
+            self._sessions[conn_state.connection_id] = {
+                "command": command,
+                "pid": conn_state.pid,
+                "local_port": conn_state.local_port,
+                "persistent": bool(conn_state.persistent),
+                "restarts": 0,
+                "downtime": 0.0,
+                "failures": 0,
+                "down_since": None,
+                "up_since": time.time(),
+                "next_attempt": 0.0,
+                "restarting": False,
+            }
+        if conn_state.persistent:
+            self.start()
+
+    def unregister(self, connection_id: str) -> None:
+        """
+        Stop supervising a session
+        """
+        with self._lock:
+            self._sessions.pop(connection_id, None)
+
+    def is_supervised(self, connection_id: str) -> bool:
+        """
+        Return True if a session is restarted when it drops
+        """
+        with self._lock:
+            session = self._sessions.get(connection_id)
+            return bool(session and session["persistent"])
+
+    def set_persistent(self, connection_id: str, persistent: bool) -> bool:
+        """
+        Mark a session as persistent or not
+        Returns: False if the session was not started by this application
+        """
+        with self._lock:
+            session = self._sessions.get(connection_id)
+            if session is None:
+                return False
+            session["persistent"] = bool(persistent)
+        self._update_state(connection_id, persistent=bool(persistent))
+        if persistent:
+            self.start()
+        return True
+
+    def apply(self, conn_state) -> None:
+        """
+        Copy the supervisor properties onto a scanned connection state
+        """
+        with self._lock:
+            session = self._sessions.get(conn_state.connection_id)
+            if session is None:
+                return
+            conn_state.persistent = session["persistent"]
+            conn_state.restarts = session["restarts"]
+            conn_state.downtime = session["downtime"]
+
+    def start(self) -> None:
+        """
+        Start the supervisor thread
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self.run, name="supervisor", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the supervisor thread
+        """
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """
+        Check the supervised sessions until stopped
+        """
+        logger.info("Session supervisor started")
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error supervising sessions: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def check(self) -> None:
+        """
+        Check all persistent sessions and restart the ones that dropped
+        """
+        now = time.time()
+        sockets = ListeningSockets()
+        with self._lock:
+            sessions = [
+                (connection_id, session)
+                for connection_id, session in self._sessions.items()
+                if session["persistent"] and not session["restarting"]
+            ]
+
+        for connection_id, session in sessions:
+            alive, process = self._is_alive(session, sockets, now)
+            dropped = restart = False
+            with self._lock:
+                if self._sessions.get(connection_id) is not session:
+                    continue
+                if alive:
+                    if (
+                        session["failures"]
+                        and now - session["up_since"] > self.stable_after
+                    ):
+                        session["failures"] = 0
+                    continue
+                if session["down_since"] is None:
+                    session["down_since"] = now
+                    session["next_attempt"] = now + self._delay(session["failures"])
+                    dropped = True
+                if now >= session["next_attempt"]:
+                    session["restarting"] = restart = True
+                    session["hung"] = process
+
+            if dropped:
+                logger.warning(f"Persistent connection dropped: {connection_id}")
+                self._update_state(connection_id, status="inactive")
+                self._publish(
+                    "connection_down",
+                    connection_id,
+                    level="warning",
+                    message=f"Connection dropped, reconnecting: {connection_id}",
+                )
+            if restart:
+                self._submit_restart(connection_id, session)
+
+    def _submit_restart(self, connection_id: str, session: dict) -> None:
+        """
+        Restart a dropped session in a job, or right away without jobs
+        """
+        if self.jobs is None:
+            self._restart(connection_id, session)
+            return
+        try:
+            self.jobs.submit(
+                "restart",
+                self._restart,
+                connection_id=connection_id,
+                session=session,
+                meta={"connection_id": connection_id},
+            )
+        except RuntimeError as e:
+            logger.warning(f"Unable to restart connection {connection_id}: {e}")
+            with self._lock:
+                session["restarting"] = False
+
+    def _restart(self, connection_id: str, session: dict, job=None) -> None:
+        """
+        Respawn the command of a dropped session.
+        Failures are only reset once a restarted session stays up, so a
+        session that keeps dropping right after a restart also gives up.
+        """
+        try:
+            with self._lock:
+                give_up = session["failures"] >= int(self.settings["max_restarts"])
+                if not give_up:
+                    session["failures"] += 1
+                command = session["command"]
+                hung = session.pop("hung", None)
+            if give_up:
+                self._give_up(connection_id, session)
+                return
+
+            logger.info(
+                f"Restarting connection {connection_id} on port {command.local_port}"
+            )
+            if hung is not None and hung.is_running():
+                # The process of a hung session may still hold the port
+                kill_process_tree([hung.pid])
+            pid = run_cmd(
+                command,
+                output=self.output,
+                progress=job.progress if job else None,
+                cancelled=job.cancel_event if job else None,
+            )
+            now = time.time()
+            with self._lock:
+                if not pid:
+                    session["next_attempt"] = now + self._delay(session["failures"])
+                    return
+                session["pid"] = pid
+                session["restarts"] += 1
+                session["downtime"] += now - session["down_since"]
+                session["down_since"] = None
+                session["up_since"] = now
+                restarts, downtime = session["restarts"], session["downtime"]
+        finally:
+            with self._lock:
+                session["restarting"] = False
+
+        conn = self._update_state(
+            connection_id,
+            pid=pid,
+            status="active",
+            restarts=restarts,
+            downtime=downtime,
+        )
+        if self.journal:
+            self.journal.record("restarted", conn, connection_id=connection_id)
+        self._publish(
+            "connection_restarted",
+            connection_id,
+            level="success",
+            message=f"Connection restarted: {connection_id}",
+            restarts=restarts,
+        )
+
+    def _give_up(self, connection_id: str, session: dict) -> None:
+        """
+        Stop restarting a session and alert
+        """
+        logger.error(
+            f"Giving up on connection {connection_id} after "
+            f"{session['failures']} attempts"
+        )
+        self.unregister(connection_id)
+        self.registry.remove(connection_id)
+        if self.proxies:
+            self.proxies.stop(connection_id)
+        if self.ports:
+            self.ports.release(session["local_port"])
+        self._publish(
+            "connection_failed",
+            connection_id,
+            level="danger",
+            message=f"Connection could not be restarted: {connection_id}",
+            failures=session["failures"],
+        )
+
+    def _delay(self, failures: int) -> float:
+        """
+        Exponential backoff with jitter
+        """
+        settings = self.settings
+        delay = min(
+            float(settings["restart_max_delay"]),
+            float(settings["restart_delay"]) * 2**failures,
+        )
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _update_state(self, connection_id: str, **properties):
+        """
+        Update the registered state of a connection
+        Returns: The updated ConnectionState or None if not registered
+        """
+        return self.registry.update(connection_id, **properties)
+
+    def _publish(self, event_type: str, connection_id: str, **data) -> None:
+        """
+        Publish a supervisor event
+        """
+        if self.events:
+            self.events.publish(event_type, connection_id=connection_id, **data)
+
+    def _is_alive(self, session: dict, sockets: ListeningSockets, now: float) -> tuple:
+        """
+        Check if the session process is running and, once it had time to
+        bind it, holds its port
+        Returns: True if the session is up, and the process when it is
+            running, a running process of a session that is not up is hung
+        """
+        try:
+            process = psutil.Process(session["pid"])
+            if not process.is_running() or process.status() == psutil.STATUS_ZOMBIE:
+                return False, None
+            port = session["command"].local_port
+            if not port or now - session["up_since"] < self.grace:
+                return True, process
+            return sockets.is_held_by(port, process), process
+        except (psutil.NoSuchProcess, psutil.AccessDenied, TypeError):
+            return False, None
@@ -8,13 +8,14 @@ import base64
 import shlex
 import shutil
 import subprocess
+import threading
 import webbrowser
-from time import sleep
+from time import sleep, time
 from typing import Optional, Literal, Any
 import socket
-from random import randint
 from pydantic import BaseModel, Field, ConfigDict
 import psutil
+from ssm_manager.output import OutputManager
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +78,11 @@ class ConnectionState(BaseModel):
     local_port: int | None = None
     remote_port: int | None = None
     remote_host: str | None = None
+    tunnel_port: int | None = None
+
+    persistent: bool = False
+    restarts: int = 0
+    downtime: float = 0.0
 
     def get(self, key: str, default=None):
         """
@@ -155,15 +161,102 @@ class ConnectionState(BaseModel):
             return False
 
 
+class Tunnel(BaseModel):
+    """
+    Model representing a port forward in a tunnel group.
+    """
+
+    instance_id: str = Field(pattern=r"^i-[0-9a-f]{8,17}$")
+    name: Optional[str] = None
+    profile: str = Field(min_length=1)
+    region: str = Field(pattern=r"^[a-z]{2}-[a-z]+-\d{1}$")
+    mode: str = "local"
+    remote_port: int = Field(ge=1, le=65535)
+    remote_host: Optional[str] = None
+    persistent: bool = False
+
+    @property
+    def target_host(self) -> str | None:
+        """
+        The remote host, None when forwarding to the instance itself.
+        """
+        return self.remote_host if self.mode != "local" else None
+
+    @classmethod
+    def from_connection(cls, conn: "ConnectionState") -> "Tunnel":
+        """
+        Build a tunnel from an active connection. Sessions started without
+        --profile use the default profile.
+        """
+        return cls(
+            instance_id=conn.instance.id,
+            name=conn.name,
+            profile=conn.profile or "default",
+            region=conn.region,
+            mode="other" if conn.remote_host else "local",
+            remote_port=conn.remote_port,
+            remote_host=conn.remote_host,
+            persistent=conn.persistent,
+        )
+
+
 class ConnectionScanner:
     """
-    Class to scan for active connections
+    Class to scan for active connections.
+    Command lines are parsed once per PID, later scans reuse the parsed
+    state until the PID is gone. Connections that are still starting, with
+    a launch in flight or younger than `grace` seconds and never seen
+    healthy, are not removed before their port is bound.
     """
 
-    def __init__(self, cache, interval=1):
-        self.cache = cache
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def __init__(
+        self, registry, interval=1, ports=None, supervisor=None, proxies=None, grace=10
+    ):
+        self.registry = registry
         self.interval = interval
+        self.ports = ports
+        self.supervisor = supervisor
+        self.proxies = proxies
+        self.grace = grace
         self.existing_pids = []
+        self.sockets = None
+        self._parsed = {}
+        self._starting = set()
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def launching(self, connection_id: str) -> None:
+        """
+        Mark a connection as starting until `launched` is called
+        Args:
+            connection_id (str): The connection id
+        """
+        self._starting.add(connection_id)
+
+    def launched(self, connection_id: str) -> None:
+        """
+        Mark the launch of a connection as finished
+        Args:
+            connection_id (str): The connection id
+        """
+        self._starting.discard(connection_id)
+
+    def is_starting(self, conn: ConnectionState) -> bool:
+        """
+        Check if a connection is still starting, its launch is in flight or
+        it was never seen healthy and is younger than the grace period
+        Args:
+            conn (ConnectionState): The connection
+        Returns: True if the connection is still starting
+        """
+        if conn.connection_id in self._starting:
+            return True
+        if conn.connection_id in self._verified:
+            return False
+        return time() - (conn.timestamp or 0) < self.grace
 
     def get_arg(self, cmd: str, name: str, default=None):
         """
@@ -179,6 +272,32 @@ class ConnectionScanner:
         except (ValueError, IndexError):
             return default
 
+    def parse(self, process: psutil.Process) -> tuple:
+        """
+        Parse the command line of a process, once per PID
+        Args:
+            process (psutil.Process): The process
+        Returns: A tuple of the command line and the parsed ConnectionState,
+            None when the process is not an SSM session
+        """
+        create_time = process.create_time()
+        cached = self._parsed.get(process.pid)
+        if cached and cached[0] == create_time:
+            return cached[1], cached[2]
+
+        cmdline = process.cmdline()
+        connection_state = None
+        instance_id = self.get_arg(cmdline, "--target")
+        if instance_id:
+            connection_state = ConnectionState(
+                pid=int(process.pid),
+                instance=Instance(id=instance_id),
+                timestamp=create_time,
+            )
+            connection_state.load(cmdline)
+        self._parsed[process.pid] = (create_time, cmdline, connection_state)
+        return cmdline, connection_state
+
     def verify_pid(self, conn: Connection) -> bool:
         """
         Verify if a process with the given PID is running
@@ -191,85 +310,128 @@ class ConnectionScanner:
         try:
             process = psutil.Process(conn.pid)
             is_active.append(process.is_running())
-            cmdline = process.cmdline()
+            cmdline, _ = self.parse(process)
 
             validate = ["ssm", "start-session", conn.instance.id]
             for item in validate:
                 is_active.append(item in cmdline)
 
             if conn.local_port:
-                is_active.append(socket_is_open(conn.local_port))
+                if self.sockets is None:
+                    self.sockets = ListeningSockets()
+                port = conn.tunnel_port or conn.local_port
+                is_active.append(self.sockets.is_held_by(port, process))
         except (KeyError, psutil.NoSuchProcess, psutil.AccessDenied):
             return False
         return all(is_active)
 
+    def find_active(self, instance_id: str, remote_port: int, remote_host=None):
+        """
+        Find an active and healthy connection to the same target
+        Args:
+            instance_id (str): The instance id
+            remote_port (int): The remote port
+            remote_host (str): The remote host
+        Returns: The ConnectionState or None if not found
+        """
+        with self._lock:
+            self.sockets = ListeningSockets()
+            for conn in self.registry.all():
+                if conn.instance.id != instance_id:
+                    continue
+                if conn.remote_port != remote_port:
+                    continue
+                if (conn.remote_host or None) != (remote_host or None):
+                    continue
+                if conn.status == "active" and self.verify_pid(conn):
+                    self._verified.add(conn.connection_id)
+                    return conn
+        return None
+
     def remove_inactive(self):
         """
-        Remove inactive connections from the cache
+        Remove inactive connections from the registry, connections that are
+        still starting are kept until they are up or the grace period ends
         """
-        active_connections = self.cache.get("active_connections")
-        if not active_connections:
-            return
-
         to_remove = []
-        for conn in active_connections:
+        connections = self.registry.all()
+        for conn in connections:
+            if self.supervisor and self.supervisor.is_supervised(conn.connection_id):
+                # Dropped persistent connections are restarted by the supervisor
+                continue
             try:
-                if not self.verify_pid(conn):
+                if self.verify_pid(conn):
+                    self._verified.add(conn.connection_id)
+                elif not self.is_starting(conn):
                     to_remove.append(conn)
             except Exception as e:  # pylint: disable=broad-except
                 logger.error(f"Error checking connection: {str(e)}")
                 to_remove.append(conn)
 
+        self.registry.remove_many([conn.connection_id for conn in to_remove])
+        # Forget removed and terminated connections
+        self._verified &= {conn.connection_id for conn in connections}
+        self._verified -= {conn.connection_id for conn in to_remove}
         for conn in to_remove:
-            try:
-                self.cache.remove("active_connections", conn)
-            except ValueError:
-                pass
+            if self.supervisor:
+                # Sessions that are not persistent are forgotten once they exit
+                self.supervisor.unregister(conn.connection_id)
+            if self.ports:
+                self.ports.release(conn.local_port)
+            if self.proxies:
+                self.proxies.stop(conn.connection_id)
 
     def get_connections(self):
         """
         Get active connections
         Returns: A generator of ConnectionState objects
         """
-        current_connections = self.cache.get("active_connections")
-        if not current_connections:
-            current_connections = []
-
-        pids = [conn.pid for conn in current_connections]
-        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+        pids = self.registry.pids()
+        seen = set()
+        for proc in psutil.process_iter(["pid", "name"]):
             try:
+                seen.add(proc.info["pid"])
                 if proc.info["pid"] in pids:
                     continue
-                if proc.name().lower() not in ("aws", "aws.exe"):
+                if (proc.info["name"] or "").lower() not in ("aws", "aws.exe"):
                     continue
 
-                cmdline = proc.cmdline()
-                instance_id = self.get_arg(cmdline, "--target")
-                if not instance_id:
-                    continue
-
-                instance = Instance(id=instance_id)
-                connection_state = ConnectionState(
-                    pid=int(proc.info["pid"]),
-                    instance=instance,
-                    timestamp=proc.info["create_time"],
-                )
-                connection_state.load(cmdline)
-                if connection_state in current_connections:
-                    logger.warning(f"Connection already exists: {connection_state}")
+                _, parsed = self.parse(proc)
+                if parsed is None or parsed.connection_id in self.registry:
                     continue
+                connection_state = parsed.model_copy()
+                if self.supervisor:
+                    self.supervisor.apply(connection_state)
+                if self.proxies:
+                    self.proxies.apply(connection_state)
             except Exception as e:  # pylint: disable=broad-except
                 logger.warning(f"Error checking process: {str(e)}")
                 continue
             yield connection_state
 
-    def scan(self):
+        # Forget the command lines of exited processes
+        for pid in set(self._parsed) - seen:
+            del self._parsed[pid]
+
+    def scan(self) -> dict:
         """
         Run the connection scan
-        """
-        self.remove_inactive()
-        for connection in self.get_connections():
-            self.cache.append("active_connections", connection)
+        Returns: The change set of the scan with added, updated and
+            removed connection ids, and the registry version
+        """
+        with self._lock:
+            version = self.registry.version
+            self.sockets = ListeningSockets()
+            self.remove_inactive()
+            for connection in self.get_connections():
+                self.registry.add(connection)
+            changes = self.registry.changes(since=version)
+        return {
+            "version": changes["version"],
+            "added": [conn.connection_id for conn in changes["added"]],
+            "updated": [conn.connection_id for conn in changes["updated"]],
+            "removed": changes["removed"],
+        }
 
 
 class RDPCommand(BaseModel):
@@ -555,52 +717,6 @@ class HostsFileCommand(PSCommand):
         return str(" ".join(cmd))
 
 
-class FreePort(BaseModel):
-    """
-    Class to find a free port
-    """
-
-    name: str
-    remote_port: int
-    remote_host: str | None = None
-    preferences: Any = None
-    start: int = Field(default=60000, ge=1024, le=65535)
-    end: int = Field(default=65535, le=65535)
-
-    @property
-    def local_port(self) -> int | None:
-        """
-        Find a free port in the given range for AWS SSM port forwarding
-        Returns: A free port number or None if no port is found
-        """
-        if self.preferences:
-            self.start, self.end = self.preferences.get_port_range(
-                self.name, self.remote_port, self.remote_host
-            )
-        max_attempts = 20
-
-        used_ports = set()
-        if self.start != self.end:
-            used_ports.update(self.preferences.get_used_ports())
-        for _ in range(max_attempts):
-            port = randint(self.start, self.end)
-
-            if port in used_ports:
-                continue
-
-            used_ports.add(port)
-
-            try:
-                if not socket_is_open(port):
-                    logger.info(f"Found free port: {port}")
-                    return port
-                logger.debug(f"Port {port} is in use")
-            except Exception as e:  # pylint: disable=broad-except
-                logger.error(f"Error checking port {port}: {str(e)}")
-        logger.error(f"No free port found after {max_attempts} attempts")
-        return None
-
-
 def resolve_hostname(hostname: str) -> str | None:
     """
     Resolve a hostname to an IP address
@@ -643,6 +759,91 @@ def socket_is_open(port):
         sock.close()
 
 
+def wait_for_port(port: int, timeout=10, delay=0.25) -> bool:
+    """
+    Wait for a port to be listening
+    Args:
+        port (int): Port number
+        timeout (int): Seconds to wait
+        delay (float): Seconds between checks
+    Returns: True if the port is listening, False on timeout
+    """
+    deadline = time() + timeout
+    sockets = ListeningSockets()
+    while not sockets.is_open(port):
+        if time() >= deadline:
+            return False
+        sleep(delay)
+        sockets.refresh()
+    return True
+
+
+class ListeningSockets:
+    """
+    Snapshot of the listening TCP sockets mapped to their owning PID.
+    Falls back to probing ports when the socket table is not readable.
+    """
+
+    def __init__(self):
+        self.ports = {}
+        self.available = True
+        self.refresh()
+
+    def refresh(self):
+        """
+        Take a new snapshot of the listening sockets
+        """
+        ports = {}
+        try:
+            for conn in psutil.net_connections(kind="tcp"):
+                if conn.status != psutil.CONN_LISTEN or not conn.laddr:
+                    continue
+                if ports.get(conn.laddr.port) is None:
+                    ports[conn.laddr.port] = conn.pid
+            self.available = True
+        except (psutil.AccessDenied, OSError) as e:
+            logger.debug(f"Unable to read socket table, probing ports: {str(e)}")
+            self.available = False
+        self.ports = ports
+
+    def is_open(self, port: int) -> bool:
+        """
+        Check if a port is listening
+        Args:
+            port (int): Port number
+        Returns: True if the port is listening, False otherwise
+        """
+        if not self.available:
+            return socket_is_open(port)
+        return port in self.ports
+
+    def is_owned(self, port: int, pids: set) -> bool:
+        """
+        Check if a port is listening and held by one of the given processes
+        Args:
+            port (int): Port number
+            pids (set): Process IDs allowed to hold the port
+        Returns: True if the port is held by one of the processes
+        """
+        if not self.is_open(port):
+            return False
+        owner = self.ports.get(port)
+        # The owner is unknown when the socket table hides it
+        return owner is None or owner in pids
+
+    def is_held_by(self, port: int, process: psutil.Process) -> bool:
+        """
+        Check if a port is listening and held by a process or its children,
+        sessions bind it in session-manager-plugin, a child of aws
+        Args:
+            port (int): Port number
+            process (psutil.Process): The root of the process tree
+        Returns: True if the port is held by the process tree
+        """
+        pids = {process.pid} | {c.pid for c in process.children(recursive=True)}
+        return self.is_owned(port, pids)
+
+
 def get_pid(executable: str, command: str):
     """
     Get the PID of a process by executable and command
@@ -674,14 +875,54 @@ def open_browser(url: str) -> None:
     webbrowser.open(url)
 
 
-def run_cmd(cmd, skip_pid_wait=False, pid_max_retries=10, pid_retry_delay=2):
+def kill_process_tree(pids: list, timeout=3) -> None:
+    """
+    Terminate processes and their children, killing the ones that do not exit
+    Args:
+        pids (list): Process IDs of the tree roots
+        timeout (int): Seconds to wait before killing
+    """
+    processes = {}
+    for pid in pids:
+        try:
+            process = psutil.Process(pid)
+            for child in [process, *process.children(recursive=True)]:
+                processes[child.pid] = child
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    for process in processes.values():
+        try:
+            process.terminate()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    _, alive = psutil.wait_procs(list(processes.values()), timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+
+
+def run_cmd(
+    cmd,
+    skip_pid_wait=False,
+    pid_max_retries=10,
+    pid_retry_delay=2,
+    output=None,
+    progress=None,
+    cancelled=None,
+):
     """
     Run a shell command and return the pid
     Args:
         cmd (str): The command to run
+        output (OutputManager): Keeps the output of hidden commands
+        progress (callable): Called with the spawned and pid steps
+        cancelled (threading.Event): Stops waiting for the PID when set
     Returns:
         tuple: The process and the PID of the command
     """
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
     # pylint: disable=consider-using-with
     logger.debug(f"Running command: {cmd.cmd}")
 
@@ -693,20 +934,32 @@ def run_cmd(cmd, skip_pid_wait=False, pid_max_retries=10, pid_retry_delay=2):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
+        # Always drain the pipes, a full pipe buffer stalls the process
+        if output is None:
+            output = OutputManager()
+        output.attach(name=getattr(cmd, "reason", cmd), process=process)
     else:
         process = subprocess.Popen(cmd.cmd, shell=True)
+    if progress:
+        progress("spawned", process=process)
 
     pid = None
     if not skip_pid_wait:
         retries = 0
         while not pid and retries < pid_max_retries:
-            sleep(pid_retry_delay)
+            if cancelled is not None and cancelled.wait(pid_retry_delay):
+                logger.info(f"Cancelled waiting for PID: {str(cmd)}")
+                return None
+            if cancelled is None:
+                sleep(pid_retry_delay)
             pid = get_pid(str(cmd.exec), str(cmd))
             retries += 1
 
     if not skip_pid_wait and not pid:
         logger.error(f"Failed to get PID for command: {str(cmd)}")
         return None
+    if progress and pid:
+        progress("pid", pid=pid)
 
     if cmd.wait:
         process.wait(timeout=cmd.timeout)
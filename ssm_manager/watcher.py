@@ -0,0 +1,221 @@
+"""
+File watcher
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import os
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import platform
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+EVENT = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """
+    Calls back when watched files change on disk.
+
+    On Linux the parent directories are watched with inotify, so files
+    replaced by a rename, as editors and the AWS CLI do, are picked up.
+    Elsewhere, or for directories inotify can not watch yet, the mtime and
+    size of the files are polled every `interval` seconds. Changes within
+    `delay` are coalesced into one call of each callback.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    MASK |= IN_CREATE | IN_DELETE
+
+    def __init__(self, interval=2.0, delay=0.2):
+        self.interval = interval
+        self.delay = delay
+        self._callbacks = {}
+        self._signatures = {}
+        self._watches = {}
+        self._pending = {}
+        self._libc = None
+        self._fd = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def backend(self) -> str:
+        """
+        The backend in use, inotify or polling
+        """
+        return "inotify" if self._fd is not None else "polling"
+
+    def watch(self, path, callback) -> None:
+        """
+        Call a callback when a file changes
+        Args:
+            path (str): The file to watch
+            callback (callable): Called without arguments after a change
+        """
+        path = Path(path).absolute()
+        with self._lock:
+            self._callbacks.setdefault(path, []).append(callback)
+            self._signatures[path] = self._signature(path)
+            if self._fd is not None:
+                self._add_watch(path.parent)
+
+    def start(self) -> None:
+        """
+        Start the watcher thread
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            if self._fd is None and platform.system() == "Linux":
+                self._init_inotify()
+            self._thread = threading.Thread(
+                target=self.run, name="watcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the watcher thread
+        """
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """
+        Wait for changes until stopped
+        """
+        logger.info(f"File watcher started using {self.backend}")
+        while not self._stop_event.is_set():
+            timeout = self.delay if self._pending else self.interval
+            try:
+                if self._fd is not None:
+                    readable, _, _ = select.select([self._fd], [], [], timeout)
+                    if readable:
+                        self._read_events()
+                else:
+                    self._stop_event.wait(timeout)
+                self._poll()
+                self._dispatch()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error watching files: {str(e)}")
+                self._stop_event.wait(self.interval)
+
+    def _init_inotify(self) -> None:
+        """
+        Set up inotify, the lock must be held
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available, polling files: {str(e)}")
+            return
+        self._libc = libc
+        self._fd = fd
+        for path in self._callbacks:
+            self._add_watch(path.parent)
+
+    def _add_watch(self, directory: Path) -> bool:
+        """
+        Watch a directory with inotify, the lock must be held
+        Returns: True when the directory is watched
+        """
+        if directory in self._watches.values():
+            return True
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), ctypes.c_uint32(self.MASK)
+        )
+        if wd < 0:
+            # Polled until the directory exists
+            return False
+        self._watches[wd] = directory
+        logger.debug(f"Watching {directory}")
+        return True
+
+    def _read_events(self) -> None:
+        """
+        Read the pending inotify events and mark the watched files changed
+        """
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        now = time.monotonic()
+        with self._lock:
+            while offset + EVENT.size <= len(data):
+                wd, _, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size : offset + EVENT.size + length]
+                offset += EVENT.size + length
+                directory = self._watches.get(wd)
+                if directory is None:
+                    continue
+                path = directory / os.fsdecode(name.rstrip(b"\0"))
+                if path in self._callbacks:
+                    self._pending[path] = now
+
+    def _poll(self) -> None:
+        """
+        Compare the signatures of files not covered by inotify
+        """
+        now = time.monotonic()
+        with self._lock:
+            watched = set(self._watches.values())
+            for path, signature in list(self._signatures.items()):
+                if path.parent in watched:
+                    continue
+                if self._fd is not None and self._add_watch(path.parent):
+                    watched.add(path.parent)
+                current = self._signature(path)
+                if current != signature:
+                    self._signatures[path] = current
+                    self._pending[path] = now
+
+    def _dispatch(self) -> None:
+        """
+        Call the callbacks of files that stopped changing for `delay`
+        """
+        now = time.monotonic()
+        with self._lock:
+            ready = [p for p, t in self._pending.items() if now - t >= self.delay]
+            for path in ready:
+                del self._pending[path]
+                self._signatures[path] = self._signature(path)
+            calls = [(p, c) for p in ready for c in self._callbacks.get(p, [])]
+        for path, callback in calls:
+            logger.debug(f"Detected a change of {path}")
+            try:
+                callback()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error handling a change of {path}: {str(e)}")
+
+    @staticmethod
+    def _signature(path: Path):
+        """
+        Get the mtime and size of a file, or None if it does not exist
+        """
+        try:
+            stat = path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
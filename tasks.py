@@ -6,6 +6,9 @@ import os
 import sys
 import subprocess
 import pathlib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import zipfile
 from invoke import task
@@ -102,10 +105,128 @@ def package(c):
 
 
 @task
-def run(c, api=False):
+def run(c, api=False, startup_profile=False):
     """Runs the application."""
     # pylint: disable=unused-argument
     command = [sys.executable, "main.py"]
     if api:
         command.append("--api")
+    if startup_profile:
+        command.append("--startup-profile")
     subprocess.run(command, check=True)
+
+
+@task
+def benchmark_cache(c, threads=8, operations=200):
+    """Benchmarks the cache backends with concurrent appends and reads.
+
+    Every thread uses its own Cache instance, as the tray and --api
+    processes do, appends `operations` members to one shared list and reads
+    it back after each append. Lost updates are members missing at the end.
+    """
+    # pylint: disable=unused-argument, import-outside-toplevel
+    from ssm_manager.cache import Cache
+
+    for backend in Cache.BACKENDS:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = Cache(cache_dir=cache_dir, backend=backend)
+            cache.set("benchmark", [])
+
+            def worker(thread, cache_dir=cache_dir, backend=backend):
+                cache = Cache(cache_dir=cache_dir, backend=backend)
+                for i in range(operations):
+                    cache.append("benchmark", f"{thread}-{i}")
+                    cache.get("benchmark")
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(worker, range(threads)))
+            elapsed = time.perf_counter() - start
+            total = threads * operations
+            lost = total - len(cache.get("benchmark") or [])
+            print(
+                f"{backend:<12} {total} appends in {elapsed:.2f}s "
+                f"({total * 2 / elapsed:,.0f} ops/s), lost updates: {lost}"
+            )
+
+
+@task
+def benchmark_ports(c, mappings=5000, lookups=10000):
+    """Benchmarks port mapping lookups against a linear scan.
+
+    Builds preferences with `mappings` port mappings over instances of ten
+    mappings each and looks up random mappings and the reserved ports.
+    """
+    # pylint: disable=unused-argument, import-outside-toplevel, too-many-locals
+    import random
+    from ssm_manager.preferences import PreferencesHandler
+
+    def linear(prefs, name, remote_port, remote_host=None):
+        for instance in prefs.get("instances", []):
+            if instance.get("name") != name:
+                continue
+            for port in instance.get("ports", []):
+                if int(port.get("remote_port")) != remote_port:
+                    continue
+                if remote_host and port.get("remote_host") != remote_host:
+                    continue
+                return int(port.get("local_port"))
+        return None
+
+    instances = [
+        {
+            "name": f"instance-{i}",
+            "ports": [
+                {
+                    "remote_port": 1000 + j,
+                    "local_port": 10000 + i * 10 + j,
+                    "remote_host": f"db-{j}.internal",
+                }
+                for j in range(10)
+            ],
+        }
+        for i in range(mappings // 10)
+    ]
+    queries = [
+        (f"instance-{random.randrange(len(instances))}", 1000 + random.randrange(10))
+        for _ in range(lookups)
+    ]
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        preferences = PreferencesHandler(os.path.join(config_dir, "preferences.json"))
+        start = time.perf_counter()
+        preferences.save_preferences({"instances": instances})
+        rebuild = time.perf_counter() - start
+        prefs = preferences.preferences
+
+        for label, lookup in (
+            ("linear", lambda q: linear(prefs, *q)),
+            ("indexed", lambda q: preferences.get_instance_properties(*q)),
+        ):
+            start = time.perf_counter()
+            for query in queries:
+                lookup(query)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<8} {lookups} lookups over {mappings} mappings in "
+                f"{elapsed * 1000:.1f} ms ({elapsed / lookups * 1e6:.2f} us/lookup)"
+            )
+
+        start = time.perf_counter()
+        for _ in range(100):
+            frozenset(
+                int(port["local_port"])
+                for instance in prefs["instances"]
+                for port in instance["ports"]
+            )
+        scan = (time.perf_counter() - start) / 100
+        start = time.perf_counter()
+        for _ in range(100):
+            preferences.get_reserved_ports()
+        indexed = (time.perf_counter() - start) / 100
+        print(
+            f"reserved ports: linear {scan * 1e6:.1f} us, "
+            f"indexed {indexed * 1e6:.2f} us"
+        )
+        print(f"index rebuild on save: {rebuild * 1000:.1f} ms")
+        preferences.flush()
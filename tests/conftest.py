@@ -0,0 +1,74 @@
+"""
+Shared fixtures, the package paths are derived from the home directory on
+import, so it is pointed at a temporary directory first.
+"""
+
+# pylint: disable=redefined-outer-name
+import os
+import tempfile
+
+os.environ["HOME"] = os.environ["USERPROFILE"] = tempfile.mkdtemp(
+    prefix="ssm_manager_tests_"
+)
+
+# pylint: disable=wrong-import-position
+import pytest
+from botocore import UNSIGNED
+from botocore.config import Config
+from botocore.session import get_session
+from botocore.stub import Stubber
+from ssm_manager.config import AwsConfigManager
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """
+    A temporary home directory with an AWS config file
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir()
+    (aws_dir / "config").write_text(
+        "[sso-session corp]\n"
+        "sso_start_url = https://corp.awsapps.com/start\n"
+        "sso_region = eu-west-1\n"
+        "\n"
+        "[profile existing]\n"
+        "region = eu-west-1\n",
+        encoding="utf-8",
+    )
+    return tmp_path
+
+
+@pytest.fixture
+def aws_config(home):
+    """
+    An AWS config file manager for the temporary home directory
+    """
+    manager = AwsConfigManager()
+    assert manager.config_path == home / ".aws" / "config"
+    return manager
+
+
+@pytest.fixture
+def sso_client():
+    """
+    Create unsigned SSO clients with a Stubber, the stubs are checked to be
+    used up when the test ends
+    """
+    stubbers = []
+
+    def create():
+        client = get_session().create_client(
+            "sso", region_name="eu-west-1", config=Config(signature_version=UNSIGNED)
+        )
+        stubber = Stubber(client)
+        stubber.activate()
+        stubbers.append(stubber)
+        return client, stubber
+
+    yield create
+    for stubber in stubbers:
+        stubber.assert_no_pending_responses()
+        stubber.deactivate()
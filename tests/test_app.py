@@ -0,0 +1,140 @@
+"""
+Tests for generating the profiles of an SSO session and launching sessions.
+"""
+
+# pylint: disable=redefined-outer-name
+from unittest import mock
+import pytest
+from ssm_manager import app as app_module
+from ssm_manager.utils import AWSProfile, Instance
+
+ACCESS = [
+    {
+        "account_id": "111111111111",
+        "account_name": "dev",
+        "email": "dev@example.com",
+        "role_name": "Admin",
+    },
+    {
+        "account_id": "222222222222",
+        "account_name": "dev",
+        "email": "dev2@example.com",
+        "role_name": "Admin",
+    },
+    {
+        "account_id": "333333333333",
+        "account_name": "existing",
+        "email": "existing@example.com",
+        "role_name": "",
+    },
+    {
+        "account_id": "444444444444",
+        "account_name": "prod",
+        "email": "prod@example.com",
+        "role_name": "ReadOnly",
+    },
+]
+SSO_SESSION = {"name": "corp", "sso_region": "eu-west-1"}
+
+
+@pytest.fixture
+def generate(aws_config, monkeypatch):
+    """
+    Generate profiles against the temporary AWS config file, the SSO
+    session can access the accounts and roles of ACCESS
+    """
+    calls = []
+    monkeypatch.setattr(app_module, "aws_config", aws_config)
+    monkeypatch.setattr(
+        app_module.sso_manager, "list_access", lambda *args, **kwargs: ACCESS
+    )
+    add_profiles = aws_config.add_profiles
+
+    def counted(profiles):
+        calls.append(profiles)
+        return add_profiles(profiles)
+
+    monkeypatch.setattr(aws_config, "add_profiles", counted)
+
+    def run(**kwargs):
+        result = app_module.generate_profiles(
+            SSO_SESSION, "{account_name}-{role_name}", "us-east-1", **kwargs
+        )
+        return result, calls
+
+    return run
+
+
+def test_generate_profiles_skips_duplicates_and_existing(generate, aws_config):
+    """
+    Duplicate names and existing profiles are skipped, the rest written at once
+    """
+    result, calls = generate()
+
+    assert result["added"] == ["dev-Admin", "prod-ReadOnly"]
+    assert [(s["name"], s["reason"]) for s in result["skipped"]] == [
+        ("dev-Admin", "duplicate"),
+        ("existing", "exists"),
+    ]
+    assert result["skipped"][0]["account_id"] == "222222222222"
+    assert len(calls) == 1
+    assert aws_config.read_value("profile dev-Admin", "sso_account_id") == (
+        "111111111111"
+    )
+    assert aws_config.read_value("profile dev-Admin", "region") == "us-east-1"
+    assert aws_config.read_value("profile existing", "region") == "eu-west-1"
+    assert aws_config.read_value("profile existing", "sso_session") is None
+
+
+def test_generate_profiles_overwrites_existing(generate, aws_config):
+    """
+    Existing profiles are replaced when overwriting
+    """
+    result, calls = generate(overwrite=True)
+
+    assert result["added"] == ["dev-Admin", "existing", "prod-ReadOnly"]
+    assert [s["reason"] for s in result["skipped"]] == ["duplicate"]
+    assert len(calls) == 1
+    assert aws_config.read_value("profile existing", "sso_account_id") == (
+        "333333333333"
+    )
+
+
+def test_generate_profiles_requires_region(aws_config, monkeypatch):
+    """
+    A session without an sso_region requires the region in the request
+    """
+    monkeypatch.setattr(app_module, "aws_config", aws_config)
+    with aws_config.transaction() as config:
+        config.add_section("sso-session noregion")
+        config.set("sso-session noregion", "sso_start_url", "https://x/start")
+
+    response = app_module.app.test_client().post(
+        "/api/config/profiles/generate", json={"sso_session": "noregion"}
+    )
+
+    assert response.status_code == 400
+    assert "region" in response.get_json()["message"]
+
+
+def test_launched_port_forward_found_before_scan(monkeypatch):
+    """
+    A repeated request finds a launched session before the scanner saw it
+    """
+    monkeypatch.setattr(app_module, "run_cmd", lambda *args, **kwargs: 4242)
+    monkeypatch.setattr(app_module, "proxies", mock.Mock(enabled=False))
+    monkeypatch.setattr(app_module, "supervisor", mock.Mock())
+    monkeypatch.setattr(app_module.scanner, "verify_pid", lambda conn: True)
+    instance = Instance(id="i-0123456789abcdef0", name="web")
+
+    conn = app_module.launch_port_forward(
+        AWSProfile(name="dev", region="eu-west-1"),
+        instance,
+        local_port=60001,
+        remote_port=443,
+    )
+
+    try:
+        assert app_module.scanner.find_active(instance.id, 443) == conn
+    finally:
+        app_module.registry.remove(conn.connection_id)
@@ -0,0 +1,93 @@
+"""
+Tests for writing profiles to the AWS config file.
+"""
+
+import configparser
+
+
+def read_config(aws_config) -> configparser.ConfigParser:
+    """
+    Parse the AWS config file as written
+    """
+    config = configparser.ConfigParser()
+    config.read(aws_config.config_path)
+    return config
+
+
+def count_transactions(aws_config, monkeypatch) -> list:
+    """
+    Record every transaction of the config file manager
+    """
+    calls = []
+    transaction = aws_config.transaction
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return transaction(*args, **kwargs)
+
+    monkeypatch.setattr(aws_config, "transaction", counted)
+    return calls
+
+
+def test_add_profiles_single_transaction(aws_config, monkeypatch):
+    """
+    All profiles are written in a single transaction
+    """
+    transactions = count_transactions(aws_config, monkeypatch)
+    profiles = [
+        {
+            "name": f"dev-{role}",
+            "region": "eu-west-1",
+            "output": "json",
+            "sso_session": "corp",
+            "sso_account_id": "111111111111",
+            "sso_role_name": role,
+        }
+        for role in ("Admin", "ReadOnly", "Billing")
+    ]
+
+    added = aws_config.add_profiles(profiles)
+
+    assert added == ["dev-Admin", "dev-ReadOnly", "dev-Billing"]
+    assert len(transactions) == 1
+    config = read_config(aws_config)
+    assert config.has_section("profile existing")
+    assert config.has_section("sso-session corp")
+    for profile in profiles:
+        section = config[f"profile {profile['name']}"]
+        assert section["sso_role_name"] == profile["sso_role_name"]
+        assert section["sso_account_id"] == "111111111111"
+    assert {p.name for p in aws_config.config_path.parent.iterdir()} == {
+        "config",
+        ".config.lock",
+    }
+
+
+def test_add_profiles_skips_unrecognised(aws_config):
+    """
+    Profiles without a name or recognised properties are skipped
+    """
+    added = aws_config.add_profiles(
+        [
+            {"name": "unknown", "foo": "bar"},
+            {"region": "eu-west-1"},
+            {"name": "partial", "region": "us-east-1", "sso_session": None},
+        ]
+    )
+
+    assert added == ["partial"]
+    config = read_config(aws_config)
+    assert not config.has_section("profile unknown")
+    assert dict(config["profile partial"]) == {"region": "us-east-1"}
+
+
+def test_add_profiles_unchanged_file_not_rewritten(aws_config):
+    """
+    The config file is only replaced when it changed
+    """
+    aws_config.add_profiles([{"name": "dev", "region": "eu-west-1"}])
+    mtime = aws_config.config_path.stat().st_mtime_ns
+
+    aws_config.add_profiles([{"name": "dev", "region": "eu-west-1"}])
+
+    assert aws_config.config_path.stat().st_mtime_ns == mtime
@@ -0,0 +1,83 @@
+"""
+Tests for leasing local ports.
+"""
+
+# pylint: disable=redefined-outer-name
+import threading
+import pytest
+from ssm_manager.ports import PortAllocator
+
+
+class Preferences:
+    """
+    Preferences with a port range and a preferred port for every tunnel
+    """
+
+    # pylint: disable=too-few-public-methods, unused-argument
+
+    def __init__(self, preferred=None):
+        self.preferences = {"port_range": {"start": 60000, "end": 60010}}
+        self.preferred = preferred
+
+    def get_instance_properties(self, name, remote_port, remote_host=None):
+        """
+        Get the preferred local port of a tunnel
+        """
+        return self.preferred
+
+    def get_reserved_ports(self):
+        """
+        Get the preferred local ports
+        """
+        return frozenset([self.preferred]) if self.preferred else frozenset()
+
+
+@pytest.fixture
+def listening(monkeypatch):
+    """
+    No port is listening
+    """
+    monkeypatch.setattr(
+        "ssm_manager.ports.ListeningSockets.is_open", lambda self, port: False
+    )
+
+
+@pytest.mark.usefixtures("listening")
+@pytest.mark.parametrize("preferred", [60005, 59123])
+def test_preferred_port_leased_once(preferred):
+    """
+    Concurrent requests for the same preferred port, inside or outside the
+    range, lease it only once
+    """
+    allocator = PortAllocator(preferences=Preferences(preferred))
+    barrier = threading.Barrier(8)
+    ports = []
+
+    def allocate():
+        barrier.wait()
+        ports.append(allocator.allocate("web", 443))
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ports.count(preferred) == 1
+    assert ports.count(None) == 7
+
+
+@pytest.mark.usefixtures("listening")
+def test_preferred_port_outside_range_in_use():
+    """
+    A confirmed preferred port outside the range stays in use until released
+    """
+    allocator = PortAllocator(preferences=Preferences(59123))
+    assert allocator.allocate("web", 443) == 59123
+    allocator.confirm(59123)
+    assert allocator.allocate("web", 443) is None
+
+    allocator.release(59123)
+
+    assert allocator.allocate("web", 443) == 59123
+    assert allocator.stats["leased"] == 0
@@ -0,0 +1,91 @@
+"""
+Tests for removing inactive connections from the registry.
+"""
+
+# pylint: disable=redefined-outer-name
+import time
+from unittest import mock
+import pytest
+from ssm_manager.registry import ConnectionRegistry
+from ssm_manager.utils import ConnectionScanner, ConnectionState, Instance
+
+
+@pytest.fixture
+def scanner():
+    """
+    A scanner over an empty registry, the ports and proxies are mocks
+    """
+    supervisor = mock.Mock()
+    supervisor.is_supervised.return_value = False
+    return ConnectionScanner(
+        ConnectionRegistry(),
+        ports=mock.Mock(),
+        proxies=mock.Mock(),
+        supervisor=supervisor,
+        grace=10,
+    )
+
+
+def add_connection(scanner, age: float, connection_id="port_i-0123456789abcdef0"):
+    """
+    Register a port forwarding connection started `age` seconds ago
+    """
+    conn = ConnectionState(
+        connection_id=connection_id,
+        instance=Instance(id="i-0123456789abcdef0"),
+        pid=2**22 + 1,
+        timestamp=time.time() - age,
+        status="active",
+        local_port=60001,
+        tunnel_port=60101,
+    )
+    scanner.registry.add(conn)
+    return conn
+
+
+def test_remove_inactive_keeps_starting_connection(scanner):
+    """
+    A connection younger than the grace period is kept until its port is up
+    """
+    add_connection(scanner, age=1)
+
+    scanner.remove_inactive()
+
+    assert len(scanner.registry) == 1
+    scanner.proxies.stop.assert_not_called()
+    scanner.ports.release.assert_not_called()
+    scanner.supervisor.unregister.assert_not_called()
+
+
+def test_remove_inactive_keeps_launch_in_flight(scanner):
+    """
+    A connection whose launch is in flight is kept past the grace period
+    """
+    conn = add_connection(scanner, age=60)
+    scanner.launching(conn.connection_id)
+
+    scanner.remove_inactive()
+    assert len(scanner.registry) == 1
+
+    scanner.launched(conn.connection_id)
+    scanner.remove_inactive()
+    assert len(scanner.registry) == 0
+    scanner.proxies.stop.assert_called_once_with(conn.connection_id)
+    scanner.ports.release.assert_called_once_with(conn.local_port)
+    scanner.supervisor.unregister.assert_called_once_with(conn.connection_id)
+
+
+def test_remove_inactive_removes_dropped_connection(scanner, monkeypatch):
+    """
+    A connection seen healthy is removed as soon as it drops
+    """
+    conn = add_connection(scanner, age=1)
+    monkeypatch.setattr(scanner, "verify_pid", lambda conn: True)
+    scanner.remove_inactive()
+    assert len(scanner.registry) == 1
+
+    monkeypatch.setattr(scanner, "verify_pid", lambda conn: False)
+    scanner.remove_inactive()
+
+    assert len(scanner.registry) == 0
+    scanner.proxies.stop.assert_called_once_with(conn.connection_id)
@@ -0,0 +1,199 @@
+"""
+Tests for listing the accounts and roles of an SSO session.
+"""
+
+# pylint: disable=redefined-outer-name
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+from ssm_manager.sso import SSOManager
+
+TOKEN = "token"
+
+
+@pytest.fixture
+def sso(tmp_path, monkeypatch):
+    """
+    An SSO manager with a valid cached token for every session
+    """
+    manager = SSOManager(system="Linux", cache_dir=tmp_path)
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    monkeypatch.setattr(
+        manager,
+        "session_token",
+        lambda key: {"accessToken": TOKEN, "expiresAt": expires_at.isoformat()},
+    )
+    return manager
+
+
+def account(account_id: str, name: str) -> dict:
+    """
+    An account of a list_accounts response
+    """
+    return {
+        "accountId": account_id,
+        "accountName": name,
+        "emailAddress": f"{name}@example.com",
+    }
+
+
+def add_roles(stubber, account_id: str, *pages: list[str]):
+    """
+    Stub the list_account_roles pages of an account
+    """
+    for index, roles in enumerate(pages):
+        response = {
+            "roleList": [{"roleName": r, "accountId": account_id} for r in roles]
+        }
+        params = {"accessToken": TOKEN, "accountId": account_id}
+        if index < len(pages) - 1:
+            response["nextToken"] = f"{account_id}-{index + 1}"
+        if index:
+            params["nextToken"] = f"{account_id}-{index}"
+        stubber.add_response("list_account_roles", response, params)
+
+
+class RoleClients:
+    """
+    Send the list_account_roles calls of each account to its own stubbed
+    client, so the stubs of concurrent calls can't be consumed out of order.
+    The calls wait on a barrier, which breaks unless they run at once.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, accounts_client, role_clients: dict):
+        self.accounts_client = accounts_client
+        self.role_clients = role_clients
+        self.barrier = threading.Barrier(len(role_clients), timeout=5)
+
+    def get_paginator(self, operation: str):
+        """
+        Get the paginator of the client of the operation
+        """
+        if operation == "list_accounts":
+            return self.accounts_client.get_paginator(operation)
+        return self
+
+    def paginate(self, **kwargs):
+        """
+        Paginate the roles of an account with the client of the account
+        """
+        self.barrier.wait()
+        client = self.role_clients[kwargs["accountId"]]
+        return client.get_paginator("list_account_roles").paginate(**kwargs)
+
+
+def test_list_access_paginates(sso, sso_client):
+    """
+    The accounts and the roles of an account are read from every page
+    """
+    client, stubber = sso_client()
+    stubber.add_response(
+        "list_accounts",
+        {"accountList": [account("111111111111", "dev")], "nextToken": "page-2"},
+        {"accessToken": TOKEN},
+    )
+    stubber.add_response(
+        "list_accounts",
+        {"accountList": [account("222222222222", "prod")]},
+        {"accessToken": TOKEN, "nextToken": "page-2"},
+    )
+    add_roles(stubber, "111111111111", ["Admin"], ["ReadOnly"])
+    add_roles(stubber, "222222222222", ["ReadOnly"])
+
+    access = sso.list_access("corp", "eu-west-1", max_workers=1, client=client)
+
+    assert access == [
+        {
+            "account_id": "111111111111",
+            "account_name": "dev",
+            "email": "dev@example.com",
+            "role_name": "Admin",
+        },
+        {
+            "account_id": "111111111111",
+            "account_name": "dev",
+            "email": "dev@example.com",
+            "role_name": "ReadOnly",
+        },
+        {
+            "account_id": "222222222222",
+            "account_name": "prod",
+            "email": "prod@example.com",
+            "role_name": "ReadOnly",
+        },
+    ]
+
+
+def test_list_access_lists_roles_concurrently(sso, sso_client):
+    """
+    The roles of the accounts are listed at once, in the order of the accounts
+    """
+    accounts_client, accounts_stubber = sso_client()
+    ids = ["111111111111", "222222222222", "333333333333"]
+    accounts_stubber.add_response(
+        "list_accounts",
+        {"accountList": [account(i, f"account-{n}") for n, i in enumerate(ids)]},
+        {"accessToken": TOKEN},
+    )
+    role_clients = {}
+    for account_id in ids:
+        role_clients[account_id], stubber = sso_client()
+        add_roles(stubber, account_id, ["Admin"], [f"Role-{account_id}"])
+    client = RoleClients(accounts_client, role_clients)
+
+    access = sso.list_access("corp", "eu-west-1", max_workers=8, client=client)
+
+    assert [(a["account_id"], a["role_name"]) for a in access] == [
+        (i, role) for i in ids for role in ("Admin", f"Role-{i}")
+    ]
+    assert not client.barrier.broken
+
+
+def test_list_access_requires_valid_token(sso, monkeypatch):
+    """
+    An expired token requires a login before any request
+    """
+    expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+    monkeypatch.setattr(
+        sso,
+        "session_token",
+        lambda key: {"accessToken": TOKEN, "expiresAt": expired.isoformat()},
+    )
+    with pytest.raises(RuntimeError, match="SSO login required for corp"):
+        sso.list_access("corp", "eu-west-1", client=object())
+
+
+@pytest.mark.parametrize(
+    "template, expected",
+    [
+        ("{account_name}-{role_name}", "My-Account-AdministratorAccess"),
+        (
+            "{sso_session}/{account_id}:{role_name}",
+            "corp-111111111111-AdministratorAccess",
+        ),
+        ("  {role_name}  ", "AdministratorAccess"),
+    ],
+)
+def test_profile_name(template, expected):
+    """
+    Characters not valid in a profile name are replaced by dashes
+    """
+    name = SSOManager.profile_name(
+        template,
+        sso_session="corp",
+        account_id="111111111111",
+        account_name="My Account",
+        email="me@example.com",
+        role_name="AdministratorAccess",
+    )
+    assert name == expected
+
+
+def test_profile_name_unknown_field():
+    """
+    A template with an unknown field is rejected
+    """
+    with pytest.raises(KeyError):
+        SSOManager.profile_name("{account}", account_id="111111111111")
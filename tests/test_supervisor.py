@@ -0,0 +1,95 @@
+"""
+Tests for restarting persistent sessions.
+"""
+
+# pylint: disable=redefined-outer-name
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+from ssm_manager.registry import ConnectionRegistry
+from ssm_manager.supervisor import Supervisor
+from ssm_manager.utils import ConnectionState, Instance, ListeningSockets
+
+# ssm_manager.supervisor is the shared Supervisor, not the module
+supervisor_module = sys.modules[Supervisor.__module__]
+CONNECTION_ID = "port_i-0123456789abcdef0"
+
+
+@pytest.fixture
+def session_process():
+    """
+    A running process standing in for a session that never binds its port
+    """
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-c", "import time; time.sleep(60)"]
+    )
+    yield process
+    process.kill()
+    process.wait()
+
+
+@pytest.fixture
+def supervisor(session_process, monkeypatch):
+    """
+    A supervisor of a persistent session started a minute ago, restarts are
+    submitted to a mock job manager
+    """
+    monkeypatch.setattr(ListeningSockets, "is_open", lambda self, port: False)
+    conn = ConnectionState(
+        connection_id=CONNECTION_ID,
+        instance=Instance(id="i-0123456789abcdef0"),
+        pid=session_process.pid,
+        timestamp=time.time() - 60,
+        status="active",
+        local_port=60001,
+        persistent=True,
+    )
+    registry = ConnectionRegistry()
+    registry.add(conn)
+    manager = Supervisor(registry, jobs=mock.Mock())
+    monkeypatch.setattr(manager, "start", lambda: None)
+    monkeypatch.setattr(manager, "_delay", lambda failures: 0)
+    manager.register(conn, SimpleNamespace(local_port=60001))
+    # pylint: disable-next=protected-access
+    manager._sessions[CONNECTION_ID]["up_since"] -= 60
+    return manager
+
+
+def test_check_submits_restart_of_hung_session(supervisor):
+    """
+    A running session that does not hold its port is restarted in a job,
+    and only once while the restart is in flight
+    """
+    supervisor.check()
+    supervisor.check()
+
+    supervisor.jobs.submit.assert_called_once()
+    kwargs = supervisor.jobs.submit.call_args.kwargs
+    assert kwargs["connection_id"] == CONNECTION_ID
+    assert supervisor.registry.get(CONNECTION_ID).status == "inactive"
+
+
+def test_restart_kills_hung_session(supervisor, session_process, monkeypatch):
+    """
+    The restart job kills the hung process before respawning the command
+    """
+    # The respawned session is this process, it has not bound the port yet
+    run_cmd = mock.Mock(return_value=os.getpid())
+    monkeypatch.setattr(supervisor_module, "run_cmd", run_cmd)
+    supervisor.check()
+    kwargs = supervisor.jobs.submit.call_args.kwargs
+
+    supervisor._restart(  # pylint: disable=protected-access
+        kwargs["connection_id"], kwargs["session"]
+    )
+
+    assert session_process.wait(timeout=5) is not None
+    run_cmd.assert_called_once()
+    conn = supervisor.registry.get(CONNECTION_ID)
+    assert (conn.pid, conn.status, conn.restarts) == (os.getpid(), "active", 1)
+    supervisor.check()
+    assert supervisor.jobs.submit.call_count == 1